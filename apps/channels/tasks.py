@@ -14,6 +14,7 @@ from django.utils.text import slugify
 from apps.channels.models import Channel
 from apps.epg.models import EPGData
 from core.models import CoreSettings
+from apps.proxy.ts_proxy.cluster import local_node_url
 
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
@@ -226,7 +227,9 @@ def run_recording(channel_id, start_time_str, end_time_str):
     )
 
     logger.info(f"Starting recording for channel {channel.name}")
-    with requests.get(f"http://localhost:5656/proxy/ts/stream/{channel.uuid}", headers={
+    # Record through this node's own proxy - in cluster mode it may not be reachable as localhost:5656
+    node_url = local_node_url() or "http://localhost:5656"
+    with requests.get(f"{node_url}/proxy/ts/stream/{channel.uuid}", headers={
         'User-Agent': 'Dispatcharr-DVR',
     }, stream=True) as response:
         # Raise an exception for bad responses (4xx, 5xx)
@@ -3,12 +3,14 @@
 class BaseConfig:
     DEFAULT_USER_AGENT = 'VLC/3.0.20 LibVLC/3.0.20' # Will only be used if connection to settings fail
     CHUNK_SIZE = 8192
+    UPSTREAM_READ_SIZE = 188 * 700  # ~128KB read from upstream at a time into a reused buffer
+    LAST_DATA_UPDATE_INTERVAL = 1.0  # Seconds between updates of a channel's last data time in Redis
     CLIENT_POLL_INTERVAL = 0.1
     MAX_RETRIES = 3
     RETRY_WAIT_INTERVAL = 0.5  # seconds to wait between retries
     CONNECTION_TIMEOUT = 10  # seconds to wait for initial connection
     MAX_STREAM_SWITCHES = 10  # Maximum number of stream switch attempts before giving up
-    BUFFER_CHUNK_SIZE = 188 * 1361  # ~256KB
+    BUFFER_CHUNK_SIZE = 188 * 1361  # ~256KB - rounded down to a multiple of 188 by the TS proxy
     # Redis settings
     REDIS_CHUNK_TTL = 60  # Number in seconds - Chunks expire after 1 minute
 
@@ -30,9 +32,32 @@ class TSConfig(BaseConfig):
 
     # Buffer settings
     INITIAL_BEHIND_CHUNKS = 4  # How many chunks behind to start a client (4 chunks = ~1MB)
+    KEYFRAME_JOIN_ENABLED = True      # Start new clients on a PAT/PMT + keyframe boundary
+    KEYFRAME_JOIN_MAX_BACK_CHUNKS = 8 # How much further back than INITIAL_BEHIND_CHUNKS a join may start
     CHUNK_BATCH_SIZE = 5       # How many chunks to fetch in one batch
     KEEPALIVE_INTERVAL = 0.5   # Seconds between keepalive packets when at buffer head
 
+    # Buffer backend: 'keys' stores one Redis key per chunk, 'stream' uses a per-channel
+    # Redis Stream that clients read with XREAD BLOCK instead of polling
+    BUFFER_BACKEND = 'keys'
+    BUFFER_STREAM_MAXLEN = 128        # Approximate number of chunks kept in the stream (~32MB)
+    BUFFER_STREAM_BLOCK_MS = 1000     # How long a client read waits for a new chunk
+    BUFFER_STREAM_READ_THREADS = 64   # Threads for blocking reads when sockets aren't gevent-patched
+
+    # Per-worker LRU of recent chunks shared by all local clients (0 disables)
+    CHUNK_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+    # Fan-out: one reader greenlet per channel per worker feeds queues for local clients
+    FANOUT_ENABLED = True
+    FANOUT_CLIENT_QUEUE_CHUNKS = 32             # Max chunks queued per client (~8MB)
+    FANOUT_SLOW_CLIENT_POLICY = 'drop_to_live'  # 'drop_to_live' or 'disconnect' when a client's queue is full
+    FANOUT_POLL_INTERVAL = 0.05                 # Seconds between buffer reads at the live edge
+
+    # Shared-memory buffer tier (same-host workers read chunks without going through Redis)
+    SHM_BUFFER_ENABLED = True               # Mirror buffer chunks into a per-channel memory-mapped ring
+    SHM_BUFFER_DIR = '/dev/shm/dispatcharr'  # Directory for ring files (should be a tmpfs)
+    SHM_BUFFER_SLOTS = 16                   # Chunks kept per channel ring (16 x ~256KB = ~4MB)
+
     # Streaming settings
     TARGET_BITRATE = 8000000   # Target bitrate (8 Mbps)
     STREAM_TIMEOUT = 20        # Disconnect after this many seconds of no data
@@ -42,11 +67,81 @@ class TSConfig(BaseConfig):
     CLEANUP_INTERVAL = 60  # Check for inactive channels every 60 seconds
     CHANNEL_SHUTDOWN_DELAY = 0  # How long to wait after last client before shutdown (seconds)
 
+    # Owner failover: the owner refreshes a short-lived heartbeat from a dedicated loop and
+    # a worker with clients on the channel takes it over once the heartbeat has expired
+    OWNER_FAILOVER_ENABLED = True
+    OWNER_HEARTBEAT_INTERVAL = 1  # Seconds between lease and heartbeat refreshes
+    OWNER_HEARTBEAT_TTL = 5       # Seconds - raised to at least 4 x OWNER_HEARTBEAT_INTERVAL
+
+    # Drain: on worker shutdown/reload, owned channels are handed to peer workers,
+    # which connect upstream before taking over the buffer
+    DRAIN_TIMEOUT = 15            # Max seconds a shutting down worker waits for its handoffs
+    HANDOFF_CONNECT_TIMEOUT = 10  # Max seconds a peer waits for its upstream connection before giving up
+
+    # Placement: workers publish their load and new channels are owned by the least-loaded one
+    PLACEMENT_ENABLED = True
+    PLACEMENT_SCORE_MARGIN = 1.0     # Only hand a new channel to a worker whose load score is lower by this much
+    PLACEMENT_DELEGATE_TIMEOUT = 5   # Seconds to wait for the chosen worker before owning the channel ourselves
+    PLACEMENT_WEIGHTS = {            # Load score = sum of weight x value
+        'channels': 1.0,             # Owned channels
+        'ffmpeg': 2.0,               # Transcode processes
+        'cpu': 4.0,                  # Host CPU use (0-1)
+        'egress_mbps': 0.05,         # Data sent to clients
+    }
+    WORKER_REGISTRY_MAX_AGE = 10     # Seconds before a worker that stopped publishing its load is ignored
+
+    # Cluster mode (nodes sharing Redis/Postgres, see ts_proxy/cluster.py): how a client whose
+    # channel is owned by another node is served - 'buffer' (from Redis), 'redirect' or 'forward'
+    CLUSTER_CLIENT_ROUTING = 'buffer'
+    NODE_REGISTRY_MAX_AGE = 30  # Seconds before a node that stopped publishing its URL is ignored
+    CLUSTER_FORWARD_THREADS = 32  # Threads for forwarded stream reads when sockets aren't gevent-patched
+
+    # Single-flight channel initialization: one request cluster-wide initializes a cold channel
+    # while concurrent requests wait for its readiness notification
+    CHANNEL_INIT_LOCK_TTL = 30  # Seconds before an initializer that never finished is given up on
+
+    # Adaptive linger: after its last client leaves, a channel keeps its upstream for about as long as
+    # its clients have recently taken to come back (never less than CHANNEL_SHUTDOWN_DELAY). A lingering
+    # channel gives its M3U profile slot up as soon as another channel needs it.
+    CHANNEL_LINGER_ENABLED = True
+    CHANNEL_LINGER_MAX = 60              # Longest a channel lingers (seconds)
+    CHANNEL_LINGER_FULL_PROFILE_MAX = 15  # Longest linger while its M3U profile has no free slot left
+    CHANNEL_LINGER_MIN_RETURN_RATE = 0.5  # Share of recent disconnects that must have been followed by a reconnect
+    CHANNEL_LINGER_HISTORY = 10          # Disconnect outcomes remembered per channel
+
+    # Warm channel pool (optional): keep these channels connected upstream with a rolling buffer even
+    # without viewers so tuning to them is instant. One worker at a time manages the pool, and a warm
+    # channel without viewers gives its M3U profile slot up whenever another channel needs it.
+    WARM_POOL_ENABLED = False
+    WARM_POOL_CHANNELS = []               # Channel UUIDs to always keep warm
+    WARM_POOL_SIZE = 0                    # Also keep this many of the most watched channels warm
+    WARM_POOL_CHECK_INTERVAL = 30         # Seconds between pool checks
+    WARM_POOL_HISTORY_HALF_LIFE = 86400   # Seconds for a channel's viewing history to lose half its weight
+
+    # Native HLS ingest: read unencrypted MPEG-TS HLS sources directly instead of through ffmpeg.
+    # Encrypted and fMP4 playlists still go through ffmpeg.
+    HLS_NATIVE_INGEST = True
+    HLS_PREFETCH_WORKERS = 3              # Segments downloaded in parallel
+    HLS_LIVE_EDGE_SEGMENTS = 3            # Start this many segments back from the live edge
+    HLS_PLAYLIST_MAX_FAILURES = 5         # Playlist refreshes that may fail in a row before the source is given up
+
+    # Upstream deduplication: a channel whose source another channel is already pulling (same URL
+    # and M3U profile, proxy stream profile) is served from that channel's buffer instead of opening
+    # a second upstream connection.
+    UPSTREAM_DEDUP_ENABLED = True
+    TRANSCODE_SESSION_SHARING = True      # Also share ffmpeg sessions between channels building the same command
+
+    # Failover probing: when a stream fails, open this many alternates at once and switch to the first
+    # that delivers MPEG-TS instead of trying them one by one (1 disables probing)
+    FAILOVER_PROBE_COUNT = 3
+    FAILOVER_PROBE_TIMEOUT = 5            # Connect and first-read timeout per probe (seconds)
+
     # Client tracking settings
     CLIENT_RECORD_TTL = 5  # How long client records persist in Redis (seconds). Client will be considered MIA after this time.
     CLEANUP_CHECK_INTERVAL = 1  # How often to check for disconnected clients (seconds)
     CHANNEL_INIT_GRACE_PERIOD = 5  # How long to wait for first client after initialization (seconds)
     CLIENT_HEARTBEAT_INTERVAL = 1  # How often to send client heartbeats (seconds)
+    CLIENT_STATS_FLUSH_INTERVAL = 1.5  # How often batched client transfer stats are written to Redis (seconds)
     GHOST_CLIENT_MULTIPLIER = 5.0  # How many heartbeat intervals before client considered ghost (5 would mean 5 secondsif heartbeat interval is 1)
     CLIENT_WAIT_TIMEOUT = 30  # Seconds to wait for client to connect
 
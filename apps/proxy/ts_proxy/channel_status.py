@@ -3,6 +3,9 @@ import time
 import re
 from .server import ProxyServer
 from .redis_keys import RedisKeys
+from .chunk_cache import ChunkCache
+from .fanout import ChannelFanout
+from .client_registry import ClientRegistry
 from .constants import TS_PACKET_SIZE, ChannelMetadataField
 from redis.exceptions import ConnectionError, TimeoutError
 from .utils import get_logger
@@ -123,8 +126,7 @@ class ChannelStatus:
                     info['avg_bitrate'] = f"{avg_bitrate:.2f} Kbps"
 
         # Get client information
-        client_set_key = RedisKeys.clients(channel_id)
-        client_ids = proxy_server.redis_client.smembers(client_set_key)
+        client_ids = ClientRegistry.members(proxy_server.redis_client, channel_id)
         clients = []
 
         for client_id in client_ids:
@@ -252,6 +254,12 @@ class ChannelStatus:
         chunk_ttl = proxy_server.redis_client.ttl(chunk_ttl_key)
         buffer_stats['latest_chunk_ttl'] = chunk_ttl
 
+        # Hit rate of this worker's chunk cache for the channel
+        buffer_stats['worker_chunk_cache'] = ChunkCache.get_instance().get_stats(channel_id)
+
+        # Local fan-out reader state (None if this worker has no clients for the channel)
+        buffer_stats['worker_fanout'] = ChannelFanout.get_stats(channel_id)
+
         info['buffer_stats'] = buffer_stats
 
         # Get local worker info if available
@@ -303,8 +311,7 @@ class ChannelStatus:
             buffer_index_value = proxy_server.redis_client.get(buffer_index_key)
 
             # Count clients (using efficient count method)
-            client_set_key = RedisKeys.clients(channel_id)
-            client_count = proxy_server.redis_client.scard(client_set_key) or 0
+            client_count = ClientRegistry.count(proxy_server.redis_client, channel_id)
 
             # Calculate uptime
             created_at = float(metadata.get(ChannelMetadataField.INIT_TIME.encode('utf-8'), b'0').decode('utf-8'))
@@ -364,7 +371,7 @@ class ChannelStatus:
 
             # Get concise client information
             clients = []
-            client_ids = proxy_server.redis_client.smembers(client_set_key)
+            client_ids = ClientRegistry.members(proxy_server.redis_client, channel_id)
 
             # Process only if we have clients and keep it limited
             if client_ids:
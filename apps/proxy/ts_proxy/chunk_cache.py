@@ -0,0 +1,165 @@
+"""
+Per-worker cache of recent TS chunks.
+
+All StreamGenerators in a worker that watch the same channel read the same
+chunks at roughly the same time. Caching recent chunks by (channel, index)
+means each chunk is fetched from Redis (or the shared-memory ring) once per
+worker instead of once per client.
+"""
+
+import threading
+from collections import OrderedDict
+from .config_helper import ConfigHelper
+from .utils import get_logger
+
+logger = get_logger()
+
+
+class ChunkCache:
+    """Byte-bounded LRU of chunk data shared by all buffers in the process"""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = ChunkCache(ConfigHelper.chunk_cache_max_bytes())
+        return cls._instance
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._entries = OrderedDict()   # (channel_id, index) -> bytes
+        self._channels = {}             # channel_id -> per-channel stats
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @staticmethod
+    def _empty_stats():
+        return {'bytes': 0, 'chunks': 0, 'hits': 0, 'misses': 0, 'high_index': 0}
+
+    def _channel_stats(self, channel_id):
+        stats = self._channels.get(channel_id)
+        if stats is None:
+            stats = self._empty_stats()
+            self._channels[channel_id] = stats
+        return stats
+
+    def get(self, channel_id, index):
+        """
+        Get a cached chunk, or None if it isn't cached. Lookups that find nothing
+        aren't counted as misses - at the live edge the chunk usually doesn't exist
+        yet. A miss is counted when the chunk is fetched elsewhere and put().
+        """
+        if not self.enabled:
+            return None
+
+        key = (channel_id, index)
+        with self.lock:
+            data = self._entries.get(key)
+            if data is None:
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._channel_stats(channel_id)['hits'] += 1
+            return data
+
+    def put(self, channel_id, index, data):
+        """
+        Cache a chunk that had to be fetched from the shared-memory ring or Redis
+        (counted as a miss), evicting least recently used chunks to stay within max_bytes
+        """
+        if not self.enabled or data is None:
+            return
+
+        size = len(data)
+        if size > self.max_bytes:
+            return
+
+        # Only cache immutable data - memoryviews of write buffers get reused
+        if not isinstance(data, bytes):
+            data = bytes(data)
+
+        key = (channel_id, index)
+        with self.lock:
+            stats = self._channel_stats(channel_id)
+            self.misses += 1
+            stats['misses'] += 1
+
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= len(previous)
+                stats['bytes'] -= len(previous)
+                stats['chunks'] -= 1
+
+            self._entries[key] = data
+            self.total_bytes += size
+            stats['bytes'] += size
+            stats['chunks'] += 1
+            if index > stats['high_index']:
+                stats['high_index'] = index
+
+            while self.total_bytes > self.max_bytes and self._entries:
+                (old_channel, _), old_data = self._entries.popitem(last=False)
+                self.total_bytes -= len(old_data)
+                old_stats = self._channels.get(old_channel)
+                if old_stats:
+                    old_stats['bytes'] -= len(old_data)
+                    old_stats['chunks'] -= 1
+                self.evictions += 1
+
+    def check_head(self, channel_id, current_index):
+        """
+        Drop a channel's chunks if its buffer index went backwards, which means
+        the channel was restarted and cached indexes now refer to old data.
+        """
+        if not self.enabled:
+            return
+
+        stats = self._channels.get(channel_id)
+        if stats and stats['chunks'] and current_index < stats['high_index']:
+            logger.debug(f"Buffer index for channel {channel_id} went back from "
+                         f"{stats['high_index']} to {current_index}, dropping cached chunks")
+            self.invalidate(channel_id)
+
+    def invalidate(self, channel_id):
+        """Remove all cached chunks for a channel"""
+        with self.lock:
+            stats = self._channels.pop(channel_id, None)
+            if not stats or not stats['chunks']:
+                return
+
+            for key in [key for key in self._entries if key[0] == channel_id]:
+                self.total_bytes -= len(self._entries.pop(key))
+
+    def get_stats(self, channel_id=None):
+        """Get cache statistics for the whole worker or a single channel"""
+        with self.lock:
+            if channel_id is not None:
+                stats = dict(self._channels.get(channel_id) or self._empty_stats())
+                lookups = stats['hits'] + stats['misses']
+                stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+                stats.pop('high_index', None)
+                return stats
+
+            lookups = self.hits + self.misses
+            return {
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'chunks': len(self._entries),
+                'channels': len(self._channels),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -3,14 +3,15 @@
 import threading
 import logging
 import time
-import json
 from typing import Set, Optional
-from apps.proxy.config import TSConfig as Config
 from redis.exceptions import ConnectionError, TimeoutError
 from .constants import EventType
 from .config_helper import ConfigHelper
 from .redis_keys import RedisKeys
 from .utils import get_logger
+from .heartbeat import HeartbeatScheduler
+from .client_registry import ClientRegistry
+from .events import publish_owner_event
 
 logger = get_logger()
 
@@ -31,113 +32,10 @@ class ClientManager:
         self.heartbeat_interval = ConfigHelper.get('CLIENT_HEARTBEAT_INTERVAL', 10)
         self.last_heartbeat_time = {}
 
-        # Start heartbeat thread for local clients
-        self._start_heartbeat_thread()
         self._registered_clients = set()  # Track already registered client IDs
 
-    def _start_heartbeat_thread(self):
-        """Start thread to regularly refresh client presence in Redis"""
-        def heartbeat_task():
-            no_clients_count = 0  # Track consecutive empty cycles
-            max_empty_cycles = 3  # Exit after this many consecutive empty checks
-
-            logger.debug(f"Started heartbeat thread for channel {self.channel_id} (interval: {self.heartbeat_interval}s)")
-
-            while True:
-                try:
-                    # Wait for the interval
-                    time.sleep(self.heartbeat_interval)
-
-                    # Send heartbeat for all local clients
-                    with self.lock:
-                        if not self.clients or not self.redis_client:
-                            # No clients left, increment our counter
-                            no_clients_count += 1
-
-                            # If we've seen no clients for several consecutive checks, exit the thread
-                            if no_clients_count >= max_empty_cycles:
-                                logger.info(f"No clients for channel {self.channel_id} after {no_clients_count} consecutive checks, exiting heartbeat thread")
-                                return  # This exits the thread
-
-                            # Skip this cycle if we have no clients
-                            continue
-                        else:
-                            # Reset counter when we see clients
-                            no_clients_count = 0
-
-                        # IMPROVED GHOST DETECTION: Check for stale clients before sending heartbeats
-                        current_time = time.time()
-                        clients_to_remove = set()
-
-                        # First identify clients that should be removed
-                        for client_id in self.clients:
-                            client_key = f"ts_proxy:channel:{self.channel_id}:clients:{client_id}"
-
-                            # Check if client exists in Redis at all
-                            exists = self.redis_client.exists(client_key)
-                            if not exists:
-                                logger.debug(f"Client {client_id} no longer exists in Redis, removing locally")
-                                clients_to_remove.add(client_id)
-                                continue
-
-                            # Check for stale activity using last_active field
-                            last_active = self.redis_client.hget(client_key, "last_active")
-                            if last_active:
-                                last_active_time = float(last_active.decode('utf-8'))
-                                ghost_timeout = self.heartbeat_interval * getattr(Config, 'GHOST_CLIENT_MULTIPLIER', 5.0)
-
-                                if current_time - last_active_time > ghost_timeout:
-                                    logger.debug(f"Client {client_id} inactive for {current_time - last_active_time:.1f}s, removing as ghost")
-                                    clients_to_remove.add(client_id)
-
-                        # Remove ghost clients in a separate step
-                        for client_id in clients_to_remove:
-                            self.remove_client(client_id)
-
-                        if clients_to_remove:
-                            logger.info(f"Removed {len(clients_to_remove)} ghost clients from channel {self.channel_id}")
-
-                        # Now send heartbeats only for remaining clients
-                        pipe = self.redis_client.pipeline()
-                        current_time = time.time()
-
-                        for client_id in self.clients:
-                            # Skip clients we just marked for removal
-                            if client_id in clients_to_remove:
-                                continue
-
-                            # Skip if we just sent a heartbeat recently
-                            if client_id in self.last_heartbeat_time:
-                                time_since_heartbeat = current_time - self.last_heartbeat_time[client_id]
-                                if time_since_heartbeat < self.heartbeat_interval * 0.5:  # Only heartbeat at half interval minimum
-                                    continue
-
-                            # Only update clients that remain
-                            client_key = f"ts_proxy:channel:{self.channel_id}:clients:{client_id}"
-                            pipe.hset(client_key, "last_active", str(current_time))
-                            pipe.expire(client_key, self.client_ttl)
-
-                            # Keep client in the set with TTL
-                            pipe.sadd(self.client_set_key, client_id)
-                            pipe.expire(self.client_set_key, self.client_ttl)
-
-                            # Track last heartbeat locally
-                            self.last_heartbeat_time[client_id] = current_time
-
-                        # Execute all commands atomically
-                        pipe.execute()
-
-                        # Only notify if we have real clients
-                        if self.clients and not all(c in clients_to_remove for c in self.clients):
-                            self._notify_owner_of_activity()
-
-                except Exception as e:
-                    logger.error(f"Error in client heartbeat thread: {e}")
-
-        thread = threading.Thread(target=heartbeat_task, daemon=True)
-        thread.name = f"client-heartbeat-{self.channel_id}"
-        thread.start()
-        logger.debug(f"Started client heartbeat thread for channel {self.channel_id} (interval: {self.heartbeat_interval}s)")
+        # Heartbeats for local clients are sent by the worker-wide scheduler
+        HeartbeatScheduler.get_instance().register(self)
 
     def _execute_redis_command(self, command_func):
         """Execute Redis command with error handling"""
@@ -159,22 +57,24 @@ class ClientManager:
             return
 
         try:
-            worker_id = self.worker_id or "unknown"
-
-            # STANDARDIZED KEY: Worker info under channel namespace
-            worker_key = f"ts_proxy:channel:{self.channel_id}:worker:{worker_id}"
-            self._execute_redis_command(
-                lambda: self.redis_client.setex(worker_key, self.client_ttl, str(len(self.clients)))
-            )
-
-            # STANDARDIZED KEY: Activity timestamp under channel namespace
-            activity_key = f"ts_proxy:channel:{self.channel_id}:activity"
-            self._execute_redis_command(
-                lambda: self.redis_client.setex(activity_key, self.client_ttl, str(time.time()))
-            )
+            pipe = self.redis_client.pipeline(transaction=False)
+            self.queue_activity_notification(pipe)
+            self._execute_redis_command(pipe.execute)
         except Exception as e:
             logger.error(f"Error notifying owner of client activity: {e}")
 
+    def queue_activity_notification(self, pipe):
+        """Add the writes telling the owner this worker has active clients to a pipeline"""
+        worker_id = self.worker_id or "unknown"
+
+        # STANDARDIZED KEY: Worker info under channel namespace
+        worker_key = f"ts_proxy:channel:{self.channel_id}:worker:{worker_id}"
+        pipe.setex(worker_key, self.client_ttl, str(len(self.clients)))
+
+        # STANDARDIZED KEY: Activity timestamp under channel namespace
+        activity_key = f"ts_proxy:channel:{self.channel_id}:activity"
+        pipe.setex(activity_key, self.client_ttl, str(time.time()))
+
     def add_client(self, client_id, client_ip, user_agent=None):
         """Add a client with duplicate prevention"""
         if client_id in self._registered_clients:
@@ -200,6 +100,7 @@ class ClientManager:
             with self.lock:
                 # Store client in local set
                 self.clients.add(client_id)
+                HeartbeatScheduler.get_instance().register(self)
 
                 # Store in Redis
                 if self.redis_client:
@@ -207,9 +108,8 @@ class ClientManager:
                     self.redis_client.hset(client_key, mapping=client_data)
                     self.redis_client.expire(client_key, self.client_ttl)
 
-                    # Add to the client set
-                    self.redis_client.sadd(self.client_set_key, client_id)
-                    self.redis_client.expire(self.client_set_key, self.client_ttl)
+                    # Add to the client registry
+                    ClientRegistry.touch(self.redis_client, self.channel_id, client_id)
 
                     # Clear any initialization timer
                     init_key = f"ts_proxy:channel:{self.channel_id}:init_time"
@@ -232,10 +132,7 @@ class ClientManager:
                     else:
                         logger.debug(f"No user agent provided for client {client_id}")
 
-                    self.redis_client.publish(
-                        RedisKeys.events_channel(self.channel_id),  # Use RedisKeys instead of string
-                        json.dumps(event_data)
-                    )
+                    publish_owner_event(self.redis_client, self.channel_id, event_data)
 
                 # Get total clients across all workers
                 total_clients = self.get_total_client_count()
@@ -261,15 +158,15 @@ class ClientManager:
             self.last_active_time = time.time()
 
             if self.redis_client:
-                # Remove from channel's client set
-                self.redis_client.srem(self.client_set_key, client_id)
+                # Remove from channel's client registry
+                ClientRegistry.remove(self.redis_client, self.channel_id, client_id)
 
                 # STANDARDIZED KEY: Delete individual client keys
                 client_key = f"ts_proxy:channel:{self.channel_id}:clients:{client_id}"
                 self.redis_client.delete(client_key)
 
                 # Check if this was the last client
-                remaining = self.redis_client.scard(self.client_set_key) or 0
+                remaining = ClientRegistry.count(self.redis_client, self.channel_id)
                 if remaining == 0:
                     logger.warning(f"Last client removed: {client_id} - channel may shut down soon")
 
@@ -280,15 +177,15 @@ class ClientManager:
                 self._notify_owner_of_activity()
 
                 # Publish client disconnected event
-                event_data = json.dumps({
+                event_data = {
                     "event": EventType.CLIENT_DISCONNECTED,  # Use constant instead of string
                     "channel_id": self.channel_id,
                     "client_id": client_id,
                     "worker_id": self.worker_id or "unknown",
                     "timestamp": time.time(),
                     "remaining_clients": remaining
-                })
-                self.redis_client.publish(RedisKeys.events_channel(self.channel_id), event_data)
+                }
+                publish_owner_event(self.redis_client, self.channel_id, event_data)
 
             total_clients = self.get_total_client_count()
             logger.info(f"Client disconnected: {client_id} (local: {len(self.clients)}, total: {total_clients})")
@@ -306,8 +203,8 @@ class ClientManager:
             return len(self.clients)
 
         try:
-            # Count members in the client set
-            return self.redis_client.scard(self.client_set_key) or 0
+            # Count clients active within the record TTL
+            return ClientRegistry.count(self.redis_client, self.channel_id)
         except Exception as e:
             logger.error(f"Error getting total client count: {e}")
             return len(self.clients)  # Fall back to local count
@@ -0,0 +1,53 @@
+"""
+Per-channel client registry.
+
+Clients of a channel are kept in a sorted set scored by the time of their last
+heartbeat. A heartbeat is a single ZADD, expired clients are removed with one
+ZREMRANGEBYSCORE, and counts only include clients seen within the client
+record TTL, so they stay accurate even before stale entries are pruned.
+"""
+
+import time
+from .config_helper import ConfigHelper
+from .redis_keys import RedisKeys
+
+
+class ClientRegistry:
+    """Helpers for the sorted-set client registry at RedisKeys.clients(channel_id)"""
+
+    @staticmethod
+    def client_ttl():
+        return ConfigHelper.get('CLIENT_RECORD_TTL', 60)
+
+    @staticmethod
+    def cutoff(now=None):
+        """Oldest last-activity score that still counts as connected"""
+        return (now or time.time()) - ClientRegistry.client_ttl()
+
+    @staticmethod
+    def touch(redis_client, channel_id, client_id, now=None):
+        """Record activity for a client (works on clients and pipelines)"""
+        key = RedisKeys.clients(channel_id)
+        redis_client.zadd(key, {client_id: now or time.time()})
+        # Backstop so a channel nobody heartbeats any more doesn't leave the key behind
+        redis_client.expire(key, ClientRegistry.client_ttl())
+
+    @staticmethod
+    def remove(redis_client, channel_id, client_id):
+        """Remove a client from the registry"""
+        return redis_client.zrem(RedisKeys.clients(channel_id), client_id)
+
+    @staticmethod
+    def expire_stale(redis_client, channel_id, now=None):
+        """Drop clients that haven't been active within the client record TTL"""
+        return redis_client.zremrangebyscore(RedisKeys.clients(channel_id), '-inf', f"({ClientRegistry.cutoff(now)}")
+
+    @staticmethod
+    def count(redis_client, channel_id, now=None):
+        """Number of clients active within the client record TTL"""
+        return redis_client.zcount(RedisKeys.clients(channel_id), ClientRegistry.cutoff(now), '+inf') or 0
+
+    @staticmethod
+    def members(redis_client, channel_id, now=None):
+        """IDs (bytes) of clients active within the client record TTL"""
+        return redis_client.zrangebyscore(RedisKeys.clients(channel_id), ClientRegistry.cutoff(now), '+inf')
@@ -0,0 +1,119 @@
+"""
+Batched client statistics writes.
+
+StreamGenerators record their transfer stats here as they send chunks and a
+single greenlet per worker writes the latest stats for every client to Redis
+in one pipeline at a fixed interval, instead of one HSET per chunk per client.
+"""
+
+import threading
+import time
+import gevent
+from .config_helper import ConfigHelper
+from .redis_keys import RedisKeys
+from .utils import get_logger
+
+logger = get_logger()
+
+# Seconds of traffic the reported egress rate is averaged over
+EGRESS_WINDOW = 5
+
+
+class ClientStatsAggregator:
+    """Collects the latest stats per client in memory and flushes them periodically"""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = ClientStatsAggregator()
+        return cls._instance
+
+    def __init__(self):
+        self.pending = {}   # (channel_id, client_id) -> stats mapping
+        self.flush_interval = ConfigHelper.client_stats_flush_interval()
+        self.client_ttl = ConfigHelper.get('CLIENT_RECORD_TTL', 60)
+        self.greenlet = None
+        self.flushes = 0
+        self.writes = 0
+
+        # Bytes sent to all clients of this worker, for load reporting
+        self.egress_bytes = 0
+        self._egress_mark = (time.time(), 0)
+        self._egress_rate = None
+
+    def record(self, channel_id, client_id, stats, sent_bytes=0):
+        """Store the latest stats for a client - only the newest values get written"""
+        self.pending[(channel_id, client_id)] = stats
+        self.egress_bytes += sent_bytes
+
+        if self.greenlet is None or self.greenlet.dead:
+            self.greenlet = gevent.spawn(self._flush_loop)
+
+    def discard(self, channel_id, client_id):
+        """Drop unwritten stats for a client that is going away"""
+        self.pending.pop((channel_id, client_id), None)
+
+    def discard_channel(self, channel_id):
+        """Drop unwritten stats for every client of a channel"""
+        for key in [key for key in self.pending if key[0] == channel_id]:
+            del self.pending[key]
+
+    def egress_rate(self):
+        """
+        Bytes per second sent to this worker's clients over the last complete window of
+        at least EGRESS_WINDOW seconds. Reading it doesn't reset anything, so every
+        caller sees the same rate however often it's read.
+        """
+        now = time.time()
+        mark_time, mark_bytes = self._egress_mark
+        elapsed = now - mark_time
+        if elapsed >= EGRESS_WINDOW:
+            self._egress_rate = (self.egress_bytes - mark_bytes) / elapsed
+            self._egress_mark = (now, self.egress_bytes)
+        elif self._egress_rate is None:
+            # No complete window yet - use what we have so far
+            return (self.egress_bytes - mark_bytes) / elapsed if elapsed > 0 else 0
+        return self._egress_rate
+
+    def flush(self, redis_client):
+        """Write all pending stats in a single pipeline"""
+        if not self.pending or not redis_client:
+            return 0
+
+        pending, self.pending = self.pending, {}
+
+        pipe = redis_client.pipeline(transaction=False)
+        for (channel_id, client_id), stats in pending.items():
+            client_key = RedisKeys.client_metadata(channel_id, client_id)
+            pipe.hset(client_key, mapping=stats)
+            # Don't leave stats behind if the client record was removed in the meantime
+            pipe.expire(client_key, self.client_ttl)
+        pipe.execute()
+
+        self.flushes += 1
+        self.writes += len(pending)
+        return len(pending)
+
+    def _flush_loop(self):
+        """Flush pending stats every flush_interval seconds until there's nothing left to write"""
+        from .server import ProxyServer
+
+        idle_cycles = 0
+        while idle_cycles < 3:
+            gevent.sleep(self.flush_interval)
+
+            if not self.pending:
+                idle_cycles += 1
+                continue
+            idle_cycles = 0
+
+            try:
+                count = self.flush(ProxyServer.get_instance().redis_client)
+                logger.debug(f"Flushed stats for {count} clients")
+            except Exception as e:
+                logger.warning(f"Failed to flush client stats to Redis: {e}")
@@ -0,0 +1,101 @@
+"""
+Multi-node cluster support.
+
+Several Dispatcharr nodes can run the TS proxy against the same Redis and
+Postgres behind a load balancer. Each node has an ID (DISPATCHARR_NODE_ID,
+the hostname by default) that prefixes its worker IDs, and an address the
+other nodes can reach it on (DISPATCHARR_NODE_URL). Channel ownership,
+failover, handoff and placement already go through Redis and work across
+nodes; the shared-memory buffer tier is per node, with Redis as the
+fallback for readers on other nodes.
+
+A client landing on a node that doesn't own its channel is served according
+to CLUSTER_CLIENT_ROUTING: from the Redis buffer ('buffer', the default),
+by redirecting it to the owner's node ('redirect'), or by proxying the
+owner node's stream ('forward'). Several processes on one host with
+different node IDs and URLs behave like separate nodes.
+"""
+
+import json
+import os
+import socket
+import time
+import requests
+from .config_helper import ConfigHelper
+from .redis_keys import RedisKeys
+from .utils import get_logger, run_blocking
+
+logger = get_logger()
+
+# Set on requests forwarded between nodes so the owner node serves them itself
+FORWARDED_HEADER = 'X-Dispatcharr-Forwarded-By'
+
+
+class ClientRouting:
+    """How to serve a client whose channel is owned by another node"""
+    BUFFER = "buffer"       # Read the owner's chunks from Redis
+    REDIRECT = "redirect"   # Redirect the client to the owner's node
+    FORWARD = "forward"     # Proxy the owner node's stream to the client
+
+
+def local_node_id():
+    """ID of this node"""
+    return os.environ.get('DISPATCHARR_NODE_ID') or socket.gethostname()
+
+
+def local_node_url():
+    """Base URL other nodes and clients can reach this node on, or '' if not configured"""
+    return os.environ.get('DISPATCHARR_NODE_URL', '').rstrip('/')
+
+
+def worker_node(worker_id):
+    """Node ID of a worker ID ("<node>:<pid>")"""
+    return worker_id.rsplit(':', 1)[0] if worker_id else None
+
+
+class NodeRegistry:
+    """Hash of node ID -> JSON {url, updated_at} for nodes that published their URL"""
+
+    @staticmethod
+    def publish(redis_client, node_id, url):
+        """Publish a node's URL (works on clients and pipelines)"""
+        redis_client.hset(RedisKeys.nodes(), node_id, json.dumps({'url': url, 'updated_at': time.time()}))
+
+    @staticmethod
+    def get_url(redis_client, node_id):
+        """URL of a node that published recently, or None"""
+        value = redis_client.hget(RedisKeys.nodes(), node_id)
+        if not value:
+            return None
+        try:
+            node = json.loads(value)
+        except (ValueError, TypeError):
+            return None
+        if time.time() - node.get('updated_at', 0) > ConfigHelper.node_registry_max_age():
+            return None
+        return node.get('url') or None
+
+
+def _run_blocking(fn, *args):
+    """Run a blocking call of a forwarded stream on the forwarding threads"""
+    return run_blocking('cluster_forward', ConfigHelper.cluster_forward_threads(), fn, *args)
+
+
+def forward_stream(url, user_agent, chunk_size=188 * 64):
+    """Generator proxying another node's stream of a channel"""
+    headers = {FORWARDED_HEADER: local_node_id()}
+    if user_agent:
+        headers['User-Agent'] = user_agent
+
+    response = _run_blocking(lambda: requests.get(url, headers=headers, stream=True, timeout=(5, 30)))
+    try:
+        response.raise_for_status()
+        chunks = response.iter_content(chunk_size=chunk_size)
+        while True:
+            chunk = _run_blocking(next, chunks, None)
+            if chunk is None:
+                break
+            if chunk:
+                yield chunk
+    finally:
+        response.close()
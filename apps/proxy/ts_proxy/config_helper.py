@@ -3,6 +3,7 @@ Helper module to access configuration values with proper defaults.
 """
 
 from apps.proxy.config import TSConfig as Config
+from .constants import TS_PACKET_SIZE
 
 class ConfigHelper:
     """
@@ -41,6 +42,16 @@ class ConfigHelper:
         """Get number of chunks to start behind"""
         return ConfigHelper.get('INITIAL_BEHIND_CHUNKS', 4)
 
+    @staticmethod
+    def keyframe_join_enabled():
+        """Check if new clients should start on a keyframe join point"""
+        return ConfigHelper.get('KEYFRAME_JOIN_ENABLED', True)
+
+    @staticmethod
+    def keyframe_join_max_back_chunks():
+        """Get how many extra chunks back a client may start to land on a keyframe"""
+        return ConfigHelper.get('KEYFRAME_JOIN_MAX_BACK_CHUNKS', 8)
+
     @staticmethod
     def keepalive_interval():
         """Get keepalive interval in seconds"""
@@ -51,11 +62,252 @@ class ConfigHelper:
         """Get cleanup check interval in seconds"""
         return ConfigHelper.get('CLEANUP_CHECK_INTERVAL', 3)
 
+    @staticmethod
+    def owner_failover_enabled():
+        """Whether workers with clients take over channels whose owner stopped heartbeating"""
+        return ConfigHelper.get('OWNER_FAILOVER_ENABLED', True)
+
+    @staticmethod
+    def owner_heartbeat_ttl():
+        """Get how long (seconds) an owner heartbeat stays valid"""
+        return ConfigHelper.get('OWNER_HEARTBEAT_TTL', 5)
+
+    @staticmethod
+    def owner_heartbeat_interval():
+        """Get seconds between refreshes of an owner's leases and heartbeats"""
+        return ConfigHelper.get('OWNER_HEARTBEAT_INTERVAL', 1)
+
+    @staticmethod
+    def drain_timeout():
+        """Get max seconds a shutting down worker waits for its channels to be handed over"""
+        return ConfigHelper.get('DRAIN_TIMEOUT', 15)
+
+    @staticmethod
+    def handoff_connect_timeout():
+        """Get max seconds a worker taking a channel over waits for the upstream to connect"""
+        return ConfigHelper.get('HANDOFF_CONNECT_TIMEOUT', 10)
+
+    @staticmethod
+    def placement_enabled():
+        """Whether new channels are placed on the least-loaded worker"""
+        return ConfigHelper.get('PLACEMENT_ENABLED', True)
+
+    @staticmethod
+    def placement_score_margin():
+        """Get how much lower another worker's load score must be to hand it a new channel"""
+        return ConfigHelper.get('PLACEMENT_SCORE_MARGIN', 1.0)
+
+    @staticmethod
+    def placement_delegate_timeout():
+        """Get seconds to wait for the chosen worker to take a new channel"""
+        return ConfigHelper.get('PLACEMENT_DELEGATE_TIMEOUT', 5)
+
+    @staticmethod
+    def placement_weights():
+        """Get the weights of the worker load score"""
+        return ConfigHelper.get('PLACEMENT_WEIGHTS', {})
+
+    @staticmethod
+    def worker_registry_max_age():
+        """Get seconds after which a worker's published load is considered stale"""
+        return ConfigHelper.get('WORKER_REGISTRY_MAX_AGE', 10)
+
+    @staticmethod
+    def cluster_client_routing():
+        """Get how clients of channels owned by another node are served ('buffer', 'redirect' or 'forward')"""
+        return ConfigHelper.get('CLUSTER_CLIENT_ROUTING', 'buffer')
+
+    @staticmethod
+    def node_registry_max_age():
+        """Get seconds after which a node's published URL is considered stale"""
+        return ConfigHelper.get('NODE_REGISTRY_MAX_AGE', 30)
+
+    @staticmethod
+    def cluster_forward_threads():
+        """Get number of threads used for forwarded stream reads"""
+        return ConfigHelper.get('CLUSTER_FORWARD_THREADS', 32)
+
+    @staticmethod
+    def channel_init_lock_ttl():
+        """Get seconds after which a channel's init lock expires if its holder never finished"""
+        return ConfigHelper.get('CHANNEL_INIT_LOCK_TTL', 30)
+
+    @staticmethod
+    def channel_linger_enabled():
+        """Get whether channels linger adaptively after their last client leaves"""
+        return ConfigHelper.get('CHANNEL_LINGER_ENABLED', True)
+
+    @staticmethod
+    def channel_linger_max():
+        """Get the longest a channel lingers after its last client leaves (seconds)"""
+        return ConfigHelper.get('CHANNEL_LINGER_MAX', 60)
+
+    @staticmethod
+    def channel_linger_full_profile_max():
+        """Get the longest a channel lingers while its M3U profile has no free slot (seconds)"""
+        return ConfigHelper.get('CHANNEL_LINGER_FULL_PROFILE_MAX', 15)
+
+    @staticmethod
+    def channel_linger_min_return_rate():
+        """Get the share of recent disconnects that must have been followed by a reconnect to linger"""
+        return ConfigHelper.get('CHANNEL_LINGER_MIN_RETURN_RATE', 0.5)
+
+    @staticmethod
+    def channel_linger_history():
+        """Get the number of disconnect outcomes remembered per channel"""
+        return ConfigHelper.get('CHANNEL_LINGER_HISTORY', 10)
+
+    @staticmethod
+    def warm_pool_enabled():
+        """Get whether the warm channel pool is enabled"""
+        return ConfigHelper.get('WARM_POOL_ENABLED', False)
+
+    @staticmethod
+    def warm_pool_channels():
+        """Get the channel UUIDs always kept warm"""
+        return ConfigHelper.get('WARM_POOL_CHANNELS', [])
+
+    @staticmethod
+    def warm_pool_size():
+        """Get the number of most watched channels kept warm"""
+        return ConfigHelper.get('WARM_POOL_SIZE', 0)
+
+    @staticmethod
+    def warm_pool_check_interval():
+        """Get seconds between warm pool checks"""
+        return ConfigHelper.get('WARM_POOL_CHECK_INTERVAL', 30)
+
+    @staticmethod
+    def warm_pool_history_half_life():
+        """Get seconds for a channel's viewing history to lose half its weight"""
+        return ConfigHelper.get('WARM_POOL_HISTORY_HALF_LIFE', 86400)
+
+    @staticmethod
+    def hls_native_ingest():
+        """Get whether HLS sources are read without ffmpeg"""
+        return ConfigHelper.get('HLS_NATIVE_INGEST', True)
+
+    @staticmethod
+    def hls_prefetch_workers():
+        """Get the number of HLS segments downloaded in parallel"""
+        return ConfigHelper.get('HLS_PREFETCH_WORKERS', 3)
+
+    @staticmethod
+    def hls_live_edge_segments():
+        """Get how many segments back from the live edge HLS ingest starts"""
+        return ConfigHelper.get('HLS_LIVE_EDGE_SEGMENTS', 3)
+
+    @staticmethod
+    def hls_playlist_max_failures():
+        """Get how many playlist refreshes in a row may fail before native HLS ingest gives up"""
+        return ConfigHelper.get('HLS_PLAYLIST_MAX_FAILURES', 5)
+
+    @staticmethod
+    def upstream_dedup_enabled():
+        """Get whether channels sharing a source share its upstream connection"""
+        return ConfigHelper.get('UPSTREAM_DEDUP_ENABLED', True)
+
+    @staticmethod
+    def transcode_session_sharing():
+        """Get whether channels building the same transcode command share one ffmpeg session"""
+        return ConfigHelper.get('TRANSCODE_SESSION_SHARING', True)
+
+    @staticmethod
+    def failover_probe_count():
+        """Get the number of alternate streams probed at once on failover"""
+        return ConfigHelper.get('FAILOVER_PROBE_COUNT', 3)
+
+    @staticmethod
+    def failover_probe_timeout():
+        """Get the connect and first-read timeout of a failover probe in seconds"""
+        return ConfigHelper.get('FAILOVER_PROBE_TIMEOUT', 5)
+
+    @staticmethod
+    def upstream_read_size():
+        """Get the number of bytes read from upstream at a time"""
+        return ConfigHelper.get('UPSTREAM_READ_SIZE', 188 * 700)
+
+    @staticmethod
+    def last_data_update_interval():
+        """Get seconds between updates of a channel's last data time in Redis"""
+        return ConfigHelper.get('LAST_DATA_UPDATE_INTERVAL', 1.0)
+
+    @staticmethod
+    def client_stats_flush_interval():
+        """Get interval in seconds between batched client stats writes"""
+        return ConfigHelper.get('CLIENT_STATS_FLUSH_INTERVAL', 1.5)
+
     @staticmethod
     def redis_chunk_ttl():
         """Get Redis chunk TTL in seconds"""
         return ConfigHelper.get('REDIS_CHUNK_TTL', 60)
 
+    @staticmethod
+    def buffer_backend():
+        """Get buffer backend name ('keys' or 'stream')"""
+        return ConfigHelper.get('BUFFER_BACKEND', 'keys')
+
+    @staticmethod
+    def buffer_stream_maxlen():
+        """Get approximate number of chunks kept in a channel's buffer stream"""
+        return ConfigHelper.get('BUFFER_STREAM_MAXLEN', 128)
+
+    @staticmethod
+    def buffer_stream_block_ms():
+        """Get how long (ms) a client read blocks waiting for new chunks"""
+        return ConfigHelper.get('BUFFER_STREAM_BLOCK_MS', 1000)
+
+    @staticmethod
+    def buffer_stream_read_threads():
+        """Get number of threads used for blocking buffer stream reads"""
+        return ConfigHelper.get('BUFFER_STREAM_READ_THREADS', 64)
+
+    @staticmethod
+    def chunk_cache_max_bytes():
+        """Get maximum bytes of chunk data cached per worker"""
+        return ConfigHelper.get('CHUNK_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+
+    @staticmethod
+    def fanout_enabled():
+        """Check if local clients are fed by a per-channel fan-out reader"""
+        return ConfigHelper.get('FANOUT_ENABLED', True)
+
+    @staticmethod
+    def fanout_client_queue_chunks():
+        """Get maximum number of chunks queued for a single client"""
+        return ConfigHelper.get('FANOUT_CLIENT_QUEUE_CHUNKS', 32)
+
+    @staticmethod
+    def fanout_slow_client_policy():
+        """Get policy for clients that can't keep up ('drop_to_live' or 'disconnect')"""
+        return ConfigHelper.get('FANOUT_SLOW_CLIENT_POLICY', 'drop_to_live')
+
+    @staticmethod
+    def fanout_poll_interval():
+        """Get seconds between fan-out buffer reads at the live edge"""
+        return ConfigHelper.get('FANOUT_POLL_INTERVAL', 0.05)
+
+    @staticmethod
+    def shm_buffer_enabled():
+        """Check if the shared-memory buffer tier is enabled"""
+        return ConfigHelper.get('SHM_BUFFER_ENABLED', True)
+
+    @staticmethod
+    def shm_buffer_dir():
+        """Get directory used for shared-memory ring files"""
+        return ConfigHelper.get('SHM_BUFFER_DIR', '/dev/shm/dispatcharr')
+
+    @staticmethod
+    def shm_buffer_slots():
+        """Get number of chunk slots per shared-memory ring"""
+        return ConfigHelper.get('SHM_BUFFER_SLOTS', 16)
+
+    @staticmethod
+    def buffer_chunk_size():
+        """Get buffer chunk size in bytes, rounded down to whole TS packets so chunks stay packet aligned"""
+        size = ConfigHelper.get('BUFFER_CHUNK_SIZE', TS_PACKET_SIZE * 5644)  # ~1MB default
+        return max(size // TS_PACKET_SIZE, 1) * TS_PACKET_SIZE
+
     @staticmethod
     def chunk_size():
         """Get chunk size in bytes"""
@@ -28,6 +28,10 @@ class EventType:
     CLIENT_CONNECTED = "client_connected"
     CLIENT_DISCONNECTED = "client_disconnected"
     CLIENT_STOP = "client_stop"
+    OWNERSHIP_HANDOFF = "ownership_handoff"
+    CHANNEL_ASSIGN = "channel_assign"
+    CHANNEL_INIT_DONE = "channel_init_done"
+    LINGER_RELEASE = "linger_release"
 
 # Stream types
 class StreamType:
@@ -43,6 +47,8 @@ class ChannelMetadataField:
     STATE = "state"
     OWNER = "owner"
     STREAM_ID = "stream_id"
+    TRANSCODE = "transcode"
+    TRANSCODE_SESSION = "transcode_session"
 
     # Profile fields
     STREAM_PROFILE = "stream_profile"
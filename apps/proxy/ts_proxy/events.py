@@ -0,0 +1,37 @@
+"""
+Routing of TS proxy pub/sub events.
+
+Workers don't pattern-subscribe to every channel's events. Each worker
+subscribes to the event channels of the channels it has local resources for,
+plus its own control channel. Events that only the channel owner acts on are
+published straight to the owner's control channel.
+"""
+
+import json
+from .redis_keys import RedisKeys
+from .utils import get_logger
+
+logger = get_logger()
+
+
+def publish_channel_event(redis_client, channel_id, event_data):
+    """Publish an event to every worker with local resources for the channel"""
+    return redis_client.publish(RedisKeys.events_channel(channel_id), json.dumps(event_data))
+
+
+def publish_worker_event(redis_client, worker_id, event_data):
+    """Publish an event to a specific worker's control channel"""
+    return redis_client.publish(RedisKeys.worker_control(worker_id), json.dumps(event_data))
+
+
+def publish_owner_event(redis_client, channel_id, event_data):
+    """
+    Publish an event to the worker that owns the channel. Falls back to the
+    channel's event channel if there is no owner right now.
+    """
+    owner = redis_client.get(RedisKeys.channel_owner(channel_id))
+    if owner:
+        target = RedisKeys.worker_control(owner.decode('utf-8'))
+    else:
+        target = RedisKeys.events_channel(channel_id)
+    return redis_client.publish(target, json.dumps(event_data))
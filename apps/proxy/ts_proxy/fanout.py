@@ -0,0 +1,235 @@
+"""
+Per-worker fan-out of channel data to local clients.
+
+Instead of every client greenlet polling the buffer, one reader greenlet per
+channel per worker pulls new chunks once and pushes references to them into
+bounded per-client queues that StreamGenerator consumes. Clients that can't
+keep up are handled by the configured slow-client policy.
+"""
+
+import time
+import gevent
+from gevent.queue import Queue, Empty
+from .config_helper import ConfigHelper
+from .utils import get_logger
+
+logger = get_logger()
+
+
+class SlowClientPolicy:
+    """What to do with a client whose queue is full"""
+    DROP_TO_LIVE = "drop_to_live"   # Discard the client's backlog and continue from the newest data
+    DISCONNECT = "disconnect"       # Close the client's subscription
+
+
+class Subscription:
+    """A client's queue of (chunks, next_index) batches from a ChannelFanout"""
+
+    def __init__(self, fanout, client_id, position):
+        self.fanout = fanout
+        self.client_id = client_id
+        self.start_index = position     # The client only receives chunks after this index
+        self.position = position        # Last chunk index queued for this client
+        self.queue = Queue()
+        self.pending_chunks = 0
+        self.dropped_chunks = 0
+        self.closed = False
+        self.close_reason = None
+
+    def push(self, chunks, next_index):
+        """Queue a batch of chunks, applying the slow-client policy if the queue is full"""
+        if self.closed:
+            return
+
+        # The shared reader may still be behind this client's join point
+        first_index = next_index - len(chunks) + 1
+        if first_index <= self.start_index:
+            chunks = chunks[self.start_index - first_index + 1:]
+            if not chunks:
+                return
+
+        if self.pending_chunks + len(chunks) > self.fanout.max_pending:
+            if self.fanout.slow_client_policy == SlowClientPolicy.DISCONNECT:
+                logger.warning(f"[{self.client_id}] Client fell {self.pending_chunks} chunks behind on channel "
+                               f"{self.fanout.channel_id}, disconnecting")
+                self.close("slow client")
+                return
+
+            # Drop the backlog and jump to the newest data
+            dropped = self._drain()
+            self.dropped_chunks += dropped
+            logger.warning(f"[{self.client_id}] Client fell behind on channel {self.fanout.channel_id}, "
+                           f"dropped {dropped} queued chunks to catch up to live")
+
+        self.queue.put((chunks, next_index))
+        self.pending_chunks += len(chunks)
+        self.position = next_index
+
+    def get(self, timeout):
+        """
+        Wait up to timeout seconds for the next batch.
+        Returns (chunks, next_index) or None if nothing arrived or the subscription closed.
+        """
+        try:
+            item = self.queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+        if item is None:
+            return None
+
+        chunks, next_index = item
+        self.pending_chunks -= len(chunks)
+        return chunks, next_index
+
+    def _drain(self):
+        dropped = 0
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except Empty:
+                break
+            if item is not None:
+                dropped += len(item[0])
+        self.pending_chunks = 0
+        return dropped
+
+    def close(self, reason=None):
+        """Close the subscription and wake up the consumer"""
+        if self.closed:
+            return
+        self.closed = True
+        self.close_reason = reason
+        self._drain()
+        self.queue.put(None)
+        self.fanout.unsubscribe(self)
+
+
+class ChannelFanout:
+    """Single reader greenlet for a channel that feeds every local client's Subscription"""
+
+    # channel_id -> ChannelFanout for this worker
+    _fanouts = {}
+
+    @classmethod
+    def subscribe(cls, buffer, client_id, start_index):
+        """Subscribe a client to a channel's fan-out, starting after start_index"""
+        fanout = cls._fanouts.get(buffer.channel_id)
+        if fanout is None or fanout.buffer is not buffer or not fanout.running:
+            if fanout is not None:
+                fanout.stop()
+            fanout = ChannelFanout(buffer)
+            cls._fanouts[buffer.channel_id] = fanout
+        return fanout._add_subscriber(client_id, start_index)
+
+    @classmethod
+    def stop_channel(cls, channel_id, reason="channel stopped"):
+        """Stop a channel's fan-out and close all of its subscriptions"""
+        fanout = cls._fanouts.pop(channel_id, None)
+        if fanout:
+            fanout.stop(reason)
+
+    @classmethod
+    def get_stats(cls, channel_id):
+        """Get fan-out statistics for a channel in this worker, or None"""
+        fanout = cls._fanouts.get(channel_id)
+        if not fanout:
+            return None
+        return {
+            'subscribers': len(fanout.subscribers),
+            'reader_index': fanout.index,
+            'batches_read': fanout.batches_read,
+            'dropped_chunks': fanout.dropped_chunks + sum(s.dropped_chunks for s in fanout.subscribers.values()),
+        }
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.channel_id = buffer.channel_id
+        self.subscribers = {}
+        self.index = buffer.index
+        self.running = True
+        self.greenlet = None
+        self.batches_read = 0
+        self.dropped_chunks = 0
+
+        self.max_pending = ConfigHelper.fanout_client_queue_chunks()
+        self.slow_client_policy = ConfigHelper.fanout_slow_client_policy()
+        self.poll_interval = ConfigHelper.fanout_poll_interval()
+
+    def _add_subscriber(self, client_id, start_index):
+        subscription = Subscription(self, client_id, start_index)
+
+        # Catch the new client up from its start position to where the reader is
+        if start_index < self.index:
+            backlog = min(self.index - start_index, self.max_pending)
+            chunks = self.buffer.get_chunks_exact(self.index - backlog, backlog)
+            if chunks:
+                subscription.push(chunks, self.index)
+            subscription.position = self.index
+        elif start_index > self.index and not self.subscribers:
+            # Nobody else reads from this cursor - start the reader at the client's position.
+            # With other subscribers the cursor stays put and push() skips what the client
+            # doesn't want, so existing clients never miss chunks.
+            self.index = start_index
+
+        self.subscribers[client_id] = subscription
+
+        if self.greenlet is None or self.greenlet.dead:
+            self.greenlet = gevent.spawn(self._run)
+
+        logger.debug(f"[{client_id}] Subscribed to fan-out for channel {self.channel_id} "
+                     f"at index {subscription.position} ({len(self.subscribers)} local subscribers)")
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if self.subscribers.get(subscription.client_id) is subscription:
+            del self.subscribers[subscription.client_id]
+            self.dropped_chunks += subscription.dropped_chunks
+
+    def _run(self):
+        """Reader loop: fetch new chunks once and push them to every subscriber"""
+        idle_since = None
+        empty_reads = 0
+
+        try:
+            while self.running:
+                if not self.subscribers:
+                    # Keep the reader briefly so reconnecting clients don't restart it
+                    idle_since = idle_since or time.time()
+                    if time.time() - idle_since > ConfigHelper.keepalive_interval() * 10:
+                        break
+                    gevent.sleep(self.poll_interval)
+                    continue
+                idle_since = None
+
+                chunks, next_index = self.buffer.get_optimized_client_data(self.index)
+
+                if chunks:
+                    self.batches_read += 1
+                    empty_reads = 0
+                    self.index = next_index
+                    for subscription in list(self.subscribers.values()):
+                        subscription.push(chunks, next_index)
+                    # Let clients send what we just queued before reading again
+                    gevent.sleep(0)
+                elif not self.buffer.blocking_reads:
+                    # Only one poller per channel, so a short fixed interval is cheap
+                    empty_reads += 1
+                    gevent.sleep(self.poll_interval if empty_reads < 100 else self.poll_interval * 4)
+
+        except Exception as e:
+            logger.error(f"Fan-out reader for channel {self.channel_id} failed: {e}", exc_info=True)
+            self.stop("fan-out reader error")
+        finally:
+            # No yield between the check and the removal, so no subscriber can slip in
+            if not self.subscribers and ChannelFanout._fanouts.get(self.channel_id) is self:
+                del ChannelFanout._fanouts[self.channel_id]
+                self.running = False
+                logger.debug(f"Fan-out reader for channel {self.channel_id} exiting, no subscribers left")
+
+    def stop(self, reason="channel stopped"):
+        """Stop the reader and close every subscription"""
+        self.running = False
+        for subscription in list(self.subscribers.values()):
+            subscription.close(reason)
+        self.subscribers.clear()
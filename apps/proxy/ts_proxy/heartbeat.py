@@ -0,0 +1,129 @@
+"""
+Worker-wide client heartbeats.
+
+A single greenlet per worker refreshes the presence of every local client of
+every channel, and drops ghost clients, with one scripted Redis round trip per
+tick. This replaces a heartbeat thread per channel with a Redis call per client.
+"""
+
+import threading
+import time
+import weakref
+import gevent
+from .config_helper import ConfigHelper
+from .redis_keys import RedisKeys
+from .redis_scripts import run_script, CLIENT_HEARTBEAT
+from .client_registry import ClientRegistry
+from .utils import get_logger
+
+logger = get_logger()
+
+
+class HeartbeatScheduler:
+    """Sends heartbeats for all registered ClientManagers of this worker"""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = HeartbeatScheduler()
+        return cls._instance
+
+    def __init__(self):
+        # Managers dropped by the server are forgotten automatically
+        self.managers = weakref.WeakSet()
+        self.interval = ConfigHelper.get('CLIENT_HEARTBEAT_INTERVAL', 1)
+        self.greenlet = None
+
+    def register(self, client_manager):
+        """Start sending heartbeats for a channel's local clients"""
+        self.managers.add(client_manager)
+
+        if self.greenlet is None or self.greenlet.dead:
+            self.greenlet = gevent.spawn(self._run)
+            logger.debug(f"Started worker heartbeat scheduler (interval: {self.interval}s)")
+
+    def unregister(self, client_manager):
+        self.managers.discard(client_manager)
+
+    def _run(self):
+        no_clients_count = 0  # Track consecutive empty cycles
+        max_empty_cycles = 3  # Exit after this many consecutive empty checks
+
+        while True:
+            gevent.sleep(self.interval)
+
+            try:
+                if self.tick():
+                    no_clients_count = 0
+                else:
+                    no_clients_count += 1
+                    # Nothing registered has clients - stop until a manager registers again
+                    if no_clients_count >= max_empty_cycles and not any(m.clients for m in list(self.managers)):
+                        logger.debug("No local clients left, stopping heartbeat scheduler")
+                        return
+            except Exception as e:
+                logger.error(f"Error in client heartbeat scheduler: {e}")
+
+    def tick(self):
+        """Send one round of heartbeats. Returns the number of clients handled."""
+        batch = []  # (manager, client_id) in script key order
+        managers = []
+        redis_client = None
+
+        for manager in list(self.managers):
+            if not manager.redis_client:
+                continue
+            with manager.lock:
+                client_ids = list(manager.clients)
+            if not client_ids:
+                continue
+
+            redis_client = redis_client or manager.redis_client
+            managers.append(manager)
+            batch.extend((manager, client_id) for client_id in client_ids)
+
+        if not batch:
+            return 0
+
+        now = time.time()
+        ghost_timeout = self.interval * ConfigHelper.get('GHOST_CLIENT_MULTIPLIER', 5.0)
+        client_ttl = ConfigHelper.get('CLIENT_RECORD_TTL', 60)
+
+        keys = []
+        client_ids = []
+        for manager, client_id in batch:
+            keys.append(RedisKeys.client_metadata(manager.channel_id, client_id))
+            keys.append(manager.client_set_key)
+            client_ids.append(client_id)
+
+        # Heartbeats and the owner activity notifications go out in one pipeline
+        pipe = redis_client.pipeline(transaction=False)
+        run_script(pipe, CLIENT_HEARTBEAT, keys=keys, args=[now, ghost_timeout, client_ttl] + client_ids)
+        for manager in managers:
+            # Prune clients other workers stopped heartbeating
+            ClientRegistry.expire_stale(pipe, manager.channel_id, now)
+            manager.queue_activity_notification(pipe)
+        ghost_positions = pipe.execute()[0]
+
+        ghosts = set(ghost_positions or [])
+        for position, (manager, client_id) in enumerate(batch, start=1):
+            if position in ghosts:
+                continue
+            manager.last_heartbeat_time[client_id] = now
+
+        if ghosts:
+            removed = {}
+            for position in ghosts:
+                manager, client_id = batch[position - 1]
+                logger.debug(f"Client {client_id} is no longer active in Redis, removing as ghost")
+                manager.remove_client(client_id)
+                removed[manager.channel_id] = removed.get(manager.channel_id, 0) + 1
+            for channel_id, count in removed.items():
+                logger.info(f"Removed {count} ghost clients from channel {channel_id}")
+
+        return len(batch)
@@ -0,0 +1,250 @@
+"""
+Native HLS ingest.
+
+Reads an HLS source without an ffmpeg process: the media playlist is polled,
+new segments are prefetched by a small pool of threads, and their TS payload
+is handed over in playlist order. Master playlists resolve to their
+highest-bandwidth variant. Encrypted and fMP4 playlists aren't supported
+here and are left to ffmpeg.
+
+At a discontinuity - an EXT-X-DISCONTINUITY tag, a segment that couldn't be
+fetched, or segments that left the playlist before we got to them - the
+first packet of each PID that carries an adaptation field gets its
+discontinuity_indicator set, so players reset their clock and continuity
+counters instead of treating the jump as corruption.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import gevent
+import m3u8
+import requests
+from .config_helper import ConfigHelper
+from .constants import TS_PACKET_SIZE, TS_SYNC_BYTE
+from .stream_buffer import StreamBuffer
+from .utils import get_logger
+
+logger = get_logger()
+
+# Null packets carry no timing and need no discontinuity flag
+NULL_PID = 0x1FFF
+
+
+class HLSUnsupported(Exception):
+    """The playlist uses features native ingest doesn't handle"""
+
+
+def mark_discontinuity(packets):
+    """
+    Set the discontinuity_indicator on the first packet of each PID that has a
+    non-empty adaptation field. packets is a bytearray of whole TS packets.
+    """
+    flagged = set()
+    for offset in range(0, len(packets) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+        if packets[offset] != TS_SYNC_BYTE:
+            continue
+        pid = ((packets[offset + 1] & 0x1F) << 8) | packets[offset + 2]
+        if pid == NULL_PID or pid in flagged:
+            continue
+        # Adaptation field present (adaptation_field_control bit 0x20) and at least one byte long
+        if packets[offset + 3] & 0x20 and packets[offset + 4] > 0:
+            packets[offset + 5] |= 0x80
+            flagged.add(pid)
+
+
+class HLSReader:
+    """Polls an HLS playlist and yields its segments' TS payload in order"""
+
+    def __init__(self, url, user_agent):
+        self.playlist_url = url
+        self.workers = max(ConfigHelper.hls_prefetch_workers(), 1)
+        self.live_edge_segments = max(ConfigHelper.hls_live_edge_segments(), 1)
+
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': user_agent})
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.workers + 1)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hls-prefetch')
+
+        self.pending = deque()  # (media sequence, future, discontinuity) in playlist order
+        self.next_sequence = None
+        self.target_duration = 6.0
+        self.max_refresh_failures = max(ConfigHelper.hls_playlist_max_failures(), 1)
+        self.refresh_failures = 0
+        self.ended = False
+        self._discontinuity = False
+        self.closed = False
+
+    def _load(self, url):
+        response = self.session.get(url, timeout=(10, 10))
+        response.raise_for_status()
+        return m3u8.loads(response.text, uri=response.url)
+
+    def open(self):
+        """
+        Load the playlist, resolving a master playlist to its best variant, and start
+        prefetching from near the live edge. Raises HLSUnsupported for playlists
+        native ingest can't read.
+        """
+        playlist = self._load(self.playlist_url)
+        if playlist.is_variant:
+            variants = [variant for variant in playlist.playlists if variant.uri]
+            if not variants:
+                raise HLSUnsupported("master playlist has no variants")
+            best = max(variants, key=lambda variant: variant.stream_info.bandwidth or 0)
+            self.playlist_url = best.absolute_uri
+            logger.info(f"Using HLS variant with bandwidth {best.stream_info.bandwidth}: {self.playlist_url}")
+            playlist = self._load(self.playlist_url)
+
+        for segment in playlist.segments:
+            if segment.key and segment.key.method and segment.key.method.upper() != 'NONE':
+                raise HLSUnsupported(f"segments are encrypted ({segment.key.method})")
+            if getattr(segment, 'init_section', None):
+                raise HLSUnsupported("segments are fragmented MP4")
+
+        self._schedule(playlist)
+
+    def _schedule(self, playlist):
+        """Queue downloads of segments we haven't got yet"""
+        if playlist.target_duration:
+            self.target_duration = float(playlist.target_duration)
+        self.ended = bool(playlist.is_endlist)
+
+        first_sequence = playlist.media_sequence or 0
+        segments = playlist.segments
+        if not segments:
+            return
+
+        last_sequence = first_sequence + len(segments) - 1
+        if self.next_sequence is not None and last_sequence < self.next_sequence - len(segments):
+            # Media sequence went backwards - the source restarted
+            logger.warning(f"HLS media sequence went back from {self.next_sequence} to {last_sequence}, restarting at live edge")
+            self.next_sequence = None
+            self._discontinuity = True
+
+        if self.next_sequence is None:
+            start = 0 if self.ended else max(len(segments) - self.live_edge_segments, 0)
+            self.next_sequence = first_sequence + start
+
+        for position, segment in enumerate(segments):
+            sequence = first_sequence + position
+            if sequence < self.next_sequence:
+                continue
+
+            discontinuity = bool(segment.discontinuity) or self._discontinuity
+            if sequence > self.next_sequence:
+                logger.warning(f"Missed {sequence - self.next_sequence} HLS segments that left the playlist")
+                discontinuity = True
+            self._discontinuity = False
+
+            self.pending.append((sequence, self.executor.submit(self._download, segment.absolute_uri), discontinuity))
+            self.next_sequence = sequence + 1
+
+    def _download(self, url):
+        response = self.session.get(url, timeout=(10, 30))
+        response.raise_for_status()
+        return response.content
+
+    @staticmethod
+    def _packets(data, discontinuity):
+        """A segment's whole TS packets, flagged if it follows a discontinuity"""
+        view = memoryview(data)
+        start = StreamBuffer._find_packet_boundary(view)
+        if start is None:
+            return None
+        end = start + (len(view) - start) // TS_PACKET_SIZE * TS_PACKET_SIZE
+        if not discontinuity:
+            return view[start:end]
+
+        packets = bytearray(view[start:end])
+        mark_discontinuity(packets)
+        return packets
+
+    def segments(self, should_stop):
+        """Yield the TS payload of each segment in order until should_stop() or the playlist ends"""
+        next_refresh = time.time() + self.target_duration / 2
+
+        while not self.closed and not should_stop():
+            if self.pending:
+                sequence, future, discontinuity = self.pending[0]
+                try:
+                    data = future.result(timeout=max(next_refresh - time.time(), 0.1))
+                except FutureTimeout:
+                    data = None
+                except Exception as e:
+                    self.pending.popleft()
+                    self._mark_next_discontinuity()
+                    logger.warning(f"Failed to fetch HLS segment {sequence}: {e}")
+                    continue
+                else:
+                    self.pending.popleft()
+                    packets = self._packets(data, discontinuity)
+                    if packets is None:
+                        self._mark_next_discontinuity()
+                        logger.warning(f"HLS segment {sequence} holds no TS packets")
+                    else:
+                        yield packets
+                    continue
+            elif self.ended:
+                logger.info("HLS playlist ended")
+                return
+            else:
+                gevent.sleep(max(next_refresh - time.time(), 0))
+
+            if time.time() >= next_refresh:
+                self._refresh()
+                next_refresh = time.time() + max(self.target_duration / 2, 1.0)
+
+    def _refresh(self):
+        """
+        Reload the playlist and queue its new segments. A failed reload is retried on the
+        next refresh tick - segments already queued keep playing meanwhile - and only
+        max_refresh_failures failures in a row give up on the source.
+        """
+        try:
+            playlist = self._load(self.playlist_url)
+        except Exception as e:
+            self.refresh_failures += 1
+            if self.refresh_failures >= self.max_refresh_failures:
+                logger.error(f"HLS playlist refresh failed {self.refresh_failures} times in a row, giving up: {e}")
+                raise
+            logger.warning(f"HLS playlist refresh failed ({self.refresh_failures}/{self.max_refresh_failures}), "
+                           f"retrying: {e}")
+            return
+
+        self.refresh_failures = 0
+        self._schedule(playlist)
+
+    def _mark_next_discontinuity(self):
+        if self.pending:
+            sequence, future, _ = self.pending[0]
+            self.pending[0] = (sequence, future, True)
+        else:
+            self._discontinuity = True
+
+    def close(self):
+        """Stop prefetching and close connections once in-flight downloads are done with them"""
+        self.closed = True
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+        # Don't pull the session from under a download - close it after the last one finishes
+        in_flight = [future for _, future, _ in list(self.pending) if not future.done()]
+        if not in_flight:
+            self.session.close()
+            return
+
+        lock = threading.Lock()
+        remaining = [len(in_flight)]
+
+        def on_done(_):
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self.session.close()
+
+        for future in in_flight:
+            future.add_done_callback(on_done)
@@ -0,0 +1,118 @@
+"""
+Single-flight channel initialization.
+
+When a cold channel gets many requests at once, only one of them in the whole
+cluster resolves a stream and initializes the channel. That request holds the
+channel's init lock while it works and publishes the outcome on the channel's
+event channel when it's done. Every other request waits for that
+notification and then attaches to the channel (or fails with the same error)
+without touching the database or the profile's connection slots.
+
+If an initializer dies without announcing anything, its lock expires and the
+waiters try again themselves.
+"""
+
+import json
+import threading
+import time
+from gevent.event import AsyncResult
+from .config_helper import ConfigHelper
+from .constants import EventType
+from .redis_keys import RedisKeys
+from .redis_scripts import run_script, FINISH_CHANNEL_INIT
+from .utils import get_logger
+
+logger = get_logger()
+
+
+class ChannelInitFlight:
+    """Per-worker view of channel init locks and the requests waiting on them"""
+
+    # How often a waiter checks that the init lock still exists, in case no notification comes
+    LOCK_CHECK_INTERVAL = 2.0
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self._lock = threading.Lock()
+        # channel_id -> [AsyncResult of the outcome event data, waiter count]. Notifications are
+        # delivered on the worker's main hub, where the request greenlets wait on them.
+        self._waiters = {}
+
+    def try_lead(self, channel_id, holder_id):
+        """Take the channel's init lock. Returns True if this request should initialize it."""
+        ttl_ms = int(ConfigHelper.channel_init_lock_ttl() * 1000)
+        return bool(self.redis_client.set(RedisKeys.channel_init_lock(channel_id), holder_id, nx=True, px=ttl_ms))
+
+    def finish(self, channel_id, holder_id, ready, error=None, status=None, abandoned=False):
+        """
+        Release the init lock and tell the waiters how initialization went.
+        An abandoned initialization leaves the waiters to try it themselves.
+        """
+        event = json.dumps({
+            "event": EventType.CHANNEL_INIT_DONE,
+            "channel_id": channel_id,
+            "ready": ready,
+            "error": error,
+            "status": status,
+            "abandoned": abandoned,
+            "timestamp": time.time()
+        })
+        try:
+            released = run_script(self.redis_client, FINISH_CHANNEL_INIT,
+                                  [RedisKeys.channel_init_lock(channel_id)],
+                                  [holder_id, RedisKeys.events_channel(channel_id), event])
+            if not released:
+                logger.warning(f"Init lock for channel {channel_id} expired before initialization finished")
+        except Exception as e:
+            logger.error(f"Error finishing initialization of channel {channel_id}: {e}")
+
+    def waiting_channels(self):
+        """Channels with requests waiting on their initialization in this worker"""
+        with self._lock:
+            return set(self._waiters)
+
+    def notify(self, channel_id, data):
+        """Deliver an init outcome event to this worker's waiters"""
+        with self._lock:
+            waiter = self._waiters.get(channel_id)
+        if waiter and not waiter[0].ready():
+            waiter[0].set(data)
+
+    def wait(self, channel_id, timeout):
+        """
+        Wait for the channel's initializer to finish.
+        Returns its outcome event data, or None if the lock went away without
+        a notification (or the timeout passed) and the caller should retry.
+        """
+        with self._lock:
+            waiter = self._waiters.get(channel_id)
+            if waiter is None or waiter[0].ready():
+                # Fresh waiter group - a finished one's outcome belongs to an earlier flight
+                waiter = [AsyncResult(), 0]
+                self._waiters[channel_id] = waiter
+            waiter[1] += 1
+
+        outcome = waiter[0]
+        lock_key = RedisKeys.channel_init_lock(channel_id)
+        deadline = time.time() + timeout
+
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                outcome.wait(min(remaining, self.LOCK_CHECK_INTERVAL))
+                if outcome.ready():
+                    return outcome.value
+
+                # The event listener may not have subscribed yet when the outcome was
+                # published, and a dead initializer never publishes - fall back to the lock
+                if not self.redis_client.exists(lock_key):
+                    break
+
+            return outcome.value if outcome.ready() else None
+        finally:
+            with self._lock:
+                waiter[1] -= 1
+                if waiter[1] <= 0 and self._waiters.get(channel_id) is waiter:
+                    del self._waiters[channel_id]
@@ -0,0 +1,205 @@
+"""
+Adaptive channel linger.
+
+Plex, Channels DVR and HDHR clients often close a stream and reopen it a few
+seconds later. Tearing the upstream down in between costs a provider
+connection slot and a full reconnect. Instead, when a channel's last client
+leaves, the owner keeps the channel alive for about as long as its clients
+have recently taken to come back. Each channel's history of reconnect gaps is
+kept outside the channel namespace so it survives restarts.
+
+Lingering is bounded by the channel's M3U profile: while the channel holds
+the profile's last free slot it lingers for at most
+CHANNEL_LINGER_FULL_PROFILE_MAX. A request that finds every slot taken asks
+the owner of the longest-lingering channel on a matching profile to give its
+slot up right away.
+"""
+
+import json
+import time
+from .config_helper import ConfigHelper
+from .constants import ChannelMetadataField, EventType
+from .events import publish_owner_event
+from .redis_keys import RedisKeys
+from .redis_scripts import run_script, RECORD_CHANNEL_JOIN
+from .utils import get_logger
+
+logger = get_logger()
+
+# Reconnect history is kept for a day after the channel was last used
+HISTORY_TTL = 86400
+
+# Lingering covers this share of recent reconnect gaps, plus some slack
+GAP_PERCENTILE = 0.9
+GAP_MARGIN = 1.25
+GAP_SLACK = 1.0
+
+
+def channel_profile_ids(channel):
+    """IDs of the active M3U profiles a channel's streams can be served through"""
+    if not hasattr(channel, 'streams'):
+        return set()
+
+    profile_ids = set()
+    for stream in channel.streams.all():
+        if stream.m3u_account:
+            profile_ids.update(profile.id for profile in stream.m3u_account.profiles.all() if profile.is_active)
+    return profile_ids
+
+
+class LingerPolicy:
+    """Linger delays learned from a channel's reconnect history"""
+
+    @staticmethod
+    def record_join(redis_client, channel_id):
+        """Record a client joining a channel. Returns the reconnect gap in seconds, or None."""
+        if not ConfigHelper.channel_linger_enabled():
+            return None
+
+        keys = [
+            RedisKeys.linger_state(channel_id),
+            RedisKeys.linger_history(channel_id),
+            RedisKeys.lingering_channels(),
+        ]
+        args = [time.time(), ConfigHelper.channel_linger_max(), ConfigHelper.channel_linger_history(),
+                HISTORY_TTL, channel_id]
+        try:
+            gap = float(run_script(redis_client, RECORD_CHANNEL_JOIN, keys, args))
+        except Exception as e:
+            logger.error(f"Error recording join of channel {channel_id}: {e}")
+            return None
+
+        if gap < 0:
+            return None
+        logger.debug(f"Channel {channel_id} got a client back after {gap:.1f}s")
+        return gap
+
+    @staticmethod
+    def learned_delay(redis_client, channel_id):
+        """Linger delay from the channel's reconnect history alone, or 0 if it shouldn't linger"""
+        samples = []
+        for value in redis_client.lrange(RedisKeys.linger_history(channel_id), 0, -1):
+            try:
+                samples.append(float(value))
+            except (ValueError, TypeError):
+                continue
+
+        gaps = sorted(sample for sample in samples if sample >= 0)
+        if len(gaps) < 2 or len(gaps) < len(samples) * ConfigHelper.channel_linger_min_return_rate():
+            return 0
+
+        gap = gaps[min(int(len(gaps) * GAP_PERCENTILE), len(gaps) - 1)]
+        return gap * GAP_MARGIN + GAP_SLACK
+
+    @staticmethod
+    def _profile_is_full(redis_client, profile_id):
+        """Whether an M3U profile has no free connection slot left"""
+        from apps.m3u.models import M3UAccountProfile
+
+        try:
+            max_streams = M3UAccountProfile.objects.get(id=profile_id).max_streams
+        except M3UAccountProfile.DoesNotExist:
+            return False
+        if not max_streams:
+            return False
+        return int(redis_client.get(f"profile_connections:{profile_id}") or 0) >= max_streams
+
+    @staticmethod
+    def linger_delay(redis_client, channel_id, profile_id=None):
+        """How long a channel should stay up after its last client left"""
+        base_delay = ConfigHelper.channel_shutdown_delay()
+        if not ConfigHelper.channel_linger_enabled() or not redis_client:
+            return base_delay
+
+        try:
+            delay = min(LingerPolicy.learned_delay(redis_client, channel_id), ConfigHelper.channel_linger_max())
+            if delay > base_delay and profile_id and LingerPolicy._profile_is_full(redis_client, profile_id):
+                delay = min(delay, ConfigHelper.channel_linger_full_profile_max())
+        except Exception as e:
+            logger.error(f"Error computing linger delay for channel {channel_id}: {e}")
+            return base_delay
+
+        return max(delay, base_delay)
+
+    @staticmethod
+    def on_last_client_left(redis_client, channel_id):
+        """
+        Record that a channel's last client left and choose its linger delay.
+        Returns the delay in seconds.
+        """
+        profile_id = redis_client.hget(RedisKeys.channel_metadata(channel_id), ChannelMetadataField.M3U_PROFILE)
+        profile_id = profile_id.decode('utf-8') if profile_id else None
+        delay = LingerPolicy.linger_delay(redis_client, channel_id, profile_id)
+
+        if not ConfigHelper.channel_linger_enabled():
+            return delay
+
+        state_key = RedisKeys.linger_state(channel_id)
+        pipe = redis_client.pipeline()
+        pipe.hsetnx(state_key, 'left_at', time.time())
+        pipe.hset(state_key, 'delay', delay)
+        pipe.expire(state_key, HISTORY_TTL)
+        if delay > 0:
+            LingerPolicy.park(pipe, channel_id, profile_id)
+        pipe.execute()
+
+        if delay > ConfigHelper.channel_shutdown_delay():
+            logger.info(f"Channel {channel_id} lingering for up to {delay:.1f}s for returning clients")
+        return delay
+
+    @staticmethod
+    def park(redis_client, channel_id, profile_id):
+        """
+        Offer a channel without clients up for release when its M3U profile's slots
+        are needed (works on clients and pipelines). Keeps an existing offer's age.
+        """
+        if profile_id:
+            redis_client.hsetnx(RedisKeys.lingering_channels(), channel_id,
+                                json.dumps({'profile_id': str(profile_id), 'since': time.time()}))
+
+    @staticmethod
+    def current_delay(redis_client, channel_id):
+        """Linger delay chosen when the channel's last client left, or the shutdown delay"""
+        if ConfigHelper.channel_linger_enabled() and redis_client:
+            delay = redis_client.hget(RedisKeys.linger_state(channel_id), 'delay')
+            if delay:
+                return float(delay)
+        return ConfigHelper.channel_shutdown_delay()
+
+    @staticmethod
+    def forget(redis_client, channel_id):
+        """Stop tracking a channel as lingering (its history is kept)"""
+        redis_client.hdel(RedisKeys.lingering_channels(), channel_id)
+        redis_client.hdel(RedisKeys.linger_state(channel_id), 'delay')
+
+    @staticmethod
+    def release_slot(redis_client, profile_ids):
+        """
+        Ask the longest-lingering channel on one of profile_ids to stop and free
+        its slot. Returns the channel ID, or None if no such channel lingers.
+        """
+        if not profile_ids:
+            return None
+
+        profile_ids = {str(profile_id) for profile_id in profile_ids}
+        candidates = []
+        for channel_id, value in redis_client.hgetall(RedisKeys.lingering_channels()).items():
+            try:
+                entry = json.loads(value)
+            except (ValueError, TypeError):
+                continue
+            if str(entry.get('profile_id')) in profile_ids:
+                candidates.append((entry.get('since', 0), channel_id.decode('utf-8')))
+
+        for _, channel_id in sorted(candidates):
+            # Whoever removes the entry gets the slot
+            if redis_client.hdel(RedisKeys.lingering_channels(), channel_id):
+                publish_owner_event(redis_client, channel_id, {
+                    "event": EventType.LINGER_RELEASE,
+                    "channel_id": channel_id,
+                    "timestamp": time.time()
+                })
+                logger.info(f"Asked lingering channel {channel_id} to free its M3U profile slot")
+                return channel_id
+
+        return None
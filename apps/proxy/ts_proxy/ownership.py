@@ -0,0 +1,84 @@
+"""
+Lease-based channel ownership.
+
+The owner key holds the owning worker's ID with a TTL. Acquire, extend and
+release are single compare-and-set Lua scripts, and every new lease gets a
+fencing token from a per-channel counter that only ever increases. The owner
+stamps its buffer writes with that token, so a worker that lost its lease
+(e.g. after a long stall) can't write chunks over a newer owner's.
+
+Next to the lease the owner keeps a short-lived heartbeat key. The lease TTL
+is generous so a busy owner doesn't lose its channels, while the heartbeat
+lets a standby worker notice a dead owner within a couple of seconds and
+take the lease over.
+"""
+
+from .config_helper import ConfigHelper
+from .redis_keys import RedisKeys
+from .redis_scripts import run_script, ACQUIRE_LEASE, EXTEND_LEASE, TAKE_OVER_LEASE, RELEASE_LEASE
+from .utils import get_logger
+
+logger = get_logger()
+
+# The fence counter must outlive any lease so tokens never go backwards. Every acquire,
+# extend and take-over refreshes its TTL, so it only expires a day after the channel's
+# last owner is gone.
+FENCE_TTL = 86400
+
+
+class ChannelLease:
+    """Channel ownership lease operations (each one a single Redis round trip)"""
+
+    @staticmethod
+    def _lease_keys(channel_id):
+        return [
+            RedisKeys.channel_owner(channel_id),
+            RedisKeys.channel_fence(channel_id),
+            RedisKeys.owner_heartbeat(channel_id),
+        ]
+
+    @staticmethod
+    def _heartbeat_ttl_ms():
+        # Refreshes only wait on a single pipeline, so a few missed intervals leave a wide margin
+        ttl = max(ConfigHelper.owner_heartbeat_ttl(), ConfigHelper.owner_heartbeat_interval() * 4)
+        return int(ttl * 1000)
+
+    @staticmethod
+    def acquire(redis_client, channel_id, worker_id, ttl=30):
+        """
+        Acquire or re-acquire ownership of a channel for ttl seconds.
+        Returns the lease's fencing token, or 0 if another worker owns the channel.
+        """
+        args = [worker_id, int(ttl * 1000), FENCE_TTL, ChannelLease._heartbeat_ttl_ms()]
+        return int(run_script(redis_client, ACQUIRE_LEASE, ChannelLease._lease_keys(channel_id), args))
+
+    @staticmethod
+    def extend(redis_client, channel_id, worker_id, ttl=30):
+        """
+        Extend this worker's lease by ttl seconds and refresh its heartbeat
+        (works on clients and pipelines).
+        Returns the current fencing token, or 0 if the lease was lost.
+        """
+        args = [worker_id, int(ttl * 1000), ChannelLease._heartbeat_ttl_ms(), FENCE_TTL]
+        return run_script(redis_client, EXTEND_LEASE, ChannelLease._lease_keys(channel_id), args)
+
+    @staticmethod
+    def take_over(redis_client, channel_id, worker_id, previous_owner, ttl=30, only_if_dead=True):
+        """
+        Take the lease from previous_owner - by default only if its heartbeat has
+        expired, otherwise as a handoff from a live owner.
+        Returns the new fencing token, or 0 if the lease couldn't be taken.
+        """
+        args = [worker_id, int(ttl * 1000), FENCE_TTL, ChannelLease._heartbeat_ttl_ms(), previous_owner,
+                '1' if only_if_dead else '0']
+        return int(run_script(redis_client, TAKE_OVER_LEASE, ChannelLease._lease_keys(channel_id), args))
+
+    @staticmethod
+    def release(redis_client, channel_id, worker_id, stop_ttl=30):
+        """Release this worker's lease and set the channel's stopping flag. Returns True if released."""
+        keys = [
+            RedisKeys.channel_owner(channel_id),
+            RedisKeys.channel_stopping(channel_id),
+            RedisKeys.owner_heartbeat(channel_id),
+        ]
+        return bool(run_script(redis_client, RELEASE_LEASE, keys, [worker_id, stop_ttl]))
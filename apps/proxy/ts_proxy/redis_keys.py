@@ -19,6 +19,21 @@ class RedisKeys:
         """Key for specific buffer chunk"""
         return f"ts_proxy:channel:{channel_id}:buffer:chunk:{chunk_index}"
 
+    @staticmethod
+    def buffer_stream(channel_id):
+        """Key for the Redis Stream holding buffer chunks (stream buffer backend)"""
+        return f"ts_proxy:channel:{channel_id}:buffer:stream"
+
+    @staticmethod
+    def buffer_join_points(channel_id):
+        """Sorted set of keyframe join points (member "index:offset:has_psi", score = chunk index)"""
+        return f"ts_proxy:channel:{channel_id}:buffer:joins"
+
+    @staticmethod
+    def buffer_psi(channel_id):
+        """Key for the latest PAT + PMT packets of the channel's stream"""
+        return f"ts_proxy:channel:{channel_id}:buffer:psi"
+
     @staticmethod
     def buffer_chunk_prefix(channel_id):
         """Prefix for buffer chunks"""
@@ -49,9 +64,73 @@ class RedisKeys:
         """Key for storing channel owner worker ID"""
         return f"ts_proxy:channel:{channel_id}:owner"
 
+    @staticmethod
+    def owner_heartbeat(channel_id):
+        """Short-lived key refreshed by the channel owner while it is alive"""
+        return f"ts_proxy:channel:{channel_id}:owner_heartbeat"
+
+    @staticmethod
+    def channel_fence(channel_id):
+        """
+        Counter of ownership fencing tokens. Lives outside the channel namespace
+        so tokens keep increasing across channel restarts.
+        """
+        return f"ts_proxy:fence:{channel_id}"
+
+    @staticmethod
+    def channel_init_lock(channel_id):
+        """
+        Key held by the one request initializing a cold channel. Lives outside the
+        channel namespace so cleaning up a failed channel doesn't drop the lock.
+        """
+        return f"ts_proxy:init_lock:{channel_id}"
+
+    @staticmethod
+    def linger_history(channel_id):
+        """
+        List of a channel's recent reconnect gaps in seconds (-1 for disconnects nobody came
+        back from). Lives outside the channel namespace so it survives channel restarts.
+        """
+        return f"ts_proxy:linger:{channel_id}:history"
+
+    @staticmethod
+    def linger_state(channel_id):
+        """Hash with the time a channel's last client left and the linger delay chosen then"""
+        return f"ts_proxy:linger:{channel_id}:state"
+
+    @staticmethod
+    def lingering_channels():
+        """Hash of channel ID -> JSON {profile_id, since} for channels lingering without clients"""
+        return "ts_proxy:lingering"
+
+    @staticmethod
+    def warm_channels():
+        """Hash of channel ID -> time warmed for channels kept up without viewers"""
+        return "ts_proxy:warm_pool:channels"
+
+    @staticmethod
+    def channel_views():
+        """Sorted set of channel IDs scored by (decaying) recent viewing"""
+        return "ts_proxy:warm_pool:views"
+
+    @staticmethod
+    def warm_pool_leader():
+        """Key held by the worker managing the warm channel pool"""
+        return "ts_proxy:warm_pool:leader"
+
+    @staticmethod
+    def warm_pool_last_decay():
+        """Time viewing history was last decayed, shared by whichever worker leads the pool"""
+        return "ts_proxy:warm_pool:last_decay"
+
+    @staticmethod
+    def upstream_sessions():
+        """Hash of upstream session key -> ID of the channel pulling that upstream"""
+        return "ts_proxy:upstreams"
+
     @staticmethod
     def clients(channel_id):
-        """Key for set of client IDs"""
+        """Key for sorted set of client IDs scored by last activity time"""
         return f"ts_proxy:channel:{channel_id}:clients"
 
     @staticmethod
@@ -74,6 +153,21 @@ class RedisKeys:
         """Key for stream switch status"""
         return f"ts_proxy:channel:{channel_id}:switch_status"
 
+    @staticmethod
+    def worker_control(worker_id):
+        """PubSub channel for events directed at a single worker"""
+        return f"ts_proxy:worker:{worker_id}:control"
+
+    @staticmethod
+    def nodes():
+        """Hash of node ID -> JSON {url, updated_at} for cluster nodes"""
+        return "ts_proxy:nodes"
+
+    @staticmethod
+    def workers():
+        """Hash of worker ID -> JSON load stats for every live worker"""
+        return "ts_proxy:workers"
+
     @staticmethod
     def worker_heartbeat(worker_id):
         """Key for worker heartbeat"""
@@ -0,0 +1,223 @@
+"""
+Lua scripts used by the TS proxy.
+
+Scripts let hot paths do several reads or a check-and-set in one Redis round
+trip. They are registered lazily and run through redis-py's Script objects,
+which use EVALSHA and transparently reload the script if Redis lost it.
+"""
+
+from .utils import get_logger
+
+logger = get_logger()
+
+# Per-iteration check for a streaming client.
+# KEYS: channel stopping key, channel metadata hash, client stop key
+# ARGV: metadata state field
+# Returns: {stopping (0/1), channel state ('' if unknown), client stop (0/1)}
+CHECK_CLIENT_RESOURCES = """
+local stopping = redis.call('EXISTS', KEYS[1])
+local state = redis.call('HGET', KEYS[2], ARGV[1])
+local client_stop = redis.call('EXISTS', KEYS[3])
+return {stopping, state or '', client_stop}
+"""
+
+# Heartbeat for every local client of a worker, with ghost detection.
+# KEYS: (client metadata hash, channel client registry) pairs, one pair per client
+# ARGV: now, ghost timeout (s), client record TTL (s), then one client ID per key pair
+# Clients whose record is gone or hasn't been active within the ghost timeout
+# are not refreshed. Returns the 1-based positions of those clients.
+CLIENT_HEARTBEAT = """
+local now = tonumber(ARGV[1])
+local ghost_timeout = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local ghosts = {}
+local position = 0
+for i = 1, #KEYS, 2 do
+    position = position + 1
+    local client_id = ARGV[3 + position]
+    local last_active = redis.call('HGET', KEYS[i], 'last_active')
+    if (not last_active) or (now - tonumber(last_active) > ghost_timeout) then
+        table.insert(ghosts, position)
+    else
+        redis.call('HSET', KEYS[i], 'last_active', ARGV[1])
+        redis.call('EXPIRE', KEYS[i], ttl)
+        redis.call('ZADD', KEYS[i + 1], now, client_id)
+        redis.call('EXPIRE', KEYS[i + 1], ttl)
+    end
+end
+return ghosts
+"""
+
+# Acquire (or re-acquire) channel ownership.
+# KEYS: channel owner key, channel fence key, owner heartbeat key
+# ARGV: worker ID, lease TTL (ms), fence key TTL (s), heartbeat TTL (ms)
+# Returns the fencing token of the lease, or 0 if another worker holds it.
+# A new lease always gets a higher token than any earlier one.
+ACQUIRE_LEASE = """
+local owner = redis.call('GET', KEYS[1])
+if owner and owner ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+redis.call('SET', KEYS[3], ARGV[1], 'PX', ARGV[4])
+local token = redis.call('GET', KEYS[2])
+if (not owner) or (not token) then
+    token = redis.call('INCR', KEYS[2])
+end
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return tonumber(token)
+"""
+
+# Extend a lease held by this worker and refresh its heartbeat.
+# KEYS: channel owner key, channel fence key, owner heartbeat key
+# ARGV: worker ID, lease TTL (ms), heartbeat TTL (ms), fence key TTL (s)
+# Returns the current fencing token, or 0 if the lease is held by someone else or gone.
+# The fence key's TTL is refreshed too, so it can't expire under a long-running owner.
+EXTEND_LEASE = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+redis.call('SET', KEYS[3], ARGV[1], 'PX', ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return tonumber(redis.call('GET', KEYS[2]) or '0')
+"""
+
+# Take over the lease of another worker - one whose heartbeat has expired,
+# or one handing the channel over while it drains.
+# KEYS: channel owner key, channel fence key, owner heartbeat key
+# ARGV: worker ID, lease TTL (ms), fence key TTL (s), heartbeat TTL (ms), expected owner,
+#       '1' to only take over if the owner's heartbeat has expired
+# Returns the new fencing token, or 0 if the owner changed (or is still alive when required).
+TAKE_OVER_LEASE = """
+if redis.call('GET', KEYS[1]) ~= ARGV[5] then
+    return 0
+end
+if ARGV[6] == '1' and redis.call('EXISTS', KEYS[3]) == 1 then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+redis.call('SET', KEYS[3], ARGV[1], 'PX', ARGV[4])
+local token = redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return token
+"""
+
+# Release a lease held by this worker and signal the channel's clients to stop.
+# KEYS: channel owner key, channel stopping key, owner heartbeat key
+# ARGV: worker ID, stopping key TTL (s)
+# Returns 1 if the lease was released, 0 if this worker didn't hold it.
+RELEASE_LEASE = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[3])
+redis.call('SETEX', KEYS[2], ARGV[2], 'true')
+return 1
+"""
+
+# Write a buffer chunk unless a newer owner has taken over the channel.
+# KEYS: channel fence key, buffer index key, chunk key prefix
+# ARGV: fencing token, chunk TTL (s), chunk data
+# Returns the new chunk index, or -1 if the token is stale.
+# The chunk key is the prefix plus the new index, which isn't known before the call, so
+# it isn't declared itself. The script is therefore not safe for Redis Cluster, where
+# the chunk key could live in another slot than the declared keys.
+FENCED_CHUNK_WRITE = """
+if tonumber(ARGV[1]) < tonumber(redis.call('GET', KEYS[1]) or '0') then
+    return -1
+end
+local index = redis.call('INCR', KEYS[2])
+redis.call('SETEX', KEYS[3] .. index, ARGV[2], ARGV[3])
+return index
+"""
+
+# Stream buffer variant of FENCED_CHUNK_WRITE.
+# KEYS: channel fence key, buffer index key, buffer stream key
+# ARGV: fencing token, stream max length, stream TTL (s), chunk field, chunk data
+# Returns the new chunk index, or -1 if the token is stale.
+FENCED_STREAM_WRITE = """
+if tonumber(ARGV[1]) < tonumber(redis.call('GET', KEYS[1]) or '0') then
+    return -1
+end
+local index = redis.call('INCR', KEYS[2])
+redis.call('XADD', KEYS[3], 'MAXLEN', '~', ARGV[2], index .. '-0', ARGV[4], ARGV[5])
+redis.call('EXPIRE', KEYS[3], ARGV[3])
+return index
+"""
+
+# Release a channel's init lock held by this initializer and announce the outcome.
+# KEYS: channel init lock key
+# ARGV: holder ID, channel event channel, outcome event (JSON)
+# Returns 1 if the lock was released, 0 if it had expired or been taken by someone else.
+# The outcome is published either way - waiters only act on it once.
+FINISH_CHANNEL_INIT = """
+local released = 0
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    released = 1
+end
+redis.call('PUBLISH', ARGV[2], ARGV[3])
+return released
+"""
+
+# Record a client joining a channel in its linger history.
+# KEYS: linger state hash, linger history list, lingering channels hash
+# ARGV: now, longest linger (s), history length, history TTL (s), channel ID
+# If the channel's clients had all left, the gap (or -1 if longer than the longest
+# linger) is pushed onto the history. Returns the gap in seconds, or -1.
+RECORD_CHANNEL_JOIN = """
+redis.call('HDEL', KEYS[3], ARGV[5])
+local left_at = redis.call('HGET', KEYS[1], 'left_at')
+if not left_at then
+    return -1
+end
+redis.call('HDEL', KEYS[1], 'left_at', 'delay')
+local gap = tonumber(ARGV[1]) - tonumber(left_at)
+local sample = gap
+if gap > tonumber(ARGV[2]) then
+    sample = -1
+end
+redis.call('LPUSH', KEYS[2], tostring(sample))
+redis.call('LTRIM', KEYS[2], 0, tonumber(ARGV[3]) - 1)
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return tostring(sample)
+"""
+
+# Acquire or refresh a lock held by a single worker.
+# KEYS: lock key
+# ARGV: holder ID, lock TTL (ms)
+# Returns 1 if the caller holds the lock, 0 if someone else does.
+HOLD_LOCK = """
+local holder = redis.call('GET', KEYS[1])
+if holder and holder ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return 1
+"""
+
+# Delete a hash field only if it still has the expected value.
+# KEYS: hash key
+# ARGV: field, expected value
+# Returns 1 if the field was deleted.
+COMPARE_AND_HDEL = """
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+return redis.call('HDEL', KEYS[1], ARGV[1])
+"""
+
+_scripts = {}
+
+
+def run_script(redis_client, source, keys=None, args=None):
+    """
+    Run a Lua script on redis_client, registering it on first use.
+    redis_client may be a pipeline, in which case the result comes from execute().
+    """
+    script = _scripts.get(source)
+    if script is None:
+        script = redis_client.register_script(source)
+        _scripts[source] = script
+    return script(keys=keys or [], args=args or [], client=redis_client)
@@ -0,0 +1,145 @@
+"""
+Redis Streams backed buffer for TS chunks.
+
+Stores a channel's chunks as entries of a single Redis Stream (XADD with
+approximate MAXLEN trimming) instead of one key per chunk, and lets clients
+block on XREAD so they wake as soon as a new chunk is written rather than
+polling the buffer index with a sleep/backoff loop.
+"""
+
+import gevent
+from .stream_buffer import StreamBuffer
+from .redis_keys import RedisKeys
+from .redis_scripts import run_script, FENCED_STREAM_WRITE
+from .config_helper import ConfigHelper
+from .utils import get_logger, run_blocking
+
+logger = get_logger()
+
+# Field holding the chunk payload in each stream entry
+CHUNK_FIELD = b'data'
+
+
+class RedisStreamBuffer(StreamBuffer):
+    """StreamBuffer variant using a per-channel Redis Stream with blocking reads"""
+
+    # Reads wait for new data server-side, so callers shouldn't add their own backoff
+    blocking_reads = True
+
+    def __init__(self, channel_id=None, redis_client=None):
+        super().__init__(channel_id=channel_id, redis_client=redis_client)
+        self.stream_key = RedisKeys.buffer_stream(channel_id) if channel_id else ""
+        self.stream_maxlen = ConfigHelper.buffer_stream_maxlen()
+        self.block_ms = ConfigHelper.buffer_stream_block_ms()
+
+    @staticmethod
+    def _entry_index(entry_id):
+        """Chunk index encoded in a stream entry ID ("<index>-0")"""
+        if isinstance(entry_id, bytes):
+            entry_id = entry_id.decode('utf-8')
+        return int(entry_id.split('-', 1)[0])
+
+    def _write_to_redis(self, chunk_data):
+        """Append a chunk to the channel stream. Returns its index, or None if the write was fenced off."""
+        if self.fencing_token is not None:
+            chunk_index = run_script(self.redis_client, FENCED_STREAM_WRITE,
+                                     [self.fence_key, self.buffer_index_key, self.stream_key],
+                                     [self.fencing_token, self.stream_maxlen, self.chunk_ttl, CHUNK_FIELD, chunk_data])
+            return chunk_index if chunk_index > 0 else None
+
+        # Keep the index key so status reporting and new readers can find the head cheaply
+        chunk_index = self.redis_client.incr(self.buffer_index_key)
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.xadd(self.stream_key, {CHUNK_FIELD: chunk_data}, id=f"{chunk_index}-0",
+                  maxlen=self.stream_maxlen, approximate=True)
+        pipe.expire(self.stream_key, self.chunk_ttl)
+        pipe.execute()
+        return chunk_index
+
+    def _fetch_from_redis(self, start_id, offsets):
+        """Fetch chunks start_id + offset for each offset with a single XRANGE"""
+        wanted = {start_id + offset: i for i, offset in enumerate(offsets)}
+        results = [None] * len(offsets)
+
+        entries = self.redis_client.xrange(self.stream_key,
+                                           min=f"{start_id + offsets[0]}-0",
+                                           max=f"{start_id + offsets[-1]}-0")
+        for entry_id, fields in entries:
+            i = wanted.get(self._entry_index(entry_id))
+            if i is not None:
+                results[i] = fields.get(CHUNK_FIELD)
+
+        return results
+
+    def _read_local(self, client_index, max_chunks):
+        """Read consecutive chunks after client_index from the chunk cache or shared-memory ring"""
+        ring = self._get_read_ring()
+        chunks = []
+
+        idx = client_index + 1
+        while len(chunks) < max_chunks:
+            data = self.chunk_cache.get(self.channel_id, idx)
+            if data is None and ring:
+                data = ring.read(idx)
+                if data is not None:
+                    self.chunk_cache.put(self.channel_id, idx, data)
+            if data is None:
+                break
+            chunks.append(data)
+            idx += 1
+
+        return chunks
+
+    def _blocking_xread(self, client_index, count):
+        """XREAD BLOCK without stalling the gevent hub"""
+        def xread():
+            return self.redis_client.xread({self.stream_key: f"{client_index}-0"},
+                                           count=count, block=self.block_ms)
+
+        return run_blocking('buffer_stream_read', ConfigHelper.buffer_stream_read_threads(), xread)
+
+    def get_optimized_client_data(self, client_index):
+        """
+        Get the next chunks after client_index, waiting up to block_ms for new data.
+        If the client has fallen behind the trimmed stream it resumes at the oldest
+        retained chunk.
+        """
+        MAX_CHUNKS = 20  # Same per-call cap as the key-per-chunk buffer
+
+        if not self.redis_client:
+            gevent.sleep(self.block_ms / 1000.0)
+            return [], client_index
+
+        try:
+            # Clients of the same worker or host can usually be served without Redis
+            chunks = self._read_local(client_index, MAX_CHUNKS)
+            if chunks:
+                next_index = client_index + len(chunks)
+                if next_index > self.index:
+                    self.index = next_index
+                return chunks, next_index
+
+            response = self._blocking_xread(client_index, MAX_CHUNKS)
+            if not response:
+                return [], client_index
+
+            _, entries = response[0]
+            chunks = []
+            for entry_id, fields in entries:
+                data = fields.get(CHUNK_FIELD)
+                if data:
+                    self.chunk_cache.put(self.channel_id, self._entry_index(entry_id), data)
+                    chunks.append(data)
+            next_index = self._entry_index(entries[-1][0])
+
+            if next_index > self.index:
+                self.index = next_index
+
+            return chunks, next_index
+
+        except Exception as e:
+            logger.error(f"Error reading from buffer stream for channel {self.channel_id}: {e}", exc_info=True)
+            # Callers don't back off for blocking buffers, so avoid spinning on errors
+            gevent.sleep(self.block_ms / 1000.0)
+            return [], client_index
@@ -8,14 +8,16 @@ Handles live TS stream proxying with support for:
 """
 
 import threading
+import collections
 import logging
-import socket
 import random
+import signal
 import time
 import sys
 import os
 import json
 import gevent  # Add gevent import
+import psutil
 from typing import Dict, Optional, Set
 from apps.proxy.config import TSConfig as Config
 from apps.channels.models import Channel, Stream
@@ -23,14 +25,40 @@ from core.utils import RedisClient
 from redis.exceptions import ConnectionError, TimeoutError
 from .stream_manager import StreamManager
 from .stream_buffer import StreamBuffer
+from .chunk_cache import ChunkCache
+from .fanout import ChannelFanout
+from .client_stats import ClientStatsAggregator
+from .client_registry import ClientRegistry
+from .events import publish_channel_event, publish_worker_event
 from .client_manager import ClientManager
+from .ownership import ChannelLease
+from .worker_registry import WorkerRegistry
+from .init_flight import ChannelInitFlight
+from .linger import LingerPolicy
+from .warm_pool import WarmPool, WarmPoolManager
+from .upstream_registry import UpstreamRegistry
+from .cluster import NodeRegistry, local_node_id, local_node_url
 from .redis_keys import RedisKeys
-from .constants import ChannelState, EventType, StreamType
+from .constants import ChannelState, ChannelMetadataField, EventType, StreamType
 from .config_helper import ConfigHelper
 from .utils import get_logger
 
 logger = get_logger()
 
+# Per-channel reads of the cleanup cycle, queued in this order on one pipeline.
+# Each entry is (state field, queue function); add new reads here rather than
+# indexing into the pipeline results by hand.
+CHANNEL_STATE_READS = (
+    ('owner', lambda pipe, channel_id, now: pipe.get(RedisKeys.channel_owner(channel_id))),
+    ('metadata', lambda pipe, channel_id, now: pipe.hgetall(RedisKeys.channel_metadata(channel_id))),
+    ('total_clients', lambda pipe, channel_id, now: ClientRegistry.count(pipe, channel_id, now)),
+    ('disconnect_time', lambda pipe, channel_id, now: pipe.get(RedisKeys.last_client_disconnect(channel_id))),
+    ('stopping', lambda pipe, channel_id, now: pipe.exists(RedisKeys.channel_stopping(channel_id))),
+    ('owner_alive', lambda pipe, channel_id, now: pipe.exists(RedisKeys.owner_heartbeat(channel_id))),
+    ('linger_delay', lambda pipe, channel_id, now: pipe.hget(RedisKeys.linger_state(channel_id), 'delay')),
+    ('warm', lambda pipe, channel_id, now: pipe.hexists(RedisKeys.warm_channels(), channel_id)),
+)
+
 class ProxyServer:
     """Manages TS proxy server instance with worker coordination"""
     _instance = None
@@ -52,13 +80,15 @@ class ProxyServer:
         self.stream_managers = {}
         self.stream_buffers = {}
         self.client_managers = {}
+        self.fencing_tokens = {}  # channel_id -> fencing token of the ownership leases we hold
+        self.pending_handoffs = set()  # Channels we're connecting upstream for before taking them over
+        self.draining = False
 
-        # Generate a unique worker ID
-        import socket
+        # Generate a unique worker ID - prefixed with the node ID so other nodes can find us
         import os
         pid = os.getpid()
-        hostname = socket.gethostname()
-        self.worker_id = f"{hostname}:{pid}"
+        self.node_id = local_node_id()
+        self.worker_id = f"{self.node_id}:{pid}"
 
         # Connect to Redis - use dedicated client for proxy
         self.redis_client = None
@@ -80,13 +110,24 @@ class ProxyServer:
             logger.error(f"Failed to initialize Redis: {e}")
             self.redis_client = None
 
+        self.init_flight = ChannelInitFlight(self.redis_client)
+
         # Start cleanup thread
         self.cleanup_interval = getattr(Config, 'CLEANUP_INTERVAL', 60)
         self._start_cleanup_thread()
 
+        # Leases and owner heartbeats are refreshed on their own so a slow cleanup cycle can't expire them
+        self._start_lease_refresh_thread()
+
         # Start event listener for Redis pubsub messages
+        self._start_event_dispatcher()
         self._start_event_listener()
 
+        self.warm_pool = WarmPoolManager(self)
+        self.warm_pool.start()
+
+        self._register_drain_hook()
+
     def _setup_redis_connection(self):
         """Setup Redis connection with retry logic"""
         # Try to use get_redis_client utility instead of direct connection
@@ -162,171 +203,25 @@ class ProxyServer:
                     # Test connection before subscribing
                     pubsub_client.ping()
 
-                    # Create a pubsub instance from the client
+                    # Owner-directed events arrive on this worker's control channel, channel
+                    # events only for channels this worker has local resources for
                     pubsub = pubsub_client.pubsub()
-                    pubsub.psubscribe("ts_proxy:events:*")
+                    pubsub.subscribe(RedisKeys.worker_control(self.worker_id))
+                    subscribed_channels = set()
 
                     logger.info(f"Started Redis event listener for client activity")
 
                     # Reset retry count on successful connection
                     retry_count = 0
 
-                    for message in pubsub.listen():
-                        if message["type"] != "pmessage":
-                            continue
+                    while True:
+                        self._sync_event_subscriptions(pubsub, subscribed_channels)
 
-                        try:
-                            channel = message["channel"].decode("utf-8")
-                            data = json.loads(message["data"].decode("utf-8"))
-
-                            event_type = data.get("event")
-                            channel_id = data.get("channel_id")
-
-                            if channel_id and event_type:
-                                # For owner, update client status immediately
-                                if self.am_i_owner(channel_id):
-                                    if event_type == EventType.CLIENT_CONNECTED:
-                                        logger.debug(f"Owner received {EventType.CLIENT_CONNECTED} event for channel {channel_id}")
-                                        # Reset any disconnect timer
-                                        disconnect_key = RedisKeys.last_client_disconnect(channel_id)
-                                        self.redis_client.delete(disconnect_key)
-
-                                    elif event_type == EventType.CLIENT_DISCONNECTED:
-                                        logger.debug(f"Owner received {EventType.CLIENT_DISCONNECTED} event for channel {channel_id}")
-                                        # Check if any clients remain
-                                        if channel_id in self.client_managers:
-                                            # VERIFY REDIS CLIENT COUNT DIRECTLY
-                                            client_set_key = RedisKeys.clients(channel_id)
-                                            total = self.redis_client.scard(client_set_key) or 0
-
-                                            if total == 0:
-                                                logger.debug(f"No clients left after disconnect event - stopping channel {channel_id}")
-                                                # Set the disconnect timer for other workers to see
-                                                disconnect_key = RedisKeys.last_client_disconnect(channel_id)
-                                                self.redis_client.setex(disconnect_key, 60, str(time.time()))
-
-                                                # Get configured shutdown delay or default
-                                                shutdown_delay = getattr(Config, 'CHANNEL_SHUTDOWN_DELAY', 0)
-
-                                                if shutdown_delay > 0:
-                                                    logger.info(f"Waiting {shutdown_delay}s before stopping channel...")
-                                                    gevent.sleep(shutdown_delay)  # REPLACE: time.sleep(shutdown_delay)
-
-                                                    # Re-check client count before stopping
-                                                    total = self.redis_client.scard(client_set_key) or 0
-                                                    if total > 0:
-                                                        logger.info(f"New clients connected during shutdown delay - aborting shutdown")
-                                                        self.redis_client.delete(disconnect_key)
-                                                        return
-
-                                                # Stop the channel directly
-                                                self.stop_channel(channel_id)
-
-
-                                    elif event_type == EventType.STREAM_SWITCH:
-                                        logger.info(f"Owner received {EventType.STREAM_SWITCH} request for channel {channel_id}")
-                                        # Handle stream switch request
-                                        new_url = data.get("url")
-                                        user_agent = data.get("user_agent")
-
-                                        if new_url and channel_id in self.stream_managers:
-                                            # Update metadata in Redis
-                                            if self.redis_client:
-                                                metadata_key = RedisKeys.channel_metadata(channel_id)
-                                                self.redis_client.hset(metadata_key, "url", new_url)
-                                                if user_agent:
-                                                    self.redis_client.hset(metadata_key, "user_agent", user_agent)
-
-                                                # Set switch status
-                                                status_key = RedisKeys.switch_status(channel_id)
-                                                self.redis_client.set(status_key, "switching")
-
-                                            # Perform the stream switch
-                                            stream_manager = self.stream_managers[channel_id]
-                                            success = stream_manager.update_url(new_url)
-
-                                            if success:
-                                                logger.info(f"Stream switch initiated for channel {channel_id}")
-
-                                                # Publish confirmation
-                                                switch_result = {
-                                                    "event": EventType.STREAM_SWITCHED,  # Use constant instead of string
-                                                    "channel_id": channel_id,
-                                                    "success": True,
-                                                    "url": new_url,
-                                                    "timestamp": time.time()
-                                                }
-                                                self.redis_client.publish(
-                                                    f"ts_proxy:events:{channel_id}",
-                                                    json.dumps(switch_result)
-                                                )
-
-                                                # Update status
-                                                if self.redis_client:
-                                                    self.redis_client.set(status_key, "switched")
-                                            else:
-                                                logger.error(f"Failed to switch stream for channel {channel_id}")
-
-                                                # Publish failure
-                                                switch_result = {
-                                                    "event": EventType.STREAM_SWITCHED,
-                                                    "channel_id": channel_id,
-                                                    "success": False,
-                                                    "url": new_url,
-                                                    "timestamp": time.time()
-                                                }
-                                                self.redis_client.publish(
-                                                    f"ts_proxy:events:{channel_id}",
-                                                    json.dumps(switch_result)
-                                                )
-                                    elif event_type == EventType.CHANNEL_STOP:
-                                        logger.info(f"Received {EventType.CHANNEL_STOP} event for channel {channel_id}")
-                                        # First mark channel as stopping in Redis
-                                        if self.redis_client:
-                                            # Set stopping state in metadata
-                                            metadata_key = RedisKeys.channel_metadata(channel_id)
-                                            if self.redis_client.exists(metadata_key):
-                                                self.redis_client.hset(metadata_key, mapping={
-                                                    "state": ChannelState.STOPPING,
-                                                    "state_changed_at": str(time.time())
-                                                })
-
-                                        # If we have local resources for this channel, clean them up
-                                        if channel_id in self.stream_buffers or channel_id in self.client_managers:
-                                            # Use existing stop_channel method
-                                            logger.info(f"Stopping local resources for channel {channel_id}")
-                                            self.stop_channel(channel_id)
-
-                                        # Acknowledge stop by publishing a response
-                                        stop_response = {
-                                            "event": EventType.CHANNEL_STOPPED,
-                                            "channel_id": channel_id,
-                                            "worker_id": self.worker_id,
-                                            "timestamp": time.time()
-                                        }
-                                        self.redis_client.publish(
-                                            f"ts_proxy:events:{channel_id}",
-                                            json.dumps(stop_response)
-                                        )
-                                    elif event_type == EventType.CLIENT_STOP:
-                                        client_id = data.get("client_id")
-                                        if client_id and channel_id:
-                                            logger.info(f"Received request to stop client {client_id} on channel {channel_id}")
-
-                                            # Both remove from client manager AND set a key for the generator to detect
-                                            if channel_id in self.client_managers:
-                                                client_manager = self.client_managers[channel_id]
-                                                if client_id in client_manager.clients:
-                                                    client_manager.remove_client(client_id)
-                                                    logger.info(f"Removed client {client_id} from client manager")
-
-                                            # Set a Redis key for the generator to detect
-                                            if self.redis_client:
-                                                stop_key = RedisKeys.client_stop(channel_id, client_id)
-                                                self.redis_client.setex(stop_key, 30, "true")  # 30 second TTL
-                                                logger.info(f"Set stop key for client {client_id}")
-                        except Exception as e:
-                            logger.error(f"Error processing event message: {e}")
+                        message = pubsub.get_message(timeout=0.1)
+                        if message and message["type"] == "message":
+                            # Handlers run on the worker's main hub - don't hold up the listener
+                            self._pending_events.append(message["data"])
+                            self._event_watcher.send()
 
                 except (ConnectionError, TimeoutError) as e:
                     # Calculate exponential backoff with jitter
@@ -353,10 +248,259 @@ class ProxyServer:
                     # Add a short delay to prevent rapid retries on persistent errors
                     gevent.sleep(5)  # REPLACE: time.sleep(5)
 
+        # Pub/sub reads block for as long as the worker runs, so the listener gets a
+        # thread of its own rather than a slot on a run_blocking pool (see utils)
         thread = threading.Thread(target=event_listener, daemon=True)
         thread.name = "redis-event-listener"
         thread.start()
 
+    def _start_event_dispatcher(self):
+        """
+        Run event handlers as greenlets on the worker's main hub. The listener
+        thread has a hub of its own, and greenlets or timers spawned there
+        (shutdown delays, client heartbeats of channels a handler creates)
+        would be bound to it.
+        """
+        self._pending_events = collections.deque()
+        self._event_watcher = gevent.get_hub().loop.async_()
+        self._event_watcher.start(self._dispatch_pending_events)
+
+    def _dispatch_pending_events(self):
+        """Spawn a handler for each event queued by the listener thread (runs on the main hub)"""
+        while self._pending_events:
+            gevent.spawn(self._handle_event_message, self._pending_events.popleft())
+
+    def _sync_event_subscriptions(self, pubsub, subscribed_channels):
+        """
+        Subscribe to event channels of channels with local resources or requests
+        waiting on their initialization, unsubscribe from the rest
+        """
+        local_channels = set(self.stream_buffers) | set(self.client_managers) | self.init_flight.waiting_channels()
+
+        added = local_channels - subscribed_channels
+        removed = subscribed_channels - local_channels
+
+        if added:
+            pubsub.subscribe(*[RedisKeys.events_channel(channel_id) for channel_id in added])
+            subscribed_channels.update(added)
+        if removed:
+            pubsub.unsubscribe(*[RedisKeys.events_channel(channel_id) for channel_id in removed])
+            subscribed_channels.difference_update(removed)
+
+    def _handle_event_message(self, raw_data):
+        """Dispatch a single pub/sub event"""
+        try:
+            data = json.loads(raw_data.decode("utf-8"))
+
+            event_type = data.get("event")
+            channel_id = data.get("channel_id")
+
+            if not channel_id or not event_type:
+                return
+
+            if event_type == EventType.CLIENT_STOP:
+                # Any worker may be serving the client
+                self._handle_client_stop(channel_id, data)
+                return
+
+            if event_type == EventType.OWNERSHIP_HANDOFF:
+                # Sent to us by a draining owner
+                self._accept_handoff(channel_id, data)
+                return
+
+            if event_type == EventType.CHANNEL_INIT_DONE:
+                # Wakes requests in this worker waiting for the channel's initializer
+                self.init_flight.notify(channel_id, data)
+                return
+
+            if event_type == EventType.CHANNEL_ASSIGN:
+                # Sent to us by a worker placing a new channel
+                self._handle_channel_assign(channel_id, data)
+                return
+
+            if event_type not in (EventType.CLIENT_CONNECTED, EventType.CLIENT_DISCONNECTED,
+                                  EventType.STREAM_SWITCH, EventType.CHANNEL_STOP, EventType.LINGER_RELEASE):
+                return
+
+            # Owner events are sent to our control channel, but ownership may have moved since
+            if not self.am_i_owner(channel_id):
+                return
+
+            if event_type == EventType.CLIENT_CONNECTED:
+                logger.debug(f"Owner received {EventType.CLIENT_CONNECTED} event for channel {channel_id}")
+                # Reset any disconnect timer
+                disconnect_key = RedisKeys.last_client_disconnect(channel_id)
+                self.redis_client.delete(disconnect_key)
+
+            elif event_type == EventType.CLIENT_DISCONNECTED:
+                logger.debug(f"Owner received {EventType.CLIENT_DISCONNECTED} event for channel {channel_id}")
+                self._handle_client_disconnected(channel_id)
+
+            elif event_type == EventType.STREAM_SWITCH:
+                logger.info(f"Owner received {EventType.STREAM_SWITCH} request for channel {channel_id}")
+                self._handle_stream_switch(channel_id, data)
+
+            elif event_type == EventType.CHANNEL_STOP:
+                logger.info(f"Received {EventType.CHANNEL_STOP} event for channel {channel_id}")
+                self._handle_channel_stop(channel_id)
+
+            elif event_type == EventType.LINGER_RELEASE:
+                self._release_lingering_channel(channel_id)
+
+        except Exception as e:
+            logger.error(f"Error processing event message: {e}")
+
+    def _handle_client_disconnected(self, channel_id):
+        """Stop the channel (after the shutdown delay) if its last client disconnected"""
+        # Check if any clients remain
+        if channel_id not in self.client_managers:
+            return
+
+        # VERIFY REDIS CLIENT COUNT DIRECTLY
+        total = ClientRegistry.count(self.redis_client, channel_id)
+        if total > 0:
+            return
+
+        if WarmPool.is_warm(self.redis_client, channel_id):
+            logger.debug(f"No clients left on warm channel {channel_id} - keeping it up")
+            WarmPool.park(self.redis_client, channel_id)
+            return
+
+        logger.debug(f"No clients left after disconnect event - stopping channel {channel_id}")
+        # Set the disconnect timer for other workers to see
+        disconnect_key = RedisKeys.last_client_disconnect(channel_id)
+        self.redis_client.setex(disconnect_key, 60, str(time.time()))
+
+        # Linger for returning clients if the channel's history suggests they'll be back
+        shutdown_delay = LingerPolicy.on_last_client_left(self.redis_client, channel_id)
+
+        if shutdown_delay > 0:
+            logger.info(f"Waiting {shutdown_delay}s before stopping channel...")
+            gevent.spawn_later(shutdown_delay, self._stop_channel_if_no_clients, channel_id)
+        else:
+            # Stop the channel directly
+            self.stop_channel(channel_id)
+
+    def _stop_channel_if_no_clients(self, channel_id):
+        """Stop a channel after the shutdown delay unless clients reconnected"""
+        try:
+            # Re-check client count before stopping
+            total = ClientRegistry.count(self.redis_client, channel_id)
+            if total > 0:
+                logger.info(f"New clients connected during shutdown delay - aborting shutdown")
+                self.redis_client.delete(RedisKeys.last_client_disconnect(channel_id))
+                return
+
+            if WarmPool.is_warm(self.redis_client, channel_id):
+                logger.info(f"Channel {channel_id} joined the warm pool during shutdown delay - keeping it up")
+                return
+
+            self.stop_channel(channel_id)
+        except Exception as e:
+            logger.error(f"Error stopping channel {channel_id} after shutdown delay: {e}")
+
+    def _release_lingering_channel(self, channel_id):
+        """Stop a channel lingering without clients because another channel needs its profile slot"""
+        try:
+            total = ClientRegistry.count(self.redis_client, channel_id)
+            if total > 0:
+                logger.debug(f"Channel {channel_id} has {total} clients again - not releasing its slot")
+                return
+
+            logger.info(f"Stopping lingering channel {channel_id} to free its M3U profile slot")
+            self.stop_channel(channel_id)
+        except Exception as e:
+            logger.error(f"Error releasing lingering channel {channel_id}: {e}")
+
+    def _handle_stream_switch(self, channel_id, data):
+        """Switch the owner's upstream connection to a new URL"""
+        new_url = data.get("url")
+        user_agent = data.get("user_agent")
+
+        if not new_url or channel_id not in self.stream_managers:
+            return
+
+        # Update metadata in Redis
+        if self.redis_client:
+            metadata_key = RedisKeys.channel_metadata(channel_id)
+            self.redis_client.hset(metadata_key, "url", new_url)
+            if user_agent:
+                self.redis_client.hset(metadata_key, "user_agent", user_agent)
+
+            # Set switch status
+            status_key = RedisKeys.switch_status(channel_id)
+            self.redis_client.set(status_key, "switching")
+
+        # Perform the stream switch
+        stream_manager = self.stream_managers[channel_id]
+        success = stream_manager.update_url(new_url)
+
+        if success:
+            logger.info(f"Stream switch initiated for channel {channel_id}")
+        else:
+            logger.error(f"Failed to switch stream for channel {channel_id}")
+
+        # Publish the result
+        switch_result = {
+            "event": EventType.STREAM_SWITCHED,  # Use constant instead of string
+            "channel_id": channel_id,
+            "success": success,
+            "url": new_url,
+            "timestamp": time.time()
+        }
+        publish_channel_event(self.redis_client, channel_id, switch_result)
+
+        # Update status
+        if success and self.redis_client:
+            self.redis_client.set(status_key, "switched")
+
+    def _handle_channel_stop(self, channel_id):
+        """Stop a channel at the owner's request"""
+        # First mark channel as stopping in Redis
+        if self.redis_client:
+            # Set stopping state in metadata
+            metadata_key = RedisKeys.channel_metadata(channel_id)
+            if self.redis_client.exists(metadata_key):
+                self.redis_client.hset(metadata_key, mapping={
+                    "state": ChannelState.STOPPING,
+                    "state_changed_at": str(time.time())
+                })
+
+        # If we have local resources for this channel, clean them up
+        if channel_id in self.stream_buffers or channel_id in self.client_managers:
+            # Use existing stop_channel method
+            logger.info(f"Stopping local resources for channel {channel_id}")
+            self.stop_channel(channel_id)
+
+        # Acknowledge stop by publishing a response
+        stop_response = {
+            "event": EventType.CHANNEL_STOPPED,
+            "channel_id": channel_id,
+            "worker_id": self.worker_id,
+            "timestamp": time.time()
+        }
+        publish_channel_event(self.redis_client, channel_id, stop_response)
+
+    def _handle_client_stop(self, channel_id, data):
+        """Disconnect a single client if it is connected to this worker"""
+        client_id = data.get("client_id")
+        if not client_id:
+            return
+
+        # Both remove from client manager AND set a key for the generator to detect
+        if channel_id in self.client_managers:
+            client_manager = self.client_managers[channel_id]
+            if client_id in client_manager.clients:
+                logger.info(f"Received request to stop client {client_id} on channel {channel_id}")
+                client_manager.remove_client(client_id)
+                logger.info(f"Removed client {client_id} from client manager")
+
+                # Set a Redis key for the generator to detect
+                if self.redis_client:
+                    stop_key = RedisKeys.client_stop(channel_id, client_id)
+                    self.redis_client.setex(stop_key, 30, "true")  # 30 second TTL
+                    logger.info(f"Set stop key for client {client_id}")
+
     def get_channel_owner(self, channel_id):
         """Get the worker ID that owns this channel with proper error handling"""
         if not self.redis_client:
@@ -377,67 +521,57 @@ class ProxyServer:
         return owner == self.worker_id
 
     def try_acquire_ownership(self, channel_id, ttl=30):
-        """Try to become the owner of this channel using proper locking"""
+        """Try to become the owner of this channel with an atomic lease"""
         if not self.redis_client:
             return True  # If no Redis, always become owner
 
-        try:
-            # Create a lock key with proper namespace
-            lock_key = RedisKeys.channel_owner(channel_id)
+        if self.draining:
+            # Shutting down - leave new channels to the other workers
+            return False
 
-            # Use Redis SETNX for atomic locking with error handling
-            acquired = self._execute_redis_command(
-                lambda: self.redis_client.setnx(lock_key, self.worker_id)
+        try:
+            # Check-and-set plus fencing token in a single round trip
+            token = self._execute_redis_command(
+                lambda: ChannelLease.acquire(self.redis_client, channel_id, self.worker_id, ttl)
             )
 
-            if acquired is None:  # Redis command failed
+            if token is None:  # Redis command failed
                 logger.warning(f"Redis command failed during ownership acquisition - assuming ownership")
                 return True
 
-            # If acquired, set expiry to prevent orphaned locks
-            if acquired:
-                self._execute_redis_command(
-                    lambda: self.redis_client.expire(lock_key, ttl)
-                )
-                logger.info(f"Worker {self.worker_id} acquired ownership of channel {channel_id}")
-                return True
+            if not token:
+                # Someone else owns it
+                return False
 
-            # If not acquired, check if we already own it (might be a retry)
-            current_owner = self._execute_redis_command(
-                lambda: self.redis_client.get(lock_key)
-            )
-            if current_owner and current_owner.decode('utf-8') == self.worker_id:
-                # Refresh TTL
-                self._execute_redis_command(
-                    lambda: self.redis_client.expire(lock_key, ttl)
-                )
+            if self.fencing_tokens.get(channel_id) == token:
                 logger.info(f"Worker {self.worker_id} refreshed ownership of channel {channel_id}")
-                return True
-
-            # Someone else owns it
-            return False
+            else:
+                logger.info(f"Worker {self.worker_id} acquired ownership of channel {channel_id} (fencing token {token})")
+            self._set_fencing_token(channel_id, token)
+            return True
 
         except Exception as e:
             logger.error(f"Error acquiring channel ownership: {e}")
             return False
 
+    def _set_fencing_token(self, channel_id, token):
+        """Remember the fencing token of our lease and stamp it on the channel's buffer writes"""
+        self.fencing_tokens[channel_id] = token
+        buffer = self.stream_buffers.get(channel_id)
+        if buffer:
+            buffer.fencing_token = token
+
     def release_ownership(self, channel_id):
         """Release ownership of this channel safely"""
+        self.fencing_tokens.pop(channel_id, None)
+
         if not self.redis_client:
             return
 
         try:
-            lock_key = RedisKeys.channel_owner(channel_id)
-
-            # Only delete if we're the current owner to prevent race conditions
-            current = self.redis_client.get(lock_key)
-            if current and current.decode('utf-8') == self.worker_id:
-                self.redis_client.delete(lock_key)
+            # Only releases if we're the current owner, and sets the stopping key to signal clients
+            if ChannelLease.release(self.redis_client, channel_id, self.worker_id):
                 logger.info(f"Released ownership of channel {channel_id}")
-
-                # Also ensure channel stopping key is set to signal clients
-                stop_key = RedisKeys.channel_stopping(channel_id)
-                self.redis_client.setex(stop_key, 30, "true")
                 logger.info(f"Set stopping signal for channel {channel_id} clients")
 
         except Exception as e:
@@ -449,32 +583,402 @@ class ProxyServer:
             return False
 
         try:
-            lock_key = RedisKeys.channel_owner(channel_id)
-            current = self.redis_client.get(lock_key)
-
-            # Only extend if we're still the owner
-            if current and current.decode('utf-8') == self.worker_id:
-                self.redis_client.expire(lock_key, ttl)
-                return True
-            return False
+            # Only extends if we're still the owner
+            return bool(ChannelLease.extend(self.redis_client, channel_id, self.worker_id, ttl))
         except Exception as e:
             logger.error(f"Error extending ownership: {e}")
             return False
 
-    def initialize_channel(self, url, channel_id, user_agent=None, transcode=False, stream_id=None):
-        """Initialize a channel without redundant active key"""
-        try:
-            # Create buffer and client manager instances
-            buffer = StreamBuffer(channel_id, redis_client=self.redis_client)
-            client_manager = ClientManager(
-                channel_id,
+    @staticmethod
+    def _metadata_field(metadata, name):
+        value = metadata.get(name.encode('utf-8'))
+        return value.decode('utf-8') if value else None
+
+    def _start_stream_manager(self, channel_id, buffer, metadata):
+        """Start a StreamManager for a channel from its Redis metadata (for takeovers and handoffs)"""
+        stream_id = self._metadata_field(metadata, ChannelMetadataField.STREAM_ID)
+        stream_manager = StreamManager(
+            channel_id,
+            self._metadata_field(metadata, ChannelMetadataField.URL),
+            buffer,
+            user_agent=self._metadata_field(metadata, ChannelMetadataField.USER_AGENT),
+            transcode=self._metadata_field(metadata, ChannelMetadataField.TRANSCODE) == "1",
+            stream_id=int(stream_id) if stream_id else None,
+            worker_id=self.worker_id
+        )
+
+        thread = threading.Thread(target=stream_manager.run, daemon=True)
+        thread.name = f"stream-{channel_id}"
+        thread.start()
+        return stream_manager
+
+    def _claim_buffer(self, channel_id, token, previous_owner):
+        """Start writing a channel's buffer under a lease we just took from previous_owner"""
+        self.stream_buffers[channel_id].take_over_writing(token)
+        self._set_fencing_token(channel_id, token)
+        self.redis_client.hset(RedisKeys.channel_metadata(channel_id), mapping={
+            ChannelMetadataField.OWNER: self.worker_id,
+            "taken_over_at": str(time.time()),
+            "taken_over_from": previous_owner
+        })
+
+    def _ensure_local_channel(self, channel_id):
+        """Make sure we have a buffer and client manager for a channel we're about to own"""
+        if channel_id not in self.stream_buffers:
+            self.stream_buffers[channel_id] = StreamBuffer.create(channel_id=channel_id, redis_client=self.redis_client)
+        if channel_id not in self.client_managers:
+            self.client_managers[channel_id] = ClientManager(
+                channel_id=channel_id,
                 redis_client=self.redis_client,
                 worker_id=self.worker_id
             )
+        return self.stream_buffers[channel_id]
+
+    def _take_over_channel(self, channel_id, previous_owner, metadata):
+        """
+        Take over a channel whose owner stopped heartbeating and reconnect the
+        upstream here. Writes continue at the same buffer index, so clients only
+        see a short stall.
+        """
+        if not self._metadata_field(metadata, ChannelMetadataField.URL):
+            logger.warning(f"Can't take over channel {channel_id}: no URL in metadata")
+            return False
+
+        try:
+            token = ChannelLease.take_over(self.redis_client, channel_id, self.worker_id, previous_owner)
+            if not token:
+                logger.debug(f"Channel {channel_id} was taken over by another worker or its owner recovered")
+                return False
+
+            logger.warning(f"Worker {self.worker_id} took over channel {channel_id} from {previous_owner} "
+                           f"(fencing token {token})")
+
+            self._ensure_local_channel(channel_id)
+            self._claim_buffer(channel_id, token, previous_owner)
+            self.stream_managers[channel_id] = self._start_stream_manager(
+                channel_id, self.stream_buffers[channel_id], metadata)
+            logger.info(f"Started stream manager thread for taken over channel {channel_id}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error taking over channel {channel_id}: {e}", exc_info=True)
+            self.release_ownership(channel_id)
+            return False
+
+    def _accept_handoff(self, channel_id, data):
+        """
+        Take a channel over from a draining owner. The upstream is connected
+        first while the old owner keeps writing, and only then is the lease
+        moved, so the buffer index keeps advancing without a reconnect gap.
+        """
+        previous_owner = data.get("from_worker")
+        if self.draining or not previous_owner or channel_id in self.stream_managers:
+            return False
+
+        metadata = self.redis_client.hgetall(RedisKeys.channel_metadata(channel_id))
+        if not self._metadata_field(metadata, ChannelMetadataField.URL):
+            logger.warning(f"Can't accept handoff of channel {channel_id}: no URL in metadata")
+            return False
+
+        logger.info(f"Accepting handoff of channel {channel_id} from draining worker {previous_owner}")
+        self.pending_handoffs.add(channel_id)
+        stream_manager = None
+        try:
+            buffer = self._ensure_local_channel(channel_id)
+            buffer.standby = True
+            stream_manager = self._start_stream_manager(channel_id, buffer, metadata)
+
+            deadline = time.time() + ConfigHelper.handoff_connect_timeout()
+            while not stream_manager.connected and stream_manager.running and time.time() < deadline:
+                gevent.sleep(0.1)
+
+            if not stream_manager.connected:
+                logger.warning(f"Handoff of channel {channel_id} failed: upstream didn't connect in time")
+                return False
+
+            token = ChannelLease.take_over(self.redis_client, channel_id, self.worker_id, previous_owner,
+                                           only_if_dead=False)
+            if not token:
+                logger.warning(f"Handoff of channel {channel_id} failed: {previous_owner} no longer owns it")
+                return False
+
+            self._claim_buffer(channel_id, token, previous_owner)
+            self.stream_managers[channel_id] = stream_manager
+            stream_manager = None
+            logger.info(f"Worker {self.worker_id} took over channel {channel_id} from draining worker "
+                        f"{previous_owner} (fencing token {token})")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error accepting handoff of channel {channel_id}: {e}", exc_info=True)
+            return False
+
+        finally:
+            self.pending_handoffs.discard(channel_id)
+            if stream_manager is not None:
+                # Handoff failed - go back to being a reader of the old owner's buffer
+                stream_manager.stop()
+                buffer.standby = False
+
+    def _register_drain_hook(self):
+        """Hand owned channels to peer workers when this worker shuts down or reloads"""
+        try:
+            import uwsgi
+        except ImportError:
+            import atexit
+            atexit.register(self.drain)
+            return
+
+        # uWSGI asks a worker to stop gracefully with SIGHUP and kills it once
+        # worker-reload-mercy has passed. Drain as soon as the signal arrives, while the
+        # hub and the client greenlets are still fully alive, rather than at exit.
+        mercy = self._worker_reload_mercy(uwsgi)
+        timeout = min(ConfigHelper.drain_timeout(), max(mercy - 5, 1))
+
+        def on_graceful_stop():
+            logger.info(f"Worker {self.worker_id} is stopping, draining its channels (up to {timeout}s)")
+            gevent.spawn(self.drain, timeout)
+
+        try:
+            # libev allows several watchers per signal, so uWSGI's own graceful stop handler still runs
+            gevent.signal_handler(signal.SIGHUP, on_graceful_stop)
+        except Exception as e:
+            # Signal watchers need the main thread's hub
+            logger.warning(f"Couldn't register drain on graceful stop, channels will rely on owner failover: {e}")
+
+    @staticmethod
+    def _worker_reload_mercy(uwsgi):
+        """Seconds uWSGI gives a stopping worker before killing it"""
+        value = uwsgi.opt.get('worker-reload-mercy') or uwsgi.opt.get('reload-mercy')
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return 60  # uWSGI's default
+
+    def _find_handoff_peer(self, channel_id):
+        """
+        Pick a live, non-draining worker to hand a channel to, preferring the
+        worker serving the most of the channel's clients, then the least loaded.
+        """
+        workers = WorkerRegistry.live_workers(self.redis_client)
+        workers.pop(self.worker_id, None)
+        if not workers:
+            return None
+
+        client_ids = ClientRegistry.members(self.redis_client, channel_id)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for client_id in client_ids:
+            pipe.hget(RedisKeys.client_metadata(channel_id, client_id.decode('utf-8')), ChannelMetadataField.WORKER_ID)
+        local_clients = {}
+        for worker_id in pipe.execute():
+            if worker_id:
+                worker_id = worker_id.decode('utf-8')
+                local_clients[worker_id] = local_clients.get(worker_id, 0) + 1
+
+        return max(workers, key=lambda worker_id: (local_clients.get(worker_id, 0),
+                                                   -WorkerRegistry.load_score(workers[worker_id])))
+
+    def _capacity_stats(self):
+        """Current load of this worker, as published to the worker registry"""
+        owned = [channel_id for channel_id in list(self.stream_managers.keys()) if channel_id in self.fencing_tokens]
+        ffmpeg = sum(1 for channel_id in owned
+                      if getattr(self.stream_managers.get(channel_id), 'transcode_process_active', False))
+        clients = sum(manager.get_client_count() for manager in list(self.client_managers.values()))
+        egress = ClientStatsAggregator.get_instance().egress_rate()
+
+        return {
+            'node': self.node_id,
+            'channels': len(owned),
+            'ffmpeg': ffmpeg,
+            'clients': clients,
+            'cpu': psutil.cpu_percent(interval=None),
+            'egress_mbps': round(egress * 8 / 1000000, 2),
+            'draining': self.draining,
+        }
+
+    def _delegate_ownership(self, channel_id, url, user_agent, transcode, stream_id):
+        """
+        Ask the least-loaded worker to own a new channel if it's clearly less
+        loaded than we are. Returns True once the channel has been offered to
+        another worker - clients then wait on its buffer like on any channel
+        still initializing - or False if we should own it ourselves.
+        """
+        if not ConfigHelper.placement_enabled() or not self.redis_client or self.draining:
+            return False
 
-            # Store in local tracking
-            self.stream_buffers[channel_id] = buffer
-            self.client_managers[channel_id] = client_manager
+        try:
+            workers = WorkerRegistry.live_workers(self.redis_client)
+            target = WorkerRegistry.least_loaded(workers, exclude=(self.worker_id,))
+            if not target:
+                return False
+
+            own_score = WorkerRegistry.load_score(self._capacity_stats())
+            target_score = WorkerRegistry.load_score(workers[target])
+            if target_score + ConfigHelper.placement_score_margin() > own_score:
+                return False
+
+            logger.info(f"Placing channel {channel_id} on worker {target} (load {target_score:.2f}, "
+                        f"ours {own_score:.2f})")
+
+            # Clients waiting on other workers and the upstream registry need the channel's
+            # source right away - the owner fields follow once the target holds the lease
+            metadata = {
+                ChannelMetadataField.URL: url,
+                ChannelMetadataField.STATE: ChannelState.INITIALIZING,
+                ChannelMetadataField.INIT_TIME: str(time.time()),
+                ChannelMetadataField.TRANSCODE: "1" if transcode else "0",
+            }
+            if user_agent:
+                metadata[ChannelMetadataField.USER_AGENT] = user_agent
+            if stream_id:
+                metadata[ChannelMetadataField.STREAM_ID] = str(stream_id)
+            metadata_key = RedisKeys.channel_metadata(channel_id)
+            self.redis_client.hset(metadata_key, mapping=metadata)
+            self.redis_client.expire(metadata_key, 3600)
+
+            publish_worker_event(self.redis_client, target, {
+                "event": EventType.CHANNEL_ASSIGN,
+                "channel_id": channel_id,
+                "url": url,
+                "user_agent": user_agent,
+                "transcode": transcode,
+                "stream_id": stream_id,
+                "from_worker": self.worker_id,
+                "timestamp": time.time()
+            })
+
+            # Don't hold the request up - own the channel later if the target never takes it
+            gevent.spawn(self._own_if_unassigned, channel_id, target, url, user_agent, transcode, stream_id)
+            return True
+
+        except Exception as e:
+            logger.error(f"Error placing channel {channel_id}: {e}", exc_info=True)
+            return False
+
+    @staticmethod
+    def _placement_pending(metadata):
+        """Whether a channel's metadata was written by a worker placing it that nobody has taken yet"""
+        if not metadata or metadata.get(ChannelMetadataField.STATE.encode('utf-8')) != ChannelState.INITIALIZING.encode('utf-8'):
+            return False
+        try:
+            init_time = float(metadata.get(ChannelMetadataField.INIT_TIME.encode('utf-8')))
+        except (TypeError, ValueError):
+            return False
+        return time.time() - init_time < ConfigHelper.placement_delegate_timeout()
+
+    def _own_if_unassigned(self, channel_id, target, url, user_agent, transcode, stream_id):
+        """Own a channel we placed on another worker if that worker hasn't taken it in time"""
+        try:
+            deadline = time.time() + ConfigHelper.placement_delegate_timeout()
+            while time.time() < deadline:
+                owner = self.get_channel_owner(channel_id)
+                if owner:
+                    logger.info(f"Channel {channel_id} is owned by worker {owner}")
+                    return
+                gevent.sleep(0.1)
+
+            if channel_id not in self.client_managers:
+                # Our clients left meanwhile - nobody needs the channel here
+                return
+
+            logger.warning(f"Worker {target} didn't take channel {channel_id} in time, owning it ourselves")
+            self.initialize_channel(url, channel_id, user_agent=user_agent, transcode=transcode,
+                                    stream_id=stream_id, allow_delegation=False, reuse_local=True)
+
+        except Exception as e:
+            logger.error(f"Error owning unassigned channel {channel_id}: {e}", exc_info=True)
+
+    def _handle_channel_assign(self, channel_id, data):
+        """Own a new channel another worker placed on us"""
+        if self.draining or channel_id in self.stream_managers:
+            return
+
+        logger.info(f"Worker {data.get('from_worker')} placed channel {channel_id} on this worker")
+        self.initialize_channel(
+            data.get("url"),
+            channel_id,
+            user_agent=data.get("user_agent"),
+            transcode=data.get("transcode", False),
+            stream_id=data.get("stream_id"),
+            allow_delegation=False
+        )
+
+    def drain(self, timeout=None):
+        """
+        Hand every channel this worker owns to a peer before the worker exits,
+        waiting up to timeout seconds (DRAIN_TIMEOUT by default). Channels that
+        can't be handed over in time are left to owner failover once this
+        worker's heartbeats stop.
+        """
+        if self.draining or not self.redis_client:
+            return
+        self.draining = True
+
+        if timeout is None:
+            timeout = ConfigHelper.drain_timeout()
+        try:
+            # Peers stop placing channels on us or handing channels to us
+            WorkerRegistry.publish(self.redis_client, self.worker_id, self._capacity_stats())
+
+            handoffs = {}
+            for channel_id in list(self.stream_managers.keys()):
+                if not self.am_i_owner(channel_id):
+                    continue
+
+                peer = self._find_handoff_peer(channel_id)
+                if not peer:
+                    logger.warning(f"Draining worker {self.worker_id}: no peer to hand channel {channel_id} to")
+                    continue
+
+                publish_worker_event(self.redis_client, peer, {
+                    "event": EventType.OWNERSHIP_HANDOFF,
+                    "channel_id": channel_id,
+                    "from_worker": self.worker_id,
+                    "timestamp": time.time()
+                })
+                handoffs[channel_id] = peer
+                logger.info(f"Draining worker {self.worker_id}: handing channel {channel_id} to {peer}")
+
+            # Keep writing until each peer has taken the lease over
+            deadline = time.time() + timeout
+            while handoffs and time.time() < deadline:
+                for channel_id in list(handoffs):
+                    if not self.am_i_owner(channel_id):
+                        logger.info(f"Channel {channel_id} handed over to {self.get_channel_owner(channel_id)}")
+                        self._cleanup_local_resources(channel_id)
+                        del handoffs[channel_id]
+                if handoffs:
+                    gevent.sleep(0.1)
+
+            for channel_id, peer in handoffs.items():
+                logger.warning(f"Handoff of channel {channel_id} to {peer} timed out, leaving it to owner failover")
+
+        except Exception as e:
+            logger.error(f"Error draining worker {self.worker_id}: {e}", exc_info=True)
+
+    def initialize_channel(self, url, channel_id, user_agent=None, transcode=False, stream_id=None,
+                           allow_delegation=True, reuse_local=False):
+        """
+        Initialize a channel without redundant active key. With reuse_local, the
+        buffer and client manager clients already joined here are kept.
+        """
+        try:
+            if reuse_local:
+                buffer = self._ensure_local_channel(channel_id)
+            else:
+                # Create buffer and client manager instances
+                buffer = StreamBuffer.create(channel_id, redis_client=self.redis_client)
+                client_manager = ClientManager(
+                    channel_id,
+                    redis_client=self.redis_client,
+                    worker_id=self.worker_id
+                )
+
+                # Store in local tracking
+                self.stream_buffers[channel_id] = buffer
+                self.client_managers[channel_id] = client_manager
 
             # Get channel URL from Redis if available
             channel_url = url
@@ -509,18 +1013,25 @@ class ProxyServer:
             # Check if channel is already owned
             current_owner = self.get_channel_owner(channel_id)
 
+            # A channel another worker is still placing gets its owner shortly
+            placement_pending = allow_delegation and not current_owner and self._placement_pending(existing_metadata)
+
             # Exit early if another worker owns the channel
-            if current_owner and current_owner != self.worker_id:
-                logger.info(f"Channel {channel_id} already owned by worker {current_owner}")
+            if (current_owner and current_owner != self.worker_id) or placement_pending:
+                if placement_pending:
+                    logger.info(f"Channel {channel_id} is being placed on another worker")
+                else:
+                    logger.info(f"Channel {channel_id} already owned by worker {current_owner}")
                 logger.info(f"This worker ({self.worker_id}) will read from Redis buffer only")
 
-                # Create buffer but not stream manager
-                buffer = StreamBuffer(channel_id=channel_id, redis_client=self.redis_client)
-                self.stream_buffers[channel_id] = buffer
+                if not reuse_local:
+                    # Create buffer but not stream manager
+                    buffer = StreamBuffer.create(channel_id=channel_id, redis_client=self.redis_client)
+                    self.stream_buffers[channel_id] = buffer
 
-                # Create client manager with channel_id and redis_client
-                client_manager = ClientManager(channel_id=channel_id, redis_client=self.redis_client, worker_id=self.worker_id)
-                self.client_managers[channel_id] = client_manager
+                    # Create client manager with channel_id and redis_client
+                    client_manager = ClientManager(channel_id=channel_id, redis_client=self.redis_client, worker_id=self.worker_id)
+                    self.client_managers[channel_id] = client_manager
 
                 return True
 
@@ -530,18 +1041,24 @@ class ProxyServer:
                 logger.error(f"No URL available for channel {channel_id}")
                 return False
 
+            # Let a less loaded worker own the channel - we then read from its buffer
+            if allow_delegation and self._delegate_ownership(channel_id, channel_url, channel_user_agent,
+                                                             transcode, channel_stream_id):
+                return True
+
             # Try to acquire ownership with Redis locking
             if not self.try_acquire_ownership(channel_id):
                 # Another worker just acquired ownership
                 logger.info(f"Another worker just acquired ownership of channel {channel_id}")
 
-                # Create buffer but not stream manager
-                buffer = StreamBuffer(channel_id=channel_id, redis_client=self.redis_client)
-                self.stream_buffers[channel_id] = buffer
+                if not reuse_local:
+                    # Create buffer but not stream manager
+                    buffer = StreamBuffer.create(channel_id=channel_id, redis_client=self.redis_client)
+                    self.stream_buffers[channel_id] = buffer
 
-                # Create client manager with channel_id and redis_client
-                client_manager = ClientManager(channel_id=channel_id, redis_client=self.redis_client, worker_id=self.worker_id)
-                self.client_managers[channel_id] = client_manager
+                    # Create client manager with channel_id and redis_client
+                    client_manager = ClientManager(channel_id=channel_id, redis_client=self.redis_client, worker_id=self.worker_id)
+                    self.client_managers[channel_id] = client_manager
 
                 return True
 
@@ -560,6 +1077,9 @@ class ProxyServer:
                 if channel_user_agent:
                     metadata["user_agent"] = channel_user_agent
 
+                # Needed by a worker that takes the channel over if we die
+                metadata[ChannelMetadataField.TRANSCODE] = "1" if transcode else "0"
+
                 # CRITICAL FIX: Make sure stream_id is always set in metadata and properly logged
                 if channel_stream_id:
                     metadata["stream_id"] = str(channel_stream_id)
@@ -578,10 +1098,14 @@ class ProxyServer:
                 else:
                     logger.warning(f"Failed to set stream_id in Redis for channel {channel_id}")
 
-            # Create stream buffer
-            buffer = StreamBuffer(channel_id=channel_id, redis_client=self.redis_client)
-            logger.debug(f"Created StreamBuffer for channel {channel_id}")
-            self.stream_buffers[channel_id] = buffer
+            if not reuse_local:
+                # Create stream buffer
+                buffer = StreamBuffer.create(channel_id=channel_id, redis_client=self.redis_client)
+                logger.debug(f"Created StreamBuffer for channel {channel_id}")
+                self.stream_buffers[channel_id] = buffer
+
+            # Stamp our writes so they're rejected if another worker takes the channel over
+            buffer.fencing_token = self.fencing_tokens.get(channel_id)
 
             # Only the owner worker creates the actual stream manager
             stream_manager = StreamManager(
@@ -596,13 +1120,14 @@ class ProxyServer:
             logger.info(f"Created StreamManager for channel {channel_id} with stream ID {channel_stream_id}")
             self.stream_managers[channel_id] = stream_manager
 
-            # Create client manager with channel_id, redis_client AND worker_id
-            client_manager = ClientManager(
-                channel_id=channel_id,
-                redis_client=self.redis_client,
-                worker_id=self.worker_id
-            )
-            self.client_managers[channel_id] = client_manager
+            if not reuse_local:
+                # Create client manager with channel_id, redis_client AND worker_id
+                client_manager = ClientManager(
+                    channel_id=channel_id,
+                    redis_client=self.redis_client,
+                    worker_id=self.worker_id
+                )
+                self.client_managers[channel_id] = client_manager
 
             # Start stream manager thread only for the owner
             thread = threading.Thread(target=stream_manager.run, daemon=True)
@@ -798,6 +1323,8 @@ class ProxyServer:
                     except Exception as e:
                         logger.error(f"Error stopping buffer: {e}")
 
+                ChannelFanout.stop_channel(channel_id)
+
                 # Save reference and check again before deleting
                 try:
                     if channel_id in self.stream_buffers:  # Check again to prevent race conditions
@@ -814,6 +1341,9 @@ class ProxyServer:
                 except KeyError:
                     logger.debug(f"Client manager for channel {channel_id} already removed")
 
+            # Drop queued client stats so they don't recreate deleted keys
+            ClientStatsAggregator.get_instance().discard_channel(channel_id)
+
             # Clean up Redis keys
             self._clean_redis_keys(channel_id)
 
@@ -850,154 +1380,7 @@ class ProxyServer:
         def cleanup_task():
             while True:
                 try:
-                    # Send worker heartbeat first
-                    if self.redis_client:
-                        worker_heartbeat_key = f"ts_proxy:worker:{self.worker_id}:heartbeat"
-                        self._execute_redis_command(
-                            lambda: self.redis_client.setex(worker_heartbeat_key, 30, str(time.time()))
-                        )
-
-                    # Refresh channel registry
-                    self.refresh_channel_registry()
-
-                    # Create a unified list of all channels we have locally
-                    all_local_channels = set(self.stream_managers.keys()) | set(self.client_managers.keys())
-
-                    # Single loop through all channels - process each exactly once
-                    for channel_id in list(all_local_channels):
-                        if self.am_i_owner(channel_id):
-                            # === OWNER CHANNEL HANDLING ===
-                            # Extend ownership lease
-                            self.extend_ownership(channel_id)
-
-                            # Get channel state from metadata hash
-                            channel_state = "unknown"
-                            if self.redis_client:
-                                metadata_key = RedisKeys.channel_metadata(channel_id)
-                                metadata = self.redis_client.hgetall(metadata_key)
-                                if metadata and b'state' in metadata:
-                                    channel_state = metadata[b'state'].decode('utf-8')
-
-                            # Check if channel has any clients left
-                            total_clients = 0
-                            if channel_id in self.client_managers:
-                                client_manager = self.client_managers[channel_id]
-                                total_clients = client_manager.get_total_client_count()
-
-                            # Log client count periodically
-                            if time.time() % 30 < 1:  # Every ~30 seconds
-                                logger.info(f"Channel {channel_id} has {total_clients} clients, state: {channel_state}")
-
-                            # If in connecting or waiting_for_clients state, check grace period
-                            if channel_state in [ChannelState.CONNECTING, ChannelState.WAITING_FOR_CLIENTS]:
-                                # Get connection ready time from metadata
-                                connection_ready_time = None
-                                if metadata and b'connection_ready_time' in metadata:
-                                    try:
-                                        connection_ready_time = float(metadata[b'connection_ready_time'].decode('utf-8'))
-                                    except (ValueError, TypeError):
-                                        pass
-
-                                # If still connecting, give it more time
-                                if channel_state == ChannelState.CONNECTING:
-                                    logger.debug(f"Channel {channel_id} still connecting - not checking for clients yet")
-                                    continue
-
-                                # If waiting for clients, check grace period
-                                if connection_ready_time:
-                                    grace_period = ConfigHelper.get('CHANNEL_INIT_GRACE_PERIOD', 20)
-                                    time_since_ready = time.time() - connection_ready_time
-
-                                    # Add this debug log
-                                    logger.debug(f"GRACE PERIOD CHECK: Channel {channel_id} in {channel_state} state, "
-                                                 f"time_since_ready={time_since_ready:.1f}s, grace_period={grace_period}s, "
-                                                 f"total_clients={total_clients}")
-
-                                    if time_since_ready <= grace_period:
-                                        # Still within grace period
-                                        logger.debug(f"Channel {channel_id} in grace period - {time_since_ready:.1f}s of {grace_period}s elapsed")
-                                        continue
-                                    elif total_clients == 0:
-                                        # Grace period expired with no clients
-                                        logger.info(f"Grace period expired ({time_since_ready:.1f}s > {grace_period}s) with no clients - stopping channel {channel_id}")
-                                        self.stop_channel(channel_id)
-                                    else:
-                                        # Grace period expired but we have clients - mark channel as active
-                                        logger.info(f"Grace period expired with {total_clients} clients - marking channel {channel_id} as active")
-                                        old_state = "unknown"
-                                        if metadata and b'state' in metadata:
-                                            old_state = metadata[b'state'].decode('utf-8')
-                                        if self.update_channel_state(channel_id, ChannelState.ACTIVE, {
-                                            "grace_period_ended_at": str(time.time()),
-                                            "clients_at_activation": str(total_clients)
-                                        }):
-                                            logger.info(f"Channel {channel_id} activated with {total_clients} clients after grace period")
-                            # If active and no clients, start normal shutdown procedure
-                            elif channel_state not in [ChannelState.CONNECTING, ChannelState.WAITING_FOR_CLIENTS] and total_clients == 0:
-                                # Check if there's a pending no-clients timeout
-                                disconnect_key = RedisKeys.last_client_disconnect(channel_id)
-                                disconnect_time = None
-
-                                if self.redis_client:
-                                    disconnect_value = self.redis_client.get(disconnect_key)
-                                    if disconnect_value:
-                                        try:
-                                            disconnect_time = float(disconnect_value.decode('utf-8'))
-                                        except (ValueError, TypeError) as e:
-                                            logger.error(f"Invalid disconnect time for channel {channel_id}: {e}")
-
-                                current_time = time.time()
-
-                                if not disconnect_time:
-                                    # First time seeing zero clients, set timestamp
-                                    if self.redis_client:
-                                        self.redis_client.setex(disconnect_key, 60, str(current_time))
-                                    logger.warning(f"No clients detected for channel {channel_id}, starting shutdown timer")
-                                elif current_time - disconnect_time > ConfigHelper.channel_shutdown_delay():
-                                    # We've had no clients for the shutdown delay period
-                                    logger.warning(f"No clients for {current_time - disconnect_time:.1f}s, stopping channel {channel_id}")
-                                    self.stop_channel(channel_id)
-                                else:
-                                    # Still in shutdown delay period
-                                    logger.debug(f"Channel {channel_id} shutdown timer: "
-                                                f"{current_time - disconnect_time:.1f}s of "
-                                                f"{ConfigHelper.channel_shutdown_delay()}s elapsed")
-                            else:
-                                # There are clients or we're still connecting - clear any disconnect timestamp
-                                if self.redis_client:
-                                    self.redis_client.delete(f"ts_proxy:channel:{channel_id}:last_client_disconnect_time")
-
-                        else:
-                            # === NON-OWNER CHANNEL HANDLING ===
-                            # For channels we don't own, check if they've been stopped/cleaned up in Redis
-                            if self.redis_client:
-                                # Method 1: Check for stopping key
-                                stop_key = RedisKeys.channel_stopping(channel_id)
-                                if self.redis_client.exists(stop_key):
-                                    logger.debug(f"Non-owner cleanup: Channel {channel_id} has stopping flag in Redis, cleaning up local resources")
-                                    self._cleanup_local_resources(channel_id)
-                                    continue
-
-                                # Method 2: Check if owner still exists
-                                owner_key = RedisKeys.channel_owner(channel_id)
-                                if not self.redis_client.exists(owner_key):
-                                    logger.debug(f"Non-owner cleanup: Channel {channel_id} has no owner in Redis, cleaning up local resources")
-                                    self._cleanup_local_resources(channel_id)
-                                    continue
-
-                                # Method 3: Check if metadata still exists
-                                metadata_key = RedisKeys.channel_metadata(channel_id)
-                                if not self.redis_client.exists(metadata_key):
-                                    logger.debug(f"Non-owner cleanup: Channel {channel_id} has no metadata in Redis, cleaning up local resources")
-                                    self._cleanup_local_resources(channel_id)
-                                    continue
-
-                            # Check for local client count - if zero, clean up our local resources
-                            if self.client_managers[channel_id].get_client_count() == 0:
-                                # We're not the owner, and we have no local clients - clean up our resources
-                                logger.debug(f"Non-owner cleanup: Channel {channel_id} has no local clients, cleaning up local resources")
-                                self._cleanup_local_resources(channel_id)
-
+                    self._run_cleanup_cycle()
                 except Exception as e:
                     logger.error(f"Error in cleanup thread: {e}", exc_info=True)
 
@@ -1008,6 +1391,260 @@ class ProxyServer:
         thread.start()
         logger.info(f"Started TS proxy cleanup thread (interval: {ConfigHelper.cleanup_check_interval()}s)")
 
+    def _start_lease_refresh_thread(self):
+        """Start background thread that keeps our ownership leases and owner heartbeats alive"""
+        def lease_refresh_task():
+            while True:
+                try:
+                    self._refresh_leases()
+                except Exception as e:
+                    logger.error(f"Error in lease refresh thread: {e}", exc_info=True)
+
+                gevent.sleep(ConfigHelper.owner_heartbeat_interval())
+
+        thread = threading.Thread(target=lease_refresh_task, daemon=True)
+        thread.name = "ts-proxy-lease-refresh"
+        thread.start()
+        logger.info(f"Started TS proxy lease refresh thread (interval: {ConfigHelper.owner_heartbeat_interval()}s)")
+
+    def _refresh_leases(self):
+        """
+        Extend the leases and owner heartbeats of the channels we run in one pipeline.
+        Never does anything else, so it can't be held up by stopping or taking over channels.
+        """
+        if not self.redis_client:
+            return
+
+        channel_ids = (set(self.stream_managers.keys()) | set(self.fencing_tokens.keys())) - self.pending_handoffs
+        if not channel_ids:
+            return
+
+        # Extending is compare-and-set, so channels whose lease we lost are left alone;
+        # the cleanup cycle notices the new owner and demotes them
+        pipe = self.redis_client.pipeline(transaction=False)
+        for channel_id in channel_ids:
+            ChannelLease.extend(pipe, channel_id, self.worker_id)
+        pipe.execute()
+
+    def _read_channel_states(self, channel_ids):
+        """
+        Read everything the cleanup cycle needs for the given channels in one pipeline.
+        Returns {channel_id: {'owner', 'owner_alive', 'metadata', 'total_clients', 'disconnect_time',
+        'linger_delay', 'warm', 'stopping'}}.
+        """
+        now = time.time()
+        pipe = self.redis_client.pipeline(transaction=False)
+        for channel_id in channel_ids:
+            for _, queue_read in CHANNEL_STATE_READS:
+                queue_read(pipe, channel_id, now)
+        results = pipe.execute()
+
+        field_count = len(CHANNEL_STATE_READS)
+        states = {}
+        for i, channel_id in enumerate(channel_ids):
+            raw = dict(zip((name for name, _ in CHANNEL_STATE_READS),
+                           results[i * field_count:(i + 1) * field_count]))
+            owner = raw['owner']
+            disconnect_value = raw['disconnect_time']
+            linger_value = raw['linger_delay']
+
+            disconnect_time = None
+            if disconnect_value:
+                try:
+                    disconnect_time = float(disconnect_value.decode('utf-8'))
+                except (ValueError, TypeError) as e:
+                    logger.error(f"Invalid disconnect time for channel {channel_id}: {e}")
+
+            states[channel_id] = {
+                'owner': owner.decode('utf-8') if owner else None,
+                'owner_alive': bool(raw['owner_alive']),
+                'metadata': raw['metadata'] or {},
+                'total_clients': raw['total_clients'] or 0,
+                'disconnect_time': disconnect_time,
+                'linger_delay': float(linger_value) if linger_value else ConfigHelper.channel_shutdown_delay(),
+                'warm': bool(raw['warm']),
+                'stopping': bool(raw['stopping']),
+            }
+        return states
+
+    def _run_cleanup_cycle(self):
+        """
+        One pass of the cleanup loop. All channel state is read in one pipeline,
+        decisions are made locally, simple writes go out in a second pipeline
+        and only then are channels stopped or cleaned up.
+        """
+        if not self.redis_client:
+            return
+
+        # Create a unified list of all channels we have locally
+        all_local_channels = list(set(self.stream_managers.keys()) | set(self.client_managers.keys()))
+        states = self._read_channel_states(all_local_channels) if all_local_channels else {}
+
+        writes = self.redis_client.pipeline(transaction=False)
+
+        # Send worker heartbeat first
+        writes.setex(RedisKeys.worker_heartbeat(self.worker_id), 30, str(time.time()))
+
+        # Refresh channel registry
+        self.refresh_channel_registry(pipe=writes)
+
+        # Publish our load for channel placement, and where this node can be reached
+        WorkerRegistry.publish(writes, self.worker_id, self._capacity_stats())
+        if local_node_url():
+            NodeRegistry.publish(writes, self.node_id, local_node_url())
+
+        channels_to_stop = []
+        channels_to_activate = []
+        channels_to_release = []
+        channels_to_demote = []
+        channels_to_take_over = []
+        current_time = time.time()
+
+        # Single loop through all channels - process each exactly once
+        for channel_id in all_local_channels:
+            state = states[channel_id]
+            metadata = state['metadata']
+
+            if channel_id in self.pending_handoffs:
+                # Connecting upstream to take the channel over from a draining worker
+                continue
+
+            if state['owner'] == self.worker_id:
+                # === OWNER CHANNEL HANDLING ===
+                # (the lease itself is extended by the lease refresh thread)
+
+                # Get channel state from metadata hash
+                channel_state = "unknown"
+                if b'state' in metadata:
+                    channel_state = metadata[b'state'].decode('utf-8')
+
+                # Check if channel has any clients left
+                total_clients = state['total_clients'] if channel_id in self.client_managers else 0
+
+                # Log client count periodically
+                if current_time % 30 < 1:  # Every ~30 seconds
+                    logger.info(f"Channel {channel_id} has {total_clients} clients, state: {channel_state}")
+
+                # If in connecting or waiting_for_clients state, check grace period
+                if channel_state in [ChannelState.CONNECTING, ChannelState.WAITING_FOR_CLIENTS]:
+                    # If still connecting, give it more time
+                    if channel_state == ChannelState.CONNECTING:
+                        logger.debug(f"Channel {channel_id} still connecting - not checking for clients yet")
+                        continue
+
+                    # Get connection ready time from metadata
+                    connection_ready_time = None
+                    if b'connection_ready_time' in metadata:
+                        try:
+                            connection_ready_time = float(metadata[b'connection_ready_time'].decode('utf-8'))
+                        except (ValueError, TypeError):
+                            pass
+
+                    # If waiting for clients, check grace period
+                    if connection_ready_time:
+                        grace_period = ConfigHelper.get('CHANNEL_INIT_GRACE_PERIOD', 20)
+                        time_since_ready = current_time - connection_ready_time
+
+                        logger.debug(f"GRACE PERIOD CHECK: Channel {channel_id} in {channel_state} state, "
+                                     f"time_since_ready={time_since_ready:.1f}s, grace_period={grace_period}s, "
+                                     f"total_clients={total_clients}")
+
+                        if time_since_ready <= grace_period:
+                            # Still within grace period
+                            logger.debug(f"Channel {channel_id} in grace period - {time_since_ready:.1f}s of {grace_period}s elapsed")
+                        elif total_clients == 0 and state['warm']:
+                            # Warm pool channels stay up without clients
+                            pass
+                        elif total_clients == 0:
+                            # Grace period expired with no clients
+                            logger.info(f"Grace period expired ({time_since_ready:.1f}s > {grace_period}s) with no clients - stopping channel {channel_id}")
+                            channels_to_stop.append(channel_id)
+                        else:
+                            # Grace period expired but we have clients - mark channel as active
+                            logger.info(f"Grace period expired with {total_clients} clients - marking channel {channel_id} as active")
+                            channels_to_activate.append((channel_id, total_clients))
+
+                # Warm pool channels stay up without clients
+                elif total_clients == 0 and state['warm']:
+                    if state['disconnect_time']:
+                        writes.delete(RedisKeys.last_client_disconnect(channel_id))
+
+                # If active and no clients, start normal shutdown procedure
+                elif total_clients == 0:
+                    # Check if there's a pending no-clients timeout
+                    disconnect_time = state['disconnect_time']
+
+                    if not disconnect_time:
+                        # First time seeing zero clients, set timestamp
+                        writes.setex(RedisKeys.last_client_disconnect(channel_id), 60, str(current_time))
+                        if not state['linger_delay']:
+                            LingerPolicy.on_last_client_left(self.redis_client, channel_id)
+                        logger.warning(f"No clients detected for channel {channel_id}, starting shutdown timer")
+                    elif current_time - disconnect_time > state['linger_delay']:
+                        # We've had no clients for the shutdown delay period
+                        logger.warning(f"No clients for {current_time - disconnect_time:.1f}s, stopping channel {channel_id}")
+                        channels_to_stop.append(channel_id)
+                    else:
+                        # Still in shutdown delay period
+                        logger.debug(f"Channel {channel_id} shutdown timer: "
+                                    f"{current_time - disconnect_time:.1f}s of "
+                                    f"{state['linger_delay']:.1f}s elapsed")
+                elif state['disconnect_time']:
+                    # There are clients again - clear the disconnect timestamp
+                    writes.delete(RedisKeys.last_client_disconnect(channel_id))
+
+            else:
+                # === NON-OWNER CHANNEL HANDLING ===
+                # For channels we don't own, check if they've been stopped/cleaned up in Redis
+                if state['stopping']:
+                    logger.debug(f"Non-owner cleanup: Channel {channel_id} has stopping flag in Redis, cleaning up local resources")
+                    channels_to_release.append(channel_id)
+                elif not state['owner']:
+                    logger.debug(f"Non-owner cleanup: Channel {channel_id} has no owner in Redis, cleaning up local resources")
+                    channels_to_release.append(channel_id)
+                elif not metadata:
+                    logger.debug(f"Non-owner cleanup: Channel {channel_id} has no metadata in Redis, cleaning up local resources")
+                    channels_to_release.append(channel_id)
+                elif channel_id not in self.client_managers or self.client_managers[channel_id].get_client_count() == 0:
+                    # We're not the owner, and we have no local clients - clean up our resources
+                    logger.debug(f"Non-owner cleanup: Channel {channel_id} has no local clients, cleaning up local resources")
+                    channels_to_release.append(channel_id)
+                elif channel_id in self.stream_managers:
+                    # Our lease was taken over - keep serving local clients from the new owner's buffer
+                    logger.warning(f"Channel {channel_id} is now owned by {state['owner']}, stopping local stream manager")
+                    channels_to_demote.append(channel_id)
+                elif not state['owner_alive'] and ConfigHelper.owner_failover_enabled() and not self.draining:
+                    # The owner stopped heartbeating but we still have viewers - resume the stream here
+                    channel_state = metadata.get(b'state', b'').decode('utf-8')
+                    if channel_state not in [ChannelState.ERROR, ChannelState.STOPPING, ChannelState.STOPPED]:
+                        logger.warning(f"Owner {state['owner']} of channel {channel_id} stopped sending heartbeats")
+                        channels_to_take_over.append((channel_id, state['owner'], metadata))
+
+        writes.execute()
+
+        # Actions that need more than a single write happen after the batch
+        for channel_id, total_clients in channels_to_activate:
+            if self.update_channel_state(channel_id, ChannelState.ACTIVE, {
+                "grace_period_ended_at": str(time.time()),
+                "clients_at_activation": str(total_clients)
+            }):
+                logger.info(f"Channel {channel_id} activated with {total_clients} clients after grace period")
+
+        for channel_id in channels_to_stop:
+            self.stop_channel(channel_id)
+
+        for channel_id in channels_to_release:
+            self._cleanup_local_resources(channel_id)
+
+        for channel_id in channels_to_demote:
+            self.fencing_tokens.pop(channel_id, None)
+            stream_manager = self.stream_managers.pop(channel_id, None)
+            if stream_manager:
+                stream_manager.stop()
+
+        for channel_id, previous_owner, metadata in channels_to_take_over:
+            self._take_over_channel(channel_id, previous_owner, metadata)
+
     def _check_orphaned_channels(self):
         """Check for orphaned channels in Redis (owner worker crashed)"""
         if not self.redis_client:
@@ -1031,8 +1668,7 @@ class ProxyServer:
 
                     if not owner:
                         # Check if there are any clients
-                        client_set_key = RedisKeys.clients(channel_id)
-                        client_count = self.redis_client.scard(client_set_key) or 0
+                        client_count = ClientRegistry.count(self.redis_client, channel_id)
 
                         if client_count > 0:
                             # Orphaned channel with clients - we could take ownership
@@ -1061,6 +1697,10 @@ class ProxyServer:
             return 0
 
         try:
+            LingerPolicy.forget(self.redis_client, channel_id)
+            WarmPool.forget(self.redis_client, channel_id)
+            UpstreamRegistry.forget(self.redis_client, channel_id)
+
             # Define key patterns to scan for
             patterns = [
                 f"ts_proxy:channel:{channel_id}:*",  # All channel keys
@@ -1088,21 +1728,26 @@ class ProxyServer:
             logger.error(f"Error cleaning Redis keys for channel {channel_id}: {e}")
             return 0
 
-    def refresh_channel_registry(self):
-        """Refresh TTL for active channels using standard keys"""
+    def refresh_channel_registry(self, pipe=None):
+        """Refresh TTL for active channels using standard keys (queued on pipe if given)"""
         if not self.redis_client:
             return
 
+        target = pipe if pipe is not None else self.redis_client.pipeline(transaction=False)
+
         # Refresh registry entries for channels we own
         for channel_id in list(self.stream_buffers.keys()):
             # Use standard key pattern
             metadata_key = RedisKeys.channel_metadata(channel_id)
 
             # Update activity timestamp in metadata only
-            self.redis_client.hset(metadata_key, "last_active", str(time.time()))
-            self.redis_client.expire(metadata_key, 30)  # Reset TTL on metadata hash
+            target.hset(metadata_key, "last_active", str(time.time()))
+            target.expire(metadata_key, 30)  # Reset TTL on metadata hash
             logger.debug(f"Refreshed metadata TTL for channel {channel_id}")
 
+        if pipe is None:
+            target.execute()
+
     def update_channel_state(self, channel_id, new_state, additional_fields=None):
         """Update channel state with proper history tracking and logging"""
         if not self.redis_client:
@@ -1156,6 +1801,13 @@ class ProxyServer:
                 del self.stream_buffers[channel_id]
                 logger.info(f"Non-owner cleanup: Removed stream buffer for channel {channel_id}")
 
+            self.fencing_tokens.pop(channel_id, None)
+
+            # Cached chunk indexes are meaningless once the channel restarts
+            ChunkCache.get_instance().invalidate(channel_id)
+            ChannelFanout.stop_channel(channel_id)
+            ClientStatsAggregator.get_instance().discard_channel(channel_id)
+
             if channel_id in self.client_managers:
                 del self.client_managers[channel_id]
                 logger.info(f"Non-owner cleanup: Removed client manager for channel {channel_id}")
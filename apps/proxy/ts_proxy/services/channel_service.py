@@ -5,7 +5,6 @@ This separates business logic from HTTP handling in views.
 
 import logging
 import time
-import json
 from django.shortcuts import get_object_or_404
 from apps.channels.models import Channel, Stream
 from apps.proxy.config import TSConfig as Config
@@ -13,6 +12,8 @@ from ..server import ProxyServer
 from ..redis_keys import RedisKeys
 from ..constants import EventType, ChannelState, ChannelMetadataField
 from ..url_utils import get_stream_info_for_switch
+from ..events import publish_channel_event, publish_owner_event
+from ..upstream_registry import UpstreamRegistry
 
 logger = logging.getLogger("ts_proxy")
 
@@ -79,6 +80,8 @@ class ChannelService:
             if update_data:
                 proxy_server.redis_client.hset(metadata_key, mapping=update_data)
 
+            UpstreamRegistry.register(proxy_server.redis_client, channel_id)
+
         return success
 
     @staticmethod
@@ -457,6 +460,10 @@ class ChannelService:
         switch_key = RedisKeys.switch_request(channel_id)
         proxy_server.redis_client.setex(switch_key, 30, url)  # 30 second TTL
 
+        # A transcode session registers again once it runs the new URL
+        proxy_server.redis_client.hdel(metadata_key, ChannelMetadataField.TRANSCODE_SESSION)
+        UpstreamRegistry.register(proxy_server.redis_client, channel_id)
+
         logger.debug(f"Updated metadata for channel {channel_id} in Redis")
         return True
 
@@ -479,10 +486,8 @@ class ChannelService:
             "timestamp": time.time()
         }
 
-        proxy_server.redis_client.publish(
-            RedisKeys.events_channel(channel_id),
-            json.dumps(switch_request)
-        )
+        # Only the owner can switch the upstream connection
+        publish_owner_event(proxy_server.redis_client, channel_id, switch_request)
         return True
 
     @staticmethod
@@ -500,10 +505,7 @@ class ChannelService:
             "timestamp": time.time()
         }
 
-        proxy_server.redis_client.publish(
-            RedisKeys.events_channel(channel_id),
-            json.dumps(stop_request)
-        )
+        publish_owner_event(proxy_server.redis_client, channel_id, stop_request)
 
         logger.info(f"Published channel stop event for {channel_id}")
         return True
@@ -524,8 +526,6 @@ class ChannelService:
             "timestamp": time.time()
         }
 
-        proxy_server.redis_client.publish(
-            RedisKeys.events_channel(channel_id),
-            json.dumps(stop_request)
-        )
+        # The client may be on any worker serving the channel
+        publish_channel_event(proxy_server.redis_client, channel_id, stop_request)
         return True
@@ -0,0 +1,198 @@
+"""
+Shared-memory ring buffer for TS chunks.
+
+The owner worker writes every buffer chunk once into a memory-mapped ring file
+on the local host. Other workers on the same host map the same file and read
+chunks straight out of it, so Redis only has to serve the buffer index and act
+as the fallback for readers on other hosts or chunks the ring has overwritten.
+"""
+
+import mmap
+import os
+import re
+import struct
+import time
+from .utils import get_logger
+
+logger = get_logger()
+
+RING_MAGIC = b'DTSR'
+RING_VERSION = 1
+
+# Ring header: magic, version, slot count, slot data size, last index written, last write time
+_RING_HEADER = struct.Struct('<4sIIIqd')
+_RING_HEADER_SIZE = 64
+
+# Slot header: index when the write started, data length, index when the write finished
+_SLOT_HEADER = struct.Struct('<qqq')
+_SLOT_HEADER_SIZE = 64
+
+_INDEX_FIELD = struct.Struct('<q')
+
+
+class SharedChunkRing:
+    """
+    Fixed-size ring of chunk slots backed by a memory-mapped file.
+
+    Each slot is guarded by a pair of sequence fields (seqlock style): the
+    writer stamps the slot with the chunk index before touching the data and
+    again once the data is complete. Readers only accept a slot whose
+    finished index matches the requested chunk and whose start index is
+    still unchanged after copying the data out, so a slot being overwritten
+    is treated as a miss instead of returning torn data.
+    """
+
+    def __init__(self, path, mm, slot_count, slot_size, writable, inode):
+        self.path = path
+        self._mm = mm
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+        self.slot_stride = _SLOT_HEADER_SIZE + slot_size
+        self.writable = writable
+        self.inode = inode
+
+    @staticmethod
+    def path_for(directory, channel_id):
+        """Get the ring file path for a channel"""
+        safe_id = re.sub(r'[^A-Za-z0-9_-]', '_', str(channel_id))
+        return os.path.join(directory, f"{safe_id}.ring")
+
+    @classmethod
+    def create(cls, directory, channel_id, slot_count, slot_size):
+        """
+        Create a fresh ring file for a channel and map it for writing.
+
+        Any existing ring file is unlinked first so readers still mapping the
+        previous file keep a valid (if stale) mapping instead of reading past
+        the end of a resized file.
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = cls.path_for(directory, channel_id)
+        size = _RING_HEADER_SIZE + slot_count * (_SLOT_HEADER_SIZE + slot_size)
+
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            # Reserve the pages up front - writing to an over-committed tmpfs
+            # mapping raises SIGBUS instead of an exception we could handle
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(fd, 0, size)
+            mm = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            inode = os.fstat(fd).st_ino
+        except Exception:
+            os.close(fd)
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            raise
+        os.close(fd)
+
+        ring = cls(path, mm, slot_count, slot_size, True, inode)
+        for slot in range(slot_count):
+            _SLOT_HEADER.pack_into(mm, ring._slot_offset(slot), -1, 0, -1)
+        _RING_HEADER.pack_into(mm, 0, RING_MAGIC, RING_VERSION, slot_count, slot_size, 0, time.time())
+
+        logger.info(f"Created shared-memory ring for channel {channel_id} at {path} "
+                    f"({slot_count} slots x {slot_size} bytes)")
+        return ring
+
+    @classmethod
+    def attach(cls, directory, channel_id):
+        """Map an existing ring file read-only, or return None if there is none"""
+        path = cls.path_for(directory, channel_id)
+
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+
+        try:
+            stat = os.fstat(fd)
+            if stat.st_size < _RING_HEADER_SIZE:
+                return None
+
+            mm = mmap.mmap(fd, stat.st_size, mmap.MAP_SHARED, mmap.PROT_READ)
+        finally:
+            os.close(fd)
+
+        magic, version, slot_count, slot_size, _, _ = _RING_HEADER.unpack_from(mm, 0)
+        expected_size = _RING_HEADER_SIZE + slot_count * (_SLOT_HEADER_SIZE + slot_size)
+        if magic != RING_MAGIC or version != RING_VERSION or stat.st_size < expected_size:
+            logger.debug(f"Ignoring incompatible shared-memory ring at {path}")
+            mm.close()
+            return None
+
+        logger.debug(f"Attached to shared-memory ring for channel {channel_id} at {path}")
+        return cls(path, mm, slot_count, slot_size, False, stat.st_ino)
+
+    def _slot_offset(self, slot):
+        return _RING_HEADER_SIZE + slot * self.slot_stride
+
+    def write(self, index, data):
+        """Write a chunk into the slot for its index. Returns False if it doesn't fit."""
+        length = len(data)
+        if not self.writable or index <= 0 or length > self.slot_size:
+            return False
+
+        offset = self._slot_offset(index % self.slot_count)
+        data_offset = offset + _SLOT_HEADER_SIZE
+
+        # Mark the slot as being rewritten before touching the data
+        _INDEX_FIELD.pack_into(self._mm, offset, index)
+        self._mm[data_offset:data_offset + length] = data
+        _SLOT_HEADER.pack_into(self._mm, offset, index, length, index)
+
+        _RING_HEADER.pack_into(self._mm, 0, RING_MAGIC, RING_VERSION,
+                               self.slot_count, self.slot_size, index, time.time())
+        return True
+
+    def read(self, index):
+        """Read a chunk by index, or return None if the slot holds a different chunk"""
+        if index <= 0:
+            return None
+
+        offset = self._slot_offset(index % self.slot_count)
+
+        _, length, finished = _SLOT_HEADER.unpack_from(self._mm, offset)
+        if finished != index or length <= 0 or length > self.slot_size:
+            return None
+
+        data_offset = offset + _SLOT_HEADER_SIZE
+        data = self._mm[data_offset:data_offset + length]
+
+        # If the writer started on this slot while we were copying, discard it
+        started, = _INDEX_FIELD.unpack_from(self._mm, offset)
+        if started != index:
+            return None
+
+        return data
+
+    def latest_index(self):
+        """Get the last chunk index written to the ring"""
+        return _RING_HEADER.unpack_from(self._mm, 0)[4]
+
+    def is_replaced(self):
+        """Check if the ring file on disk is no longer the one we have mapped"""
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except FileNotFoundError:
+            return True
+
+    def close(self, unlink=False):
+        """Unmap the ring, optionally removing the backing file"""
+        try:
+            self._mm.close()
+        except Exception as e:
+            logger.debug(f"Error closing shared-memory ring {self.path}: {e}")
+
+        if unlink and self.writable and not self.is_replaced():
+            try:
+                os.unlink(self.path)
+            except OSError as e:
+                logger.debug(f"Error removing shared-memory ring {self.path}: {e}")
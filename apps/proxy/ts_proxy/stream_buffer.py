@@ -1,5 +1,6 @@
 """Buffer management for TS streams"""
 
+import os
 import threading
 import logging
 import time
@@ -9,8 +10,13 @@ import random
 from apps.proxy.config import TSConfig as Config
 from .redis_keys import RedisKeys
 from .config_helper import ConfigHelper
-from .constants import TS_PACKET_SIZE
+from .constants import TS_PACKET_SIZE, TS_SYNC_BYTE
 from .utils import get_logger
+from .shm_buffer import SharedChunkRing
+from .chunk_cache import ChunkCache
+from .cluster import local_node_id
+from .ts_index import TSRandomAccessIndexer
+from .redis_scripts import run_script, FENCED_CHUNK_WRITE
 import gevent.event
 import gevent  # Make sure this import is at the top
 
@@ -19,6 +25,17 @@ logger = get_logger()
 class StreamBuffer:
     """Manages stream data buffering with optimized chunk storage"""
 
+    # Whether get_optimized_client_data waits for new data itself (see RedisStreamBuffer)
+    blocking_reads = False
+
+    @classmethod
+    def create(cls, channel_id=None, redis_client=None):
+        """Create a buffer using the configured backend ('keys' or 'stream')"""
+        if ConfigHelper.buffer_backend() == 'stream':
+            from .redis_stream_buffer import RedisStreamBuffer
+            return RedisStreamBuffer(channel_id=channel_id, redis_client=redis_client)
+        return StreamBuffer(channel_id=channel_id, redis_client=redis_client)
+
     def __init__(self, channel_id=None, redis_client=None):
         self.channel_id = channel_id
         self.redis_client = redis_client
@@ -42,59 +59,90 @@ class StreamBuffer:
             except Exception as e:
                 logger.error(f"Error initializing buffer from Redis: {e}")
 
-        self._write_buffer = bytearray()
-        self.target_chunk_size = ConfigHelper.get('BUFFER_CHUNK_SIZE', TS_PACKET_SIZE * 5644)  # ~1MB default
+        self.target_chunk_size = ConfigHelper.buffer_chunk_size()
+
+        # Preallocated write buffer - incoming data is copied into it exactly once
+        # and complete chunks are handed to Redis as memoryviews of it
+        self._write_buffer = bytearray(self.target_chunk_size)
+        self._write_view = memoryview(self._write_buffer)
+        self._write_pos = 0
 
         # Track timers for proper cleanup
         self.stopping = False
         self.fill_timers = []
         self.chunk_available = gevent.event.Event()
 
+        # Shared-memory ring for same-host readers (created by the writer, attached by readers)
+        self.shm_enabled = ConfigHelper.shm_buffer_enabled() and bool(channel_id)
+        # Per node, so nodes sharing a host (e.g. in testing) don't read each other's rings
+        self.shm_dir = os.path.join(ConfigHelper.shm_buffer_dir(), local_node_id())
+        self.shared_ring = None
+        self._shared_ring_failed = False
+        self._shared_ring_attach_time = 0
+
+        # Recent chunks shared by every client of this channel in the worker
+        self.chunk_cache = ChunkCache.get_instance()
+
+        # Keyframe join points - recorded by the writer, looked up by new clients
+        self.keyframe_join = ConfigHelper.keyframe_join_enabled() and bool(channel_id)
+        self.join_points_key = RedisKeys.buffer_join_points(channel_id) if channel_id else ""
+        self.psi_key = RedisKeys.buffer_psi(channel_id) if channel_id else ""
+        self.ts_indexer = None
+
+        # Ownership fencing token stamped on chunk writes (set by the owner).
+        # Once a write is rejected because a newer owner took over, fenced_out stays set.
+        self.fence_key = RedisKeys.channel_fence(channel_id) if channel_id else ""
+        self.fencing_token = None
+        self.fenced_out = False
+
+        # While a worker waits to take the buffer over, its incoming data is dropped.
+        # Data then starts mid-stream, so the first write has to find a packet boundary.
+        self.standby = False
+        self._resync = False
+
     def add_chunk(self, chunk):
-        """Add data with optimized Redis storage and TS packet alignment"""
-        if not chunk:
+        """
+        Add data with optimized Redis storage and TS packet alignment.
+
+        Accepts any bytes-like object (bytes, bytearray or memoryview). Data is
+        copied once into the preallocated write buffer; since the target chunk
+        size is a multiple of the TS packet size, every full chunk holds whole
+        packets without tracking partial packets separately.
+        """
+        if not chunk or self.fenced_out:
             return False
 
         try:
-            # Accumulate partial packets between chunks
-            if not hasattr(self, '_partial_packet'):
-                self._partial_packet = bytearray()
+            data = memoryview(chunk)
+            if data.format != 'B' or data.ndim != 1:
+                data = data.cast('B')
 
-            # Combine with any previous partial packet
-            combined_data = bytearray(self._partial_packet) + bytearray(chunk)
-
-            # Calculate complete packets
-            complete_packets_size = (len(combined_data) // self.TS_PACKET_SIZE) * self.TS_PACKET_SIZE
-
-            if complete_packets_size == 0:
-                # Not enough data for a complete packet
-                self._partial_packet = combined_data
+            if self.standby:
+                # Another worker still writes this buffer - keep our connection warm only
                 return True
 
-            # Split into complete packets and remainder
-            complete_packets = combined_data[:complete_packets_size]
-            self._partial_packet = combined_data[complete_packets_size:]
-
-            # Add completed packets to write buffer
-            self._write_buffer.extend(complete_packets)
+            if self._resync:
+                sync = self._find_packet_boundary(data)
+                if sync is None:
+                    return True
+                data = data[sync:]
+                self._resync = False
 
-            # Only write to Redis when we have enough data for an optimized chunk
             writes_done = 0
             with self.lock:
-                while len(self._write_buffer) >= self.target_chunk_size:
-                    # Extract a full chunk
-                    chunk_data = self._write_buffer[:self.target_chunk_size]
-                    self._write_buffer = self._write_buffer[self.target_chunk_size:]
-
-                    # Write optimized chunk to Redis
-                    if self.redis_client:
-                        chunk_index = self.redis_client.incr(self.buffer_index_key)
-                        chunk_key = RedisKeys.buffer_chunk(self.channel_id, chunk_index)
-                        self.redis_client.setex(chunk_key, self.chunk_ttl, bytes(chunk_data))
-
-                        # Update local tracking
-                        self.index = chunk_index
-                        writes_done += 1
+                while data:
+                    # Fill the write buffer as far as this piece of data allows
+                    space = self.target_chunk_size - self._write_pos
+                    count = min(space, len(data))
+                    self._write_view[self._write_pos:self._write_pos + count] = data[:count]
+                    self._write_pos += count
+                    data = data[count:]
+
+                    # Only write to Redis when we have a full chunk
+                    if self._write_pos == self.target_chunk_size:
+                        self._write_pos = 0
+                        if self._store_chunk(self._write_view):
+                            writes_done += 1
 
             if writes_done > 0:
                 logger.debug(f"Added {writes_done} chunks ({self.target_chunk_size} bytes each) to Redis for channel {self.channel_id} at index {self.index}")
@@ -108,6 +156,68 @@ class StreamBuffer:
             logger.error(f"Error adding chunk to buffer: {e}")
             return False
 
+    def _store_chunk(self, chunk_data):
+        """
+        Write a complete chunk to Redis and the shared-memory ring.
+        chunk_data may be a memoryview of the write buffer, so it must not be
+        retained after this returns. Caller must hold self.lock.
+        """
+        if not self.redis_client or self.fenced_out:
+            return False
+
+        chunk_index = self._write_to_redis(chunk_data)
+        if chunk_index is None:
+            self.fenced_out = True
+            logger.warning(f"Chunk write for channel {self.channel_id} rejected: fencing token {self.fencing_token} "
+                           f"is stale, another worker owns the channel now")
+            return False
+
+        self._write_to_shared_ring(chunk_index, chunk_data)
+        self._record_join_point(chunk_index, chunk_data)
+
+        # Update local tracking
+        self.index = chunk_index
+        return True
+
+    def _write_to_redis(self, chunk_data):
+        """Store a chunk under the next index. Returns the index, or None if the write was fenced off."""
+        if self.fencing_token is None:
+            chunk_index = self.redis_client.incr(self.buffer_index_key)
+            self.redis_client.setex(RedisKeys.buffer_chunk(self.channel_id, chunk_index), self.chunk_ttl, chunk_data)
+            return chunk_index
+
+        chunk_index = run_script(self.redis_client, FENCED_CHUNK_WRITE,
+                                 [self.fence_key, self.buffer_index_key, self.buffer_prefix],
+                                 [self.fencing_token, self.chunk_ttl, chunk_data])
+        return chunk_index if chunk_index > 0 else None
+
+    @staticmethod
+    def _find_packet_boundary(data):
+        """Offset of the first TS packet start in data, or None"""
+        for offset in range(min(len(data), TS_PACKET_SIZE)):
+            if data[offset] == TS_SYNC_BYTE and (offset + TS_PACKET_SIZE >= len(data) or
+                                                 data[offset + TS_PACKET_SIZE] == TS_SYNC_BYTE):
+                return offset
+        return None
+
+    def take_over_writing(self, fencing_token):
+        """Start writing to a buffer another worker was writing, continuing at its current index"""
+        with self.lock:
+            self.fencing_token = fencing_token
+            self.fenced_out = False
+            self.standby = False
+            self._resync = True
+            self._write_pos = 0
+            # PSI and codec have to be learned again from the new connection
+            self.ts_indexer = None
+
+            if self.redis_client:
+                current_index = self.redis_client.get(self.buffer_index_key)
+                if current_index:
+                    self.index = int(current_index)
+
+        logger.info(f"Taking over writes for channel {self.channel_id} at index {self.index}")
+
     def get_chunks(self, start_index=None):
         """Get chunks from the buffer with detailed logging"""
         try:
@@ -125,6 +235,7 @@ class StreamBuffer:
 
             # Get current index from Redis
             current_index = int(self.redis_client.get(self.buffer_index_key) or 0)
+            self.chunk_cache.check_head(self.channel_id, current_index)
 
             # Calculate range of chunks to retrieve
             start_id = start_index + 1
@@ -153,13 +264,7 @@ class StreamBuffer:
             # Log the range we're retrieving
             logger.debug(f"[{request_id}] Retrieving chunks {start_id} to {end_id-1} (total: {end_id-start_id})")
 
-            # Directly fetch from Redis using pipeline for efficiency
-            pipe = self.redis_client.pipeline()
-            for idx in range(start_id, end_id):
-                chunk_key = RedisKeys.buffer_chunk(self.channel_id, idx)
-                pipe.get(chunk_key)
-
-            results = pipe.execute()
+            results = self._fetch_chunk_range(start_id, end_id)
 
             # Process results
             chunks = [result for result in results if result is not None]
@@ -199,6 +304,7 @@ class StreamBuffer:
 
             # Get current buffer position
             current_index = int(self.redis_client.get(self.buffer_index_key) or 0)
+            self.chunk_cache.check_head(self.channel_id, current_index)
 
             # If requesting beyond current buffer, return what we have
             if start_id > current_index:
@@ -207,13 +313,7 @@ class StreamBuffer:
             # Cap end at current buffer position
             end_id = min(end_id, current_index + 1)
 
-            # Directly fetch from Redis using pipeline
-            pipe = self.redis_client.pipeline()
-            for idx in range(start_id, end_id):
-                chunk_key = RedisKeys.buffer_chunk(self.channel_id, idx)
-                pipe.get(chunk_key)
-
-            results = pipe.execute()
+            results = self._fetch_chunk_range(start_id, end_id)
 
             # Filter out None results
             chunks = [result for result in results if result is not None]
@@ -228,6 +328,155 @@ class StreamBuffer:
             logger.error(f"Error getting exact chunks: {e}", exc_info=True)
             return []
 
+    def _fetch_chunk_range(self, start_id, end_id):
+        """
+        Fetch chunks [start_id, end_id) from the worker chunk cache, then the
+        shared-memory ring, then Redis. Chunks read from the ring or Redis are
+        added to the cache so other local clients don't fetch them again.
+        Returns a list aligned with the requested range (None for missing chunks).
+        """
+        results = [None] * max(0, end_id - start_id)
+        ring = self._get_read_ring()
+        missing = []
+
+        for offset, idx in enumerate(range(start_id, end_id)):
+            data = self.chunk_cache.get(self.channel_id, idx)
+            if data is None and ring:
+                data = ring.read(idx)
+                if data is not None:
+                    self.chunk_cache.put(self.channel_id, idx, data)
+
+            if data is not None:
+                results[offset] = data
+            else:
+                missing.append(offset)
+
+        if missing and ring and not ring.writable and ring.is_replaced():
+            # The owner recreated the ring (e.g. after an ownership change) - remap on next read
+            self._close_shared_ring()
+
+        if missing and self.redis_client:
+            for offset, data in zip(missing, self._fetch_from_redis(start_id, missing)):
+                if data is not None:
+                    results[offset] = data
+                    self.chunk_cache.put(self.channel_id, start_id + offset, data)
+
+        return results
+
+    def _fetch_from_redis(self, start_id, offsets):
+        """Fetch chunks start_id + offset for each offset from Redis in one pipeline"""
+        pipe = self.redis_client.pipeline()
+        for offset in offsets:
+            pipe.get(RedisKeys.buffer_chunk(self.channel_id, start_id + offset))
+        return pipe.execute()
+
+    def _record_join_point(self, chunk_index, chunk_data):
+        """Index a written chunk and record where new clients can join in it"""
+        if not self.keyframe_join:
+            return
+
+        try:
+            if self.ts_indexer is None:
+                self.ts_indexer = TSRandomAccessIndexer()
+
+            join = self.ts_indexer.scan(chunk_data)
+            if join is None and not self.ts_indexer.psi_changed:
+                return
+
+            pipe = self.redis_client.pipeline(transaction=False)
+            if self.ts_indexer.psi_changed and self.ts_indexer.psi:
+                pipe.setex(self.psi_key, self.chunk_ttl, self.ts_indexer.psi)
+                self.ts_indexer.psi_changed = False
+            if join is not None:
+                pipe.zadd(self.join_points_key, {f"{chunk_index}:{join.offset}:{int(join.has_psi)}": chunk_index})
+                # Joins only look a few chunks back from live - keep a small history
+                pipe.zremrangebyscore(self.join_points_key, 0, chunk_index - 64)
+                pipe.expire(self.join_points_key, self.chunk_ttl)
+                pipe.expire(self.psi_key, self.chunk_ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Disabling keyframe join index for channel {self.channel_id}: {e}")
+            self.keyframe_join = False
+
+    def get_join_point(self, start_index):
+        """
+        Find where a new client wanting to start at chunk start_index should join.
+
+        Prefers the newest join point at or before start_index (up to
+        KEYFRAME_JOIN_MAX_BACK_CHUNKS further back), otherwise the oldest one
+        after it. Returns (chunk_index, byte_offset, prefix) where prefix is
+        the PAT/PMT packets to send first, or None if there is no join point.
+        """
+        if not self.keyframe_join or not self.redis_client:
+            return None
+
+        try:
+            min_index = start_index - ConfigHelper.keyframe_join_max_back_chunks()
+            members = self.redis_client.zrevrangebyscore(self.join_points_key, start_index, min_index, start=0, num=1)
+            if not members:
+                members = self.redis_client.zrangebyscore(self.join_points_key, f"({start_index}", "+inf", start=0, num=1)
+            if not members:
+                return None
+
+            chunk_index, offset, has_psi = (int(part) for part in members[0].decode('utf-8').split(':'))
+
+            prefix = b''
+            if not has_psi:
+                prefix = self.redis_client.get(self.psi_key) or b''
+
+            return chunk_index, offset, prefix
+
+        except Exception as e:
+            logger.warning(f"Error looking up join point for channel {self.channel_id}: {e}")
+            return None
+
+    def _write_to_shared_ring(self, chunk_index, chunk_data):
+        """Mirror a chunk into the shared-memory ring for same-host readers"""
+        if not self.shm_enabled or self._shared_ring_failed:
+            return
+
+        try:
+            if self.shared_ring is None or not self.shared_ring.writable:
+                self._close_shared_ring()
+                self.shared_ring = SharedChunkRing.create(
+                    self.shm_dir,
+                    self.channel_id,
+                    ConfigHelper.shm_buffer_slots(),
+                    self.target_chunk_size
+                )
+            self.shared_ring.write(chunk_index, chunk_data)
+        except Exception as e:
+            # Out of shared memory, read-only /dev/shm, etc. - Redis still has every chunk
+            logger.warning(f"Disabling shared-memory ring for channel {self.channel_id}: {e}")
+            self._shared_ring_failed = True
+            self._close_shared_ring(unlink=True)
+
+    def _get_read_ring(self):
+        """Get the shared-memory ring to read from, attaching to the owner's ring if present"""
+        if not self.shm_enabled:
+            return None
+
+        if self.shared_ring is None:
+            # Don't hit the filesystem on every read when there's no ring on this host
+            now = time.time()
+            if now - self._shared_ring_attach_time < 1.0:
+                return None
+            self._shared_ring_attach_time = now
+
+            try:
+                self.shared_ring = SharedChunkRing.attach(self.shm_dir, self.channel_id)
+            except Exception as e:
+                logger.debug(f"Could not attach shared-memory ring for channel {self.channel_id}: {e}")
+                self.shared_ring = None
+
+        return self.shared_ring
+
+    def _close_shared_ring(self, unlink=False):
+        """Unmap the shared-memory ring if we have one"""
+        if self.shared_ring is not None:
+            self.shared_ring.close(unlink=unlink)
+            self.shared_ring = None
+
     def stop(self):
         """Stop the buffer and cancel all timers"""
         # Set stopping flag first to prevent new timer creation
@@ -251,33 +500,28 @@ class StreamBuffer:
 
         try:
             # Flush any remaining data in the write buffer
-            if hasattr(self, '_write_buffer') and len(self._write_buffer) > 0:
+            if self._write_pos > 0:
                 # Ensure remaining data is aligned to TS packets
-                complete_size = (len(self._write_buffer) // 188) * 188
+                complete_size = (self._write_pos // TS_PACKET_SIZE) * TS_PACKET_SIZE
 
                 if complete_size > 0:
-                    final_chunk = self._write_buffer[:complete_size]
-
-                    # Write final chunk to Redis
                     with self.lock:
-                        if self.redis_client:
-                            try:
-                                chunk_index = self.redis_client.incr(self.buffer_index_key)
-                                chunk_key = f"{self.buffer_prefix}{chunk_index}"
-                                self.redis_client.setex(chunk_key, self.chunk_ttl, bytes(final_chunk))
-                                self.index = chunk_index
-                                logger.info(f"Flushed final chunk of {len(final_chunk)} bytes to Redis")
-                            except Exception as e:
-                                logger.error(f"Error flushing final chunk: {e}")
-
-                # Clear buffers
-                self._write_buffer = bytearray()
-                if hasattr(self, '_partial_packet'):
-                    self._partial_packet = bytearray()
+                        try:
+                            if self._store_chunk(self._write_view[:complete_size]):
+                                logger.info(f"Flushed final chunk of {complete_size} bytes to Redis")
+                        except Exception as e:
+                            logger.error(f"Error flushing final chunk: {e}")
+
+                # Clear buffer
+                self._write_pos = 0
 
         except Exception as e:
             logger.error(f"Error during buffer stop: {e}")
 
+        # Release the shared-memory ring - the writer also removes the file
+        self._close_shared_ring(unlink=True)
+        self.chunk_cache.invalidate(self.channel_id)
+
     def get_optimized_client_data(self, client_index):
         """Get optimal amount of data for client streaming based on position and target size"""
         # Define limits
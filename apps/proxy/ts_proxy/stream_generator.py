@@ -14,6 +14,11 @@ from .redis_keys import RedisKeys
 from .utils import get_logger
 from .constants import ChannelMetadataField
 from .config_helper import ConfigHelper  # Add this import
+from .fanout import ChannelFanout
+from .client_stats import ClientStatsAggregator
+from .redis_scripts import run_script, CHECK_CLIENT_RESOURCES
+from .linger import LingerPolicy
+from .warm_pool import WarmPool
 
 logger = get_logger()
 
@@ -161,6 +166,14 @@ class StreamGenerator:
         current_buffer_index = buffer.index
         self.local_index = max(0, current_buffer_index - initial_behind)
 
+        # Start on a PAT/PMT + keyframe boundary so players can decode right away
+        self.join_point = None
+        if ConfigHelper.keyframe_join_enabled():
+            join_point = buffer.get_join_point(self.local_index + 1)
+            if join_point and join_point[0] <= current_buffer_index:
+                self.join_point = join_point
+                self.local_index = join_point[0] - 1
+
         # Store important objects as instance variables
         self.buffer = buffer
         self.stream_manager = stream_manager
@@ -169,6 +182,12 @@ class StreamGenerator:
         self.consecutive_empty = 0
         self.is_owner_worker = proxy_server.am_i_owner(self.channel_id) if hasattr(proxy_server, 'am_i_owner') else True
 
+        # Receive data from the channel's fan-out reader instead of polling the buffer ourselves
+        self.subscription = None
+        if ConfigHelper.fanout_enabled():
+            self.subscription = ChannelFanout.subscribe(buffer, self.client_id, self.local_index)
+        self.blocking_reads = self.subscription is not None or buffer.blocking_reads
+
         logger.info(f"[{self.client_id}] Starting stream at index {self.local_index} (buffer at {buffer.index})")
         return True
 
@@ -181,9 +200,15 @@ class StreamGenerator:
                 break
 
             # Get chunks at client's position using improved strategy
-            chunks, next_index = self.buffer.get_optimized_client_data(self.local_index)
+            chunks, next_index = self._get_next_chunks()
+
+            if self.subscription and self.subscription.closed:
+                logger.info(f"[{self.client_id}] Fan-out subscription closed ({self.subscription.close_reason}), terminating stream")
+                break
 
             if chunks:
+                if self.join_point:
+                    chunks = self._trim_to_join_point(chunks, next_index)
                 yield from self._process_chunks(chunks, next_index)
                 self.local_index = next_index
                 self.last_yield_time = time.time()
@@ -202,8 +227,8 @@ class StreamGenerator:
                     self.last_yield_time = time.time()
                     self.consecutive_empty = 0  # Reset consecutive counter but keep total empty_reads
                     gevent.sleep(Config.KEEPALIVE_INTERVAL)  # Replace time.sleep
-                else:
-                    # Standard wait with backoff
+                elif not self.blocking_reads:
+                    # Standard wait with backoff (blocking buffers already waited for data)
                     sleep_time = min(0.1 * self.consecutive_empty, 1.0)
                     gevent.sleep(sleep_time)  # Replace time.sleep
 
@@ -221,6 +246,28 @@ class StreamGenerator:
                 if self._is_timeout():
                     break
 
+    def _get_next_chunks(self):
+        """Get the next chunks for this client from its fan-out queue or the buffer"""
+        if self.subscription:
+            batch = self.subscription.get(timeout=ConfigHelper.keepalive_interval() * 2)
+            return batch if batch else ([], self.local_index)
+
+        return self.buffer.get_optimized_client_data(self.local_index)
+
+    def _trim_to_join_point(self, chunks, next_index):
+        """Start the first chunk sent to the client at its keyframe join point"""
+        chunk_index, offset, prefix = self.join_point
+        self.join_point = None
+
+        # Only trim if the batch really starts with the join chunk (none were skipped)
+        if next_index - len(chunks) + 1 != chunk_index:
+            logger.debug(f"[{self.client_id}] First batch doesn't start at join chunk {chunk_index}, not trimming")
+            return chunks
+
+        logger.debug(f"[{self.client_id}] Joining at chunk {chunk_index} offset {offset}"
+                     f"{' with PAT/PMT prepended' if prefix else ''}")
+        return [prefix + chunks[0][offset:]] + chunks[1:]
+
     def _check_resources(self):
         """Check if required resources still exist."""
         proxy_server = ProxyServer.get_instance()
@@ -236,24 +283,28 @@ class StreamGenerator:
 
         # Check if this specific client has been stopped (Redis keys, etc.)
         if proxy_server.redis_client:
-            # Channel stop check - with extended key set
-            stop_key = RedisKeys.channel_stopping(self.channel_id)
-            if proxy_server.redis_client.exists(stop_key):
+            # Channel stop flag, channel state and client stop flag in a single round trip
+            stopping, state, client_stop = run_script(
+                proxy_server.redis_client,
+                CHECK_CLIENT_RESOURCES,
+                keys=[
+                    RedisKeys.channel_stopping(self.channel_id),
+                    RedisKeys.channel_metadata(self.channel_id),
+                    RedisKeys.client_stop(self.channel_id, self.client_id),
+                ],
+                args=[ChannelMetadataField.STATE]
+            )
+
+            if stopping:
                 logger.info(f"[{self.client_id}] Detected channel stop signal, terminating stream")
                 return False
 
-            # Also check channel state in metadata
-            metadata_key = RedisKeys.channel_metadata(self.channel_id)
-            metadata = proxy_server.redis_client.hgetall(metadata_key)
-            if metadata and b'state' in metadata:
-                state = metadata[b'state'].decode('utf-8')
-                if state in ['error', 'stopped', 'stopping']:
-                    logger.info(f"[{self.client_id}] Channel in {state} state, terminating stream")
-                    return False
+            state = state.decode('utf-8') if state else ''
+            if state in ['error', 'stopped', 'stopping']:
+                logger.info(f"[{self.client_id}] Channel in {state} state, terminating stream")
+                return False
 
-            # Client stop check
-            client_stop_key = RedisKeys.client_stop(self.channel_id, self.client_id)
-            if proxy_server.redis_client.exists(client_stop_key):
+            if client_stop:
                 logger.info(f"[{self.client_id}] Detected client stop signal, terminating stream")
                 return False
 
@@ -271,7 +322,7 @@ class StreamGenerator:
         # Process and send chunks
         total_size = sum(len(c) for c in chunks)
         logger.debug(f"[{self.client_id}] Retrieved {len(chunks)} chunks ({total_size} bytes) from index {self.local_index+1} to {next_index}")
-        proxy_server = ProxyServer.get_instance()
+        stats_aggregator = ClientStatsAggregator.get_instance()
 
         # Send the chunks to the client
         for chunk in chunks:
@@ -302,21 +353,14 @@ class StreamGenerator:
                     logger.debug(f"[{self.client_id}] Stats: {self.chunks_sent} chunks, {self.bytes_sent/1024:.1f} KB, "
                                 f"avg: {avg_rate:.1f} KB/s, current: {self.current_rate:.1f} KB/s")
 
-                # Store stats in Redis client metadata
-                if proxy_server.redis_client:
-                    try:
-                        client_key = RedisKeys.client_metadata(self.channel_id, self.client_id)
-                        stats = {
-                            ChannelMetadataField.CHUNKS_SENT: str(self.chunks_sent),
-                            ChannelMetadataField.BYTES_SENT: str(self.bytes_sent),
-                            ChannelMetadataField.AVG_RATE_KBPS: str(round(avg_rate, 1)),
-                            ChannelMetadataField.CURRENT_RATE_KBPS: str(round(self.current_rate, 1)),
-                            ChannelMetadataField.STATS_UPDATED_AT: str(current_time)
-                        }
-                        proxy_server.redis_client.hset(client_key, mapping=stats)
-                        # No need to set expiration as client heartbeat will refresh this key
-                    except Exception as e:
-                        logger.warning(f"[{self.client_id}] Failed to store stats in Redis: {e}")
+                # Queue stats for the client metadata - written to Redis in batches
+                stats_aggregator.record(self.channel_id, self.client_id, {
+                    ChannelMetadataField.CHUNKS_SENT: str(self.chunks_sent),
+                    ChannelMetadataField.BYTES_SENT: str(self.bytes_sent),
+                    ChannelMetadataField.AVG_RATE_KBPS: str(round(avg_rate, 1)),
+                    ChannelMetadataField.CURRENT_RATE_KBPS: str(round(self.current_rate, 1)),
+                    ChannelMetadataField.STATS_UPDATED_AT: str(current_time)
+                }, sent_bytes=len(chunk))
 
             except Exception as e:
                 logger.error(f"[{self.client_id}] Error sending chunk to client: {e}")
@@ -366,6 +410,11 @@ class StreamGenerator:
         total_clients = 0
         proxy_server = ProxyServer.get_instance()
 
+        if getattr(self, 'subscription', None):
+            self.subscription.close("client disconnected")
+
+        ClientStatsAggregator.get_instance().discard(self.channel_id, self.client_id)
+
         # Release M3U profile stream allocation if this is the last client
         stream_released = False
         if proxy_server.redis_client:
@@ -380,8 +429,10 @@ class StreamGenerator:
                         # Check if we're the last client
                         if self.channel_id in proxy_server.client_managers:
                             client_count = proxy_server.client_managers[self.channel_id].get_total_client_count()
-                            # Only the last client or owner should release the stream
-                            if client_count <= 1 and proxy_server.am_i_owner(self.channel_id):
+                            # Only the last client or owner should release the stream. A lingering
+                            # channel keeps its slot until it stops (or gives the slot up).
+                            if (client_count <= 1 and proxy_server.am_i_owner(self.channel_id)
+                                    and not ConfigHelper.channel_linger_enabled()):
                                 from apps.channels.models import Channel
                                 try:
                                     # Get the channel by UUID
@@ -415,15 +466,17 @@ class StreamGenerator:
             logger.info(f"No local clients left for channel {self.channel_id}, scheduling shutdown")
 
             def delayed_shutdown():
-                # Use the config setting instead of hardcoded value
-                shutdown_delay = ConfigHelper.channel_shutdown_delay()  # Use ConfigHelper
+                # Linger for returning clients if the channel's history suggests they'll be back
+                shutdown_delay = LingerPolicy.linger_delay(proxy_server.redis_client, self.channel_id)
                 logger.info(f"Waiting {shutdown_delay}s before checking if channel should be stopped")
                 gevent.sleep(shutdown_delay)  # Replace time.sleep
 
                 # After delay, check global client count
                 if self.channel_id in proxy_server.client_managers:
                     total = proxy_server.client_managers[self.channel_id].get_total_client_count()
-                    if total == 0:
+                    if total == 0 and WarmPool.is_warm(proxy_server.redis_client, self.channel_id):
+                        logger.info(f"Not shutting down channel {self.channel_id}, it's in the warm pool")
+                    elif total == 0:
                         logger.info(f"Shutting down channel {self.channel_id} as no clients connected")
                         proxy_server.stop_channel(self.channel_id)
                     else:
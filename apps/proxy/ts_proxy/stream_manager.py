@@ -14,6 +14,9 @@ from apps.channels.models import Channel, Stream
 from apps.m3u.models import M3UAccount, M3UAccountProfile
 from core.models import UserAgent, CoreSettings
 from .stream_buffer import StreamBuffer
+from .hls_ingest import HLSReader, HLSUnsupported
+from .upstream_registry import UpstreamRegistry
+from .stream_probe import limit_to_free_slots, probe_first_healthy
 from .utils import detect_stream_type, get_logger
 from .redis_keys import RedisKeys
 from .constants import ChannelState, EventType, StreamType, ChannelMetadataField, TS_PACKET_SIZE
@@ -47,6 +50,15 @@ class StreamManager:
         self.transcode = transcode
         self.transcode_process = None
 
+        self.force_ffmpeg = False
+
+        # Native HLS ingest (HLS sources read without ffmpeg)
+        self.hls_native = False
+        self.hls_reader = None
+
+        # Connection left open by a winning failover probe, used by the next HTTP connect
+        self._probed_connection = None
+
         # User agent for connection
         self.user_agent = user_agent or Config.DEFAULT_USER_AGENT
 
@@ -54,7 +66,6 @@ class StreamManager:
         self.last_data_time = time.time()
         self.healthy = True
         self.health_check_interval = ConfigHelper.get('HEALTH_CHECK_INTERVAL', 5)
-        self.chunk_size = ConfigHelper.chunk_size()
 
         # Add to your __init__ method
         self._buffer_check_timers = []
@@ -101,6 +112,13 @@ class StreamManager:
         self.bytes_processed = 0
         self.last_bytes_update = time.time()
         self.bytes_update_interval = 5  # Update Redis every 5 seconds
+        self.last_data_update = 0
+        self.last_data_update_interval = ConfigHelper.last_data_update_interval()
+
+        # Upstream data is read into this buffer and handed to the stream buffer as views,
+        # which copies it once into its own write buffer
+        self._read_buffer = bytearray(ConfigHelper.upstream_read_size())
+        self._read_view = memoryview(self._read_buffer)
 
     def _create_session(self):
         """Create and configure requests session with optimal settings"""
@@ -155,13 +173,17 @@ class StreamManager:
 
                 # Check stream type before connecting
                 stream_type = detect_stream_type(self.url)
+                self.hls_native = False
                 if self.transcode == False and stream_type == StreamType.HLS:
                     logger.info(f"Detected HLS stream: {self.url}")
-                    logger.info(f"HLS streams will be handled with FFmpeg for now - future version will support HLS natively")
-                    # Enable transcoding for HLS streams
-                    self.transcode = True
-                    # We'll override the stream profile selection with ffmpeg in the transcoding section
-                    self.force_ffmpeg = True
+                    if ConfigHelper.hls_native_ingest():
+                        # Read the playlist ourselves - falls back to FFmpeg if it can't be read natively
+                        self.hls_native = True
+                    else:
+                        # Enable transcoding for HLS streams
+                        self.transcode = True
+                        # We'll override the stream profile selection with ffmpeg in the transcoding section
+                        self.force_ffmpeg = True
                 # Reset connection retry count for this specific URL
                 self.retry_count = 0
                 url_failed = False
@@ -177,10 +199,7 @@ class StreamManager:
                     # Handle connection based on whether we transcode or not
                     connection_result = False
                     try:
-                        if self.transcode:
-                            connection_result = self._establish_transcode_connection()
-                        else:
-                            connection_result = self._establish_http_connection()
+                        connection_result = self._establish_connection()
 
                         if connection_result:
                             # Store connection start time to measure success duration
@@ -310,6 +329,51 @@ class StreamManager:
 
             logger.info(f"Stream manager stopped for channel {self.channel_id}")
 
+    def _establish_connection(self):
+        """Connect to the current URL the way its stream type requires"""
+        if self.transcode:
+            return self._establish_transcode_connection()
+        if self.hls_native:
+            return self._establish_hls_connection()
+        return self._establish_http_connection()
+
+    def _establish_hls_connection(self):
+        """Start reading an HLS playlist natively, falling back to FFmpeg if it can't be"""
+        try:
+            logger.debug(f"Using native HLS ingest for stream: {self.url}")
+            self._close_hls_reader()
+
+            reader = HLSReader(self.url, self.user_agent)
+            self.hls_reader = reader
+            reader.open()
+
+            self.connected = True
+            self.healthy = True
+            logger.info(f"Successfully connected to HLS stream source")
+
+            # Store connection start time for stability tracking
+            self.connection_start_time = time.time()
+
+            # Set channel state to waiting for clients
+            self._set_waiting_for_clients()
+
+            return True
+        except HLSUnsupported as e:
+            logger.info(f"HLS stream can't be read natively ({e}), handling it with FFmpeg")
+            self._close_hls_reader()
+            self.hls_native = False
+            self.transcode = True
+            self.force_ffmpeg = True
+            return self._establish_transcode_connection()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"HLS playlist request error: {e}")
+            self._close_hls_reader()
+            return False
+        except Exception as e:
+            logger.error(f"Error establishing HLS connection: {e}", exc_info=True)
+            self._close_hls_reader()
+            return False
+
     def _establish_transcode_connection(self):
         """Establish a connection using transcoding"""
         try:
@@ -317,7 +381,7 @@ class StreamManager:
             channel = get_stream_object(self.channel_id)
 
             # Use FFmpeg specifically for HLS streams
-            if hasattr(self, 'force_ffmpeg') and self.force_ffmpeg:
+            if self.force_ffmpeg:
                 from core.models import StreamProfile
                 try:
                     stream_profile = StreamProfile.objects.get(name='ffmpeg', locked=True)
@@ -343,6 +407,10 @@ class StreamManager:
             # Set flag that transcoding process is active
             self.transcode_process_active = True
 
+            # Channels that would run the same command can read this session's buffer
+            if not self.force_ffmpeg and hasattr(self.buffer, 'redis_client'):
+                UpstreamRegistry.register_transcode(self.buffer.redis_client, self.channel_id, self.transcode_cmd)
+
             self.socket = self.transcode_process.stdout  # Read from std output
             self.connected = True
 
@@ -363,16 +431,31 @@ class StreamManager:
         try:
             logger.debug(f"Using TS Proxy to connect to stream: {self.url}")
 
-            # Create new session for each connection attempt
-            session = self._create_session()
-            self.current_session = session
-
-            # Stream the URL with proper timeout handling
-            response = session.get(
-                self.url,
-                stream=True,
-                timeout=(10, 60)  # 10s connect timeout, 60s read timeout
-            )
+            probed = self._probed_connection
+            self._probed_connection = None
+            if probed and probed.url == self.url:
+                # Carry on reading the connection the failover probe opened
+                logger.info(f"Using connection opened by failover probe")
+                # The probe read with its short timeout - stream with the normal one
+                probed.set_read_timeout(60)
+                session = probed.session
+                self.current_session = session
+                response = probed.response
+            else:
+                if probed:
+                    probed.close()
+                    probed = None
+
+                # Create new session for each connection attempt
+                session = self._create_session()
+                self.current_session = session
+
+                # Stream the URL with proper timeout handling
+                response = session.get(
+                    self.url,
+                    stream=True,
+                    timeout=(10, 60)  # 10s connect timeout, 60s read timeout
+                )
             self.current_response = response
 
             if response.status_code == 200:
@@ -386,6 +469,11 @@ class StreamManager:
                 # Set channel state to waiting for clients
                 self._set_waiting_for_clients()
 
+                # Keep the packets the probe already read
+                if probed and probed.data:
+                    self._update_bytes_processed(len(probed.data))
+                    self.buffer.add_chunk(probed.data)
+
                 return True
             else:
                 logger.error(f"Failed to connect to stream: HTTP {response.status_code}")
@@ -424,6 +512,32 @@ class StreamManager:
         except Exception as e:
             logger.error(f"Error updating bytes processed: {e}")
 
+    def _mark_data_received(self):
+        """Record that upstream data arrived (in Redis at most once per update interval)"""
+        now = time.time()
+        self.last_data_time = now
+
+        if now - self.last_data_update < self.last_data_update_interval:
+            return
+        self.last_data_update = now
+
+        if hasattr(self.buffer, 'redis_client') and self.buffer.redis_client:
+            last_data_key = RedisKeys.last_data(self.buffer.channel_id)
+            self.buffer.redis_client.set(last_data_key, str(now), ex=60)
+
+    def _upstream_reader(self):
+        """
+        File object to read the upstream HTTP body from. Without a content encoding this
+        is the http.client response under urllib3, whose readinto() fills our buffer
+        directly; urllib3's own readinto() reads into a temporary bytes object first.
+        """
+        raw = self.current_response.raw
+        if raw.headers.get('Content-Encoding', 'identity').lower() == 'identity':
+            fp = getattr(raw, '_fp', None)
+            if fp is not None and hasattr(fp, 'readinto'):
+                return fp
+        return raw
+
     def _process_stream_data(self):
         """Process stream data until disconnect or error"""
         try:
@@ -436,32 +550,38 @@ class StreamManager:
                         if not self.running:
                             break
                         gevent.sleep(0.1)  # REPLACE time.sleep(0.1)
+            elif self.hls_reader:
+                self._process_hls_data()
             else:
                 # Handle direct HTTP connection
                 chunk_count = 0
                 try:
-                    for chunk in self.current_response.iter_content(chunk_size=self.chunk_size):
+                    reader = self._upstream_reader()
+                    while True:
                         # Check if we've been asked to stop
                         if self.stop_requested or self.url_switching:
                             break
 
-                        if chunk:
-                            # Track chunk size before adding to buffer
-                            chunk_size = len(chunk)
-                            self._update_bytes_processed(chunk_size)
+                        # Blocks until the read buffer is full, which costs no latency as
+                        # clients only see data once a whole (larger) buffer chunk is written
+                        size = reader.readinto(self._read_view)
+                        if not size:
+                            break
+
+                        # Track chunk size before adding to buffer
+                        self._update_bytes_processed(size)
 
-                            # Add chunk to buffer with TS packet alignment
-                            success = self.buffer.add_chunk(chunk)
+                        # Add chunk to buffer with TS packet alignment
+                        success = self.buffer.add_chunk(self._read_view[:size])
 
-                            if success:
-                                self.last_data_time = time.time()
-                                chunk_count += 1
+                        if self.buffer.fenced_out:
+                            self._stop_fenced_out()
+                            break
 
-                                # Update last data timestamp in Redis
-                                if hasattr(self.buffer, 'redis_client') and self.buffer.redis_client:
-                                    last_data_key = RedisKeys.last_data(self.buffer.channel_id)
-                                    self.buffer.redis_client.set(last_data_key, str(time.time()), ex=60)
-                except (AttributeError, ConnectionError) as e:
+                        if success:
+                            chunk_count += 1
+                            self._mark_data_received()
+                except (AttributeError, ValueError, OSError) as e:
                     if self.stop_requested or self.url_switching:
                         logger.debug(f"Expected connection error during shutdown/URL switch: {e}")
                     else:
@@ -473,6 +593,37 @@ class StreamManager:
         # If we exit the loop, connection is closed or failed
         self.connected = False
 
+    def _process_hls_data(self):
+        """Add natively read HLS segments to the buffer until disconnect or error"""
+        reader = self.hls_reader
+        should_stop = lambda: self.stop_requested or self.url_switching or not self.running
+        try:
+            for packets in reader.segments(should_stop):
+                self._update_bytes_processed(len(packets))
+
+                success = self.buffer.add_chunk(packets)
+
+                if self.buffer.fenced_out:
+                    self._stop_fenced_out()
+                    break
+
+                if success:
+                    self._mark_data_received()
+        except Exception as e:
+            if should_stop() or reader.closed:
+                logger.debug(f"Expected HLS error during shutdown/URL switch: {e}")
+            else:
+                logger.error(f"HLS stream error: {e}")
+
+    def _close_hls_reader(self):
+        """Stop native HLS ingest"""
+        if self.hls_reader:
+            try:
+                self.hls_reader.close()
+            except Exception as e:
+                logger.debug(f"Error closing HLS reader: {e}")
+            self.hls_reader = None
+
     def _close_all_connections(self):
         """Close all connection resources"""
         if self.socket:
@@ -493,6 +644,9 @@ class StreamManager:
             except Exception as e:
                 logger.debug(f"Error closing session: {e}")
 
+        self._close_hls_reader()
+        self._discard_probed_connection()
+
         # Clear references
         self.socket = None
         self.current_response = None
@@ -545,6 +699,11 @@ class StreamManager:
         # Set running to false to ensure thread exits
         self.running = False
 
+    def _stop_fenced_out(self):
+        """Stop streaming after the buffer rejected a write because another worker took over the channel"""
+        logger.warning(f"Worker {self.worker_id} lost ownership of channel {self.channel_id}, stopping stream manager")
+        self.stop()
+
     def update_url(self, new_url, stream_id=None):
         """Update stream URL and reconnect with proper cleanup for both HTTP and transcode sessions"""
         if new_url == self.url:
@@ -718,10 +877,7 @@ class StreamManager:
             # Attempt to establish a new connection using the same URL
             connection_result = False
             try:
-                if self.transcode:
-                    connection_result = self._establish_transcode_connection()
-                else:
-                    connection_result = self._establish_http_connection()
+                connection_result = self._establish_connection()
 
                 if connection_result:
                     # Store connection start time to measure stability
@@ -780,10 +936,12 @@ class StreamManager:
                 logger.debug(f"Error closing session: {e}")
             self.current_session = None
 
+        self._close_hls_reader()
+
     def _close_socket(self):
         """Close socket and transcode resources as needed"""
-        # First try to use _close_connection for HTTP resources
-        if self.current_response or self.current_session:
+        # First try to use _close_connection for HTTP and HLS resources
+        if self.current_response or self.current_session or self.hls_reader:
             self._close_connection()
             return
 
@@ -855,19 +1013,13 @@ class StreamManager:
             return False
 
         try:
-            # Read data chunk - no need to align with TS packet size anymore
-            try:
-                # Try to read data chunk
-                if hasattr(self.socket, 'recv'):
-                    chunk = self.socket.recv(Config.CHUNK_SIZE)  # Standard socket
-                else:
-                    chunk = self.socket.read(Config.CHUNK_SIZE)  # SocketIO object
-
-            except AttributeError:
-                # Fall back to read() if recv() isn't available
-                chunk = self.socket.read(Config.CHUNK_SIZE)
+            # Read data into the reused read buffer - no need to align with TS packet size anymore
+            if hasattr(self.socket, 'recv_into'):
+                size = self.socket.recv_into(self._read_view)  # Standard socket
+            else:
+                size = self.socket.readinto(self._read_view)  # Process pipe / SocketIO object
 
-            if not chunk:
+            if not size:
                 # Connection closed by server
                 logger.warning("Server closed connection")
                 self._close_socket()
@@ -875,16 +1027,17 @@ class StreamManager:
                 return False
 
             # Track chunk size before adding to buffer
-            chunk_size = len(chunk)
-            self._update_bytes_processed(chunk_size)
+            self._update_bytes_processed(size)
 
             # Add directly to buffer without TS-specific processing
-            success = self.buffer.add_chunk(chunk)
+            success = self.buffer.add_chunk(self._read_view[:size])
+
+            if self.buffer.fenced_out:
+                self._stop_fenced_out()
+                return False
 
-            # Update last data timestamp in Redis if successful
-            if success and hasattr(self.buffer, 'redis_client') and self.buffer.redis_client:
-                last_data_key = RedisKeys.last_data(self.buffer.channel_id)
-                self.buffer.redis_client.set(last_data_key, str(time.time()), ex=60)
+            if success:
+                self._mark_data_received()
 
             return True
 
@@ -1024,20 +1177,28 @@ class StreamManager:
                     logger.warning(f"All {len(alternate_streams)} alternate streams have been tried for channel {self.channel_id}")
                 return False
 
-            # Get the next stream to try
-            next_stream = untried_streams[0]
-            stream_id = next_stream['stream_id']
+            probe_count = ConfigHelper.failover_probe_count()
+            if probe_count > 1 and len(untried_streams) > 1:
+                # Probe several alternates at once and switch to the first healthy one
+                stream_info = self._probe_alternates(untried_streams, probe_count)
+                if stream_info is None:
+                    return False
+                stream_id = stream_info['stream_id']
+            else:
+                # Get the next stream to try
+                next_stream = untried_streams[0]
+                stream_id = next_stream['stream_id']
 
-            # Add to tried streams
-            self.tried_stream_ids.add(stream_id)
+                # Add to tried streams
+                self.tried_stream_ids.add(stream_id)
 
-            # Get stream info including URL
-            logger.info(f"Trying next stream ID {stream_id} for channel {self.channel_id}")
-            stream_info = get_stream_info_for_switch(self.channel_id, stream_id)
+                # Get stream info including URL
+                logger.info(f"Trying next stream ID {stream_id} for channel {self.channel_id}")
+                stream_info = get_stream_info_for_switch(self.channel_id, stream_id)
 
-            if 'error' in stream_info or not stream_info.get('url'):
-                logger.error(f"Error getting info for stream {stream_id}: {stream_info.get('error', 'No URL')}")
-                return False
+                if 'error' in stream_info or not stream_info.get('url'):
+                    logger.error(f"Error getting info for stream {stream_id}: {stream_info.get('error', 'No URL')}")
+                    return False
 
             # Update URL and user agent
             new_url = stream_info['url']
@@ -1061,14 +1222,19 @@ class StreamManager:
                     ChannelMetadataField.USER_AGENT: new_user_agent,
                     ChannelMetadataField.STREAM_PROFILE: stream_info['stream_profile'],
                     ChannelMetadataField.M3U_PROFILE: stream_info['m3u_profile_id'],
+                    ChannelMetadataField.TRANSCODE: "1" if new_transcode else "0",
                     ChannelMetadataField.STREAM_ID: str(stream_id),
                     ChannelMetadataField.STREAM_SWITCH_TIME: str(time.time()),
                     ChannelMetadataField.STREAM_SWITCH_REASON: "max_retries_exceeded"
                 })
+                # The new URL's transcode session (if any) registers once it's running
+                self.buffer.redis_client.hdel(metadata_key, ChannelMetadataField.TRANSCODE_SESSION)
 
                 # Log the switch
                 logger.info(f"Stream metadata updated for channel {self.channel_id} to stream ID {stream_id}")
 
+                UpstreamRegistry.register(self.buffer.redis_client, self.channel_id)
+
             # IMPORTANT: Just update the URL, don't stop the channel or release resources
             switch_result = self.update_url(new_url, stream_id)
             if not switch_result:
@@ -1082,6 +1248,63 @@ class StreamManager:
             logger.error(f"Error trying next stream for channel {self.channel_id}: {e}", exc_info=True)
             return False
 
+    def _probe_alternates(self, untried_streams, probe_count):
+        """
+        Probe untried streams probe_count at a time until one delivers media.
+        Returns the winner's stream info, or None if none did.
+        """
+        timeout = ConfigHelper.failover_probe_timeout()
+        redis_client = getattr(self.buffer, 'redis_client', None)
+        current_profile_id = None
+        if redis_client:
+            metadata_key = RedisKeys.channel_metadata(self.channel_id)
+            current_profile_id = redis_client.hget(metadata_key, ChannelMetadataField.M3U_PROFILE)
+            current_profile_id = current_profile_id.decode('utf-8') if current_profile_id else None
+
+        for start in range(0, len(untried_streams), probe_count):
+            candidates = []
+            for stream in untried_streams[start:start + probe_count]:
+                stream_id = stream['stream_id']
+                self.tried_stream_ids.add(stream_id)
+                stream_info = get_stream_info_for_switch(self.channel_id, stream_id)
+                if 'error' in stream_info or not stream_info.get('url'):
+                    logger.error(f"Error getting info for stream {stream_id}: {stream_info.get('error', 'No URL')}")
+                    continue
+                candidates.append(stream_info)
+
+            # Each probe holds a provider connection - don't go over the M3U profiles' limits
+            candidates, deferred = limit_to_free_slots(redis_client, candidates, current_profile_id)
+            for stream_info in deferred:
+                logger.info(f"Not probing stream {stream_info['stream_id']} for channel {self.channel_id}: "
+                            f"M3U profile {stream_info['m3u_profile_id']} has no free slot")
+                # Leave it for a later attempt
+                self.tried_stream_ids.discard(stream_info['stream_id'])
+
+            if not candidates:
+                continue
+
+            ids_to_probe = ', '.join(str(candidate['stream_id']) for candidate in candidates)
+            logger.info(f"Probing streams [{ids_to_probe}] for channel {self.channel_id}")
+            connection = probe_first_healthy(candidates, timeout)
+            if connection is None:
+                logger.warning(f"No healthy stream among [{ids_to_probe}] for channel {self.channel_id}")
+                continue
+
+            if connection.reusable:
+                self._discard_probed_connection()
+                self._probed_connection = connection
+            else:
+                connection.close()
+            return connection.candidate
+
+        return None
+
+    def _discard_probed_connection(self):
+        """Close a probe connection nobody used"""
+        if self._probed_connection:
+            self._probed_connection.close()
+            self._probed_connection = None
+
     # Add a new helper method to safely reset the URL switching state
     def _reset_url_switching_state(self):
         """Safely reset the URL switching state if it gets stuck"""
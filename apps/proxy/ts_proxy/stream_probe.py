@@ -0,0 +1,249 @@
+"""
+Parallel failover probing.
+
+When a channel's stream fails, the next few alternates are probed at the
+same time instead of one after another. Each probe opens its stream and
+reads the first packets, and the first one to deliver MPEG-TS (or an HLS
+playlist) wins. The other probes' connections are closed as soon as there is
+a winner, and probes still connecting give up once they return. A winning
+plain HTTP connection is handed over to the stream manager with the bytes
+already read, so it doesn't connect again.
+
+Every probe holds a connection to the provider while it runs, so no more
+candidates of an M3U profile are probed at once than the profile has free
+slots. The slots are checked, not reserved: a client starting another
+channel of the profile during the probe can still briefly go over the limit.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
+import requests
+from .constants import StreamType, TS_PACKET_SIZE, TS_SYNC_BYTE
+from .stream_buffer import StreamBuffer
+from .utils import detect_stream_type, get_logger
+
+logger = get_logger()
+
+# A source must deliver this many aligned TS packets to count as healthy
+PROBE_PACKETS = 8
+
+
+class ProbedConnection:
+    """An open connection that passed a probe, with the bytes read while probing"""
+
+    def __init__(self, candidate, session, response, data, reusable):
+        self.candidate = candidate
+        self.url = candidate['url']
+        self.session = session
+        self.response = response
+        self.data = data
+        # Only a plain identity-encoded TS connection can be read on from where the probe stopped
+        self.reusable = reusable
+
+    def set_read_timeout(self, seconds):
+        """Replace the probe's short read timeout on the open socket"""
+        raw = self.response.raw
+        sock = getattr(getattr(raw, '_connection', None), 'sock', None)
+        if sock is None:
+            # Fall back to the socket under http.client's file object
+            sock = getattr(getattr(getattr(getattr(raw, '_fp', None), 'fp', None), 'raw', None), '_sock', None)
+        if sock is None:
+            logger.warning(f"Couldn't reset read timeout of probe connection to {self.url}")
+            return False
+        sock.settimeout(seconds)
+        return True
+
+    def close(self):
+        _close_quietly(self.session, self.response)
+
+
+def _close_quietly(session, response):
+    for resource in (response, session):
+        if resource is None:
+            continue
+        try:
+            resource.close()
+        except Exception as e:
+            logger.debug(f"Error closing probe connection: {e}")
+
+
+class _ProbeRace:
+    """Shared state of concurrent probes: the winner, and the connections of probes still running"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.winner = None
+        self.over = False
+        self.running = {}  # id(session) -> [session, response]
+
+    def track(self, session, response=None):
+        """Register (or update) a running probe's connection. Returns False if the race is already over."""
+        with self.lock:
+            if self.over:
+                return False
+            self.running[id(session)] = [session, response]
+            return True
+
+    def untrack(self, session):
+        with self.lock:
+            self.running.pop(id(session), None)
+
+    def finish(self, connection):
+        """Declare connection the winner and close every other probe's connection. Returns False if it lost."""
+        with self.lock:
+            self.running.pop(id(connection.session), None)
+            if self.over:
+                return False
+            self.winner = connection
+            self.over = True
+            losers, self.running = list(self.running.values()), {}
+
+        # Closing the response makes a probe blocked on its first read fail right away
+        for session, response in losers:
+            _close_quietly(session, response)
+        return True
+
+    def end(self):
+        """Stop the race, closing probes still running. Returns the winner, if any."""
+        with self.lock:
+            self.over = True
+            losers, self.running = list(self.running.values()), {}
+        for session, response in losers:
+            _close_quietly(session, response)
+        return self.winner
+
+
+def _is_ts(data):
+    """Whether data starts (after at most one packet of garbage) with consecutive TS packets"""
+    offset = StreamBuffer._find_packet_boundary(data)
+    if offset is None or len(data) - offset < TS_PACKET_SIZE * 3:
+        return False
+    return all(data[position] == TS_SYNC_BYTE for position in range(offset, len(data), TS_PACKET_SIZE))
+
+
+def probe_stream(candidate, timeout, race=None):
+    """
+    Open a candidate stream ({'url', 'user_agent', 'transcode'}) and check that it delivers
+    media. Returns a ProbedConnection, or raises an exception describing the failure.
+    With a race, the connection is registered so it's closed as soon as another probe wins.
+    """
+    url = candidate['url']
+    session = requests.Session()
+    session.headers.update({
+        'User-Agent': candidate.get('user_agent') or '',
+        'Connection': 'keep-alive'
+    })
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1, pool_block=False)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    response = None
+    try:
+        if race and not race.track(session):
+            raise ValueError("another probe already won")
+
+        response = session.get(url, stream=True, timeout=(timeout, timeout))
+        if race and not race.track(session, response):
+            raise ValueError("another probe already won")
+        if response.status_code != 200:
+            raise ValueError(f"HTTP {response.status_code}")
+
+        identity = response.raw.headers.get('Content-Encoding', 'identity').lower() == 'identity'
+        data = response.raw.read(TS_PACKET_SIZE * PROBE_PACKETS, decode_content=not identity)
+
+        if detect_stream_type(url) == StreamType.HLS:
+            if not data.lstrip().startswith(b'#EXTM3U'):
+                raise ValueError("not an HLS playlist")
+            reusable = False
+        else:
+            if not _is_ts(data):
+                raise ValueError("no MPEG-TS sync bytes in the first packets")
+            reusable = identity and not candidate.get('transcode')
+
+        return ProbedConnection(candidate, session, response, data, reusable)
+    except Exception:
+        if race:
+            race.untrack(session)
+        _close_quietly(session, response)
+        raise
+
+
+def _profile_max_streams(profile_id):
+    """Connection limit of an M3U profile (0 for no limit)"""
+    from apps.m3u.models import M3UAccountProfile
+
+    try:
+        return M3UAccountProfile.objects.get(id=profile_id).max_streams or 0
+    except M3UAccountProfile.DoesNotExist:
+        return 0
+
+
+def limit_to_free_slots(redis_client, candidates, current_profile_id=None):
+    """
+    Split candidates into those that can be probed at once without going over their
+    M3U profile's connection limit, and the rest. The channel's own slot counts as
+    free on its current profile, as the switch hands it over to the new stream.
+    Returns (to_probe, deferred).
+    """
+    free = {}  # profile ID -> free slots, None for no limit
+    to_probe, deferred = [], []
+    for candidate in candidates:
+        profile_id = candidate.get('m3u_profile_id')
+        if profile_id not in free:
+            max_streams = _profile_max_streams(profile_id)
+            if not max_streams or not redis_client:
+                free[profile_id] = None
+            else:
+                used = int(redis_client.get(f"profile_connections:{profile_id}") or 0)
+                own = 1 if str(profile_id) == str(current_profile_id) else 0
+                free[profile_id] = max(max_streams - used + own, 0)
+
+        if free[profile_id] is None:
+            to_probe.append(candidate)
+        elif free[profile_id] > 0:
+            free[profile_id] -= 1
+            to_probe.append(candidate)
+        else:
+            deferred.append(candidate)
+    return to_probe, deferred
+
+
+def probe_first_healthy(candidates, timeout):
+    """
+    Probe candidates concurrently. Returns the first healthy one as a ProbedConnection
+    (the caller owns it), or None if none passed within about one timeout.
+    """
+    if not candidates:
+        return None
+
+    race = _ProbeRace()
+
+    def probe(candidate):
+        connection = probe_stream(candidate, timeout, race)
+        if race.finish(connection):
+            return connection
+        # Lost the race (or was abandoned) - nobody will use this connection
+        connection.close()
+        return None
+
+    executor = ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix='failover-probe')
+    futures = {executor.submit(probe, candidate): candidate for candidate in candidates}
+    try:
+        # Connect and first read each get the timeout - allow a little slack on top
+        for future in as_completed(futures, timeout=timeout * 2 + 1):
+            candidate = futures[future]
+            try:
+                connection = future.result()
+            except Exception as e:
+                logger.info(f"Probe of stream {candidate.get('stream_id')} failed: {e}")
+                continue
+            if connection:
+                logger.info(f"Probe of stream {candidate.get('stream_id')} succeeded first")
+                return connection
+    except FutureTimeout:
+        logger.warning(f"Failover probes didn't finish within {timeout * 2 + 1}s")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # A probe may have won just as we stopped waiting - otherwise close the probes still running
+    return race.end()
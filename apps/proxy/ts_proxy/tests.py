@@ -0,0 +1,1346 @@
+import io
+import json
+import signal
+import tempfile
+import threading
+import time
+import gevent
+from types import SimpleNamespace
+from unittest import mock, skipIf
+
+from django.test import SimpleTestCase
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+from apps.proxy.config import TSConfig
+from . import stream_generator
+from .chunk_cache import ChunkCache
+from .client_manager import ClientManager
+from .client_registry import ClientRegistry
+from .client_stats import EGRESS_WINDOW, ClientStatsAggregator
+from .config_helper import ConfigHelper
+from .constants import ChannelMetadataField, ChannelState, EventType
+from .fanout import ChannelFanout, SlowClientPolicy, Subscription
+from .heartbeat import HeartbeatScheduler
+from .hls_ingest import HLSReader, mark_discontinuity
+from .init_flight import ChannelInitFlight
+from .linger import LingerPolicy
+from .ownership import FENCE_TTL, ChannelLease
+from .redis_keys import RedisKeys
+from .redis_stream_buffer import CHUNK_FIELD, RedisStreamBuffer
+from .server import CHANNEL_STATE_READS, ProxyServer
+from .services.channel_service import ChannelService
+from .shm_buffer import SharedChunkRing, _INDEX_FIELD
+from .stream_buffer import StreamBuffer
+from .stream_manager import StreamManager
+from .stream_probe import _ProbeRace, _is_ts, limit_to_free_slots
+from .ts_index import TSRandomAccessIndexer
+from .upstream_registry import UpstreamRegistry, session_key, transcode_session_key
+from .utils import run_blocking
+from .warm_pool import WarmPoolManager
+
+
+def ts_packets(count, first=0):
+    """count TS packets whose payload bytes number them, starting at first"""
+    return b''.join(bytes([0x47]) + bytes([(first + i) % 256]) * 187 for i in range(count))
+
+
+def ts_packet(pid, payload, start=False, adaptation=None):
+    """A single TS packet, padded with 0xFF stuffing"""
+    header = bytes([0x47, (0x40 if start else 0) | pid >> 8, pid & 0xFF, 0x30 if adaptation is not None else 0x10])
+    if adaptation is not None:
+        header += bytes([len(adaptation)]) + adaptation
+    return (header + payload).ljust(188, b'\xff')
+
+
+VIDEO_PID = 0x101
+# PAT pointing at a PMT on PID 0x100, which lists H.264 video on VIDEO_PID
+PAT = ts_packet(0x000, bytes([0x00, 0x00, 0xB0, 13, 0x00, 0x01, 0xC1, 0x00, 0x00,
+                              0x00, 0x01, 0xE1, 0x00]) + b'\x00' * 4, start=True)
+PMT = ts_packet(0x100, bytes([0x00, 0x02, 0xB0, 18, 0x00, 0x01, 0xC1, 0x00, 0x00, 0xE1, 0x01, 0xF0, 0x00,
+                              0x1B, 0xE1, 0x01, 0xF0, 0x00]) + b'\x00' * 4, start=True)
+
+
+def video_packet(nal_type):
+    """PES start on VIDEO_PID whose first NAL unit is of nal_type"""
+    pes = bytes([0x00, 0x00, 0x01, 0xE0, 0x00, 0x00, 0x80, 0x80, 0x05]) + b'\x21\x00\x01\x00\x01'
+    return ts_packet(VIDEO_PID, pes + bytes([0x00, 0x00, 0x00, 0x01, 0x60 | nal_type]), start=True)
+
+
+class TSRandomAccessIndexerTest(SimpleTestCase):
+    def test_keyframe_after_psi_joins_at_the_pat(self):
+        indexer = TSRandomAccessIndexer()
+        data = video_packet(1) + PAT + PMT + video_packet(1) + video_packet(5)
+
+        join = indexer.scan(data)
+        self.assertIsNotNone(join)
+        self.assertEqual(join.offset, 188)
+        self.assertTrue(join.has_psi)
+        self.assertEqual(indexer.video_pid, VIDEO_PID)
+        self.assertEqual(indexer.video_codec, 'h264')
+        self.assertEqual(indexer.psi, PAT + PMT)
+
+    def test_keyframe_in_a_later_chunk_needs_psi_prepended(self):
+        indexer = TSRandomAccessIndexer()
+        self.assertIsNone(indexer.scan(PAT + PMT + video_packet(1)))
+
+        join = indexer.scan(video_packet(1) + video_packet(5))
+        self.assertEqual(join.offset, 188)
+        self.assertFalse(join.has_psi)
+
+    def test_random_access_indicator_marks_a_join_point(self):
+        indexer = TSRandomAccessIndexer()
+        rai = ts_packet(VIDEO_PID, b'\x00\x00\x01\xe0', start=True, adaptation=b'\x40')
+        join = indexer.scan(PAT + PMT + rai)
+        self.assertEqual(join.offset, 0)
+        self.assertTrue(join.has_psi)
+
+    def test_no_join_point_without_keyframe_or_psi(self):
+        self.assertIsNone(TSRandomAccessIndexer().scan(video_packet(5)))
+
+        indexer = TSRandomAccessIndexer()
+        self.assertIsNone(indexer.scan(PAT + PMT + video_packet(1) + ts_packet(VIDEO_PID, b'\x00\x00\x01\x65')))
+
+
+class SharedChunkRingTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.ring = SharedChunkRing.create(self.tmp.name, 'channel-1', slot_count=4, slot_size=376)
+        self.addCleanup(self.ring.close)
+
+    def attach(self):
+        reader = SharedChunkRing.attach(self.tmp.name, 'channel-1')
+        self.assertIsNotNone(reader)
+        self.addCleanup(reader.close)
+        return reader
+
+    def test_reader_sees_written_chunks(self):
+        reader = self.attach()
+        self.assertTrue(self.ring.write(1, b'a' * 188))
+        self.assertTrue(self.ring.write(2, b'b' * 376))
+
+        self.assertEqual(reader.read(1), b'a' * 188)
+        self.assertEqual(reader.read(2), b'b' * 376)
+        self.assertEqual(reader.latest_index(), 2)
+        self.assertFalse(reader.writable)
+
+    def test_unwritten_and_invalid_indexes_miss(self):
+        self.assertIsNone(self.ring.read(1))
+        self.assertIsNone(self.ring.read(0))
+        self.assertFalse(self.ring.write(0, b'x'))
+
+    def test_oversized_chunk_is_rejected(self):
+        self.assertFalse(self.ring.write(1, b'x' * 377))
+        self.assertIsNone(self.ring.read(1))
+
+    def test_wraparound_overwrites_oldest_slots(self):
+        for index in range(1, 7):
+            self.ring.write(index, bytes([index]) * 188)
+
+        # Slots of chunks 1 and 2 now hold chunks 5 and 6
+        self.assertIsNone(self.ring.read(1))
+        self.assertIsNone(self.ring.read(2))
+        for index in range(3, 7):
+            self.assertEqual(self.ring.read(index), bytes([index]) * 188)
+
+    def test_slot_being_rewritten_is_a_miss(self):
+        self.ring.write(5, b'x' * 188)
+
+        # Writer stamped the slot with a newer index but hasn't finished the data yet
+        _INDEX_FIELD.pack_into(self.ring._mm, self.ring._slot_offset(5 % 4), 9)
+        self.assertIsNone(self.ring.read(5))
+        self.assertIsNone(self.ring.read(9))
+
+    def test_recreated_ring_is_detected_as_replaced(self):
+        reader = self.attach()
+        self.assertFalse(reader.is_replaced())
+
+        replacement = SharedChunkRing.create(self.tmp.name, 'channel-1', slot_count=4, slot_size=376)
+        self.addCleanup(replacement.close)
+        self.assertTrue(reader.is_replaced())
+
+    def test_attach_without_ring_returns_none(self):
+        self.assertIsNone(SharedChunkRing.attach(self.tmp.name, 'other-channel'))
+
+
+class StreamBufferAddChunkTest(SimpleTestCase):
+    def make_buffer(self):
+        buffer = StreamBuffer(channel_id=None, redis_client=mock.MagicMock())
+        self.stored = []
+
+        def write_to_redis(chunk_data):
+            # chunk_data is a view of the reused write buffer - keep a copy
+            self.stored.append(bytes(chunk_data))
+            return len(self.stored)
+
+        buffer._write_to_redis = write_to_redis
+        return buffer
+
+    def test_chunk_size_is_rounded_down_to_whole_packets(self):
+        with mock.patch.object(TSConfig, 'BUFFER_CHUNK_SIZE', 1000):
+            self.assertEqual(ConfigHelper.buffer_chunk_size(), 940)
+        with mock.patch.object(TSConfig, 'BUFFER_CHUNK_SIZE', 100):
+            self.assertEqual(ConfigHelper.buffer_chunk_size(), 188)
+
+    def test_reads_of_any_size_give_packet_aligned_chunks(self):
+        with mock.patch.object(TSConfig, 'BUFFER_CHUNK_SIZE', 188 * 4 + 50):
+            buffer = self.make_buffer()
+
+        data = ts_packets(10)
+        for start in range(0, len(data), 333):
+            self.assertTrue(buffer.add_chunk(memoryview(data)[start:start + 333]))
+
+        self.assertEqual(self.stored, [data[:188 * 4], data[188 * 4:188 * 8]])
+        self.assertEqual(buffer.index, 2)
+        # The last two packets wait for the rest of their chunk
+        self.assertEqual(buffer._write_pos, 188 * 2)
+
+    def test_empty_data_is_ignored(self):
+        buffer = self.make_buffer()
+        self.assertFalse(buffer.add_chunk(b''))
+        self.assertEqual(self.stored, [])
+
+    def test_join_point_prefers_the_newest_one_at_or_before_the_start(self):
+        redis_client = mock.MagicMock()
+        buffer = StreamBuffer(channel_id='channel-1', redis_client=redis_client)
+        redis_client.reset_mock()
+        redis_client.zrevrangebyscore.return_value = [b'7:376:0']
+        redis_client.get.return_value = PAT + PMT
+
+        self.assertEqual(buffer.get_join_point(9), (7, 376, PAT + PMT))
+        redis_client.zrevrangebyscore.assert_called_once_with(
+            buffer.join_points_key, 9, 9 - ConfigHelper.keyframe_join_max_back_chunks(), start=0, num=1)
+        redis_client.zrangebyscore.assert_not_called()
+
+    def test_join_point_falls_forward_when_none_is_behind(self):
+        redis_client = mock.MagicMock()
+        buffer = StreamBuffer(channel_id='channel-1', redis_client=redis_client)
+        redis_client.reset_mock()
+        redis_client.zrevrangebyscore.return_value = []
+        redis_client.zrangebyscore.return_value = [b'12:0:1']
+
+        self.assertEqual(buffer.get_join_point(9), (12, 0, b''))
+        redis_client.zrangebyscore.assert_called_once_with(buffer.join_points_key, "(9", "+inf", start=0, num=1)
+        redis_client.get.assert_not_called()
+
+
+class ChunkCacheTest(SimpleTestCase):
+    def test_least_recently_used_chunks_are_evicted_first(self):
+        cache = ChunkCache(max_bytes=300)
+        cache.put('a', 1, b'1' * 100)
+        cache.put('a', 2, b'2' * 100)
+        cache.put('a', 3, b'3' * 100)
+
+        # Using chunk 1 makes chunk 2 the oldest
+        self.assertEqual(cache.get('a', 1), b'1' * 100)
+        cache.put('a', 4, b'4' * 100)
+
+        self.assertIsNone(cache.get('a', 2))
+        self.assertEqual(cache.get('a', 1), b'1' * 100)
+        self.assertEqual(cache.get('a', 4), b'4' * 100)
+        stats = cache.get_stats()
+        self.assertEqual(stats['bytes'], 300)
+        self.assertEqual(stats['evictions'], 1)
+
+    def test_chunks_larger_than_the_cache_are_not_stored(self):
+        cache = ChunkCache(max_bytes=100)
+        cache.put('a', 1, b'x' * 101)
+        self.assertIsNone(cache.get('a', 1))
+        self.assertEqual(cache.get_stats()['bytes'], 0)
+
+    def test_views_are_copied(self):
+        cache = ChunkCache(max_bytes=100)
+        data = bytearray(b'abc')
+        cache.put('a', 1, memoryview(data))
+        data[:] = b'xyz'
+        self.assertEqual(cache.get('a', 1), b'abc')
+
+    def test_only_fetched_chunks_count_as_misses(self):
+        cache = ChunkCache(max_bytes=1000)
+
+        # Polling for a chunk that doesn't exist yet isn't a miss
+        self.assertIsNone(cache.get('a', 1))
+        cache.put('a', 1, b'x')
+        self.assertEqual(cache.get('a', 1), b'x')
+        self.assertEqual(cache.get('a', 1), b'x')
+
+        stats = cache.get_stats('a')
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+        self.assertEqual(stats['hit_rate'], 0.667)
+
+    def test_channel_restart_drops_its_chunks(self):
+        cache = ChunkCache(max_bytes=1000)
+        cache.put('a', 5, b'old')
+        cache.put('b', 5, b'other')
+
+        cache.check_head('a', 7)
+        self.assertEqual(cache.get('a', 5), b'old')
+
+        cache.check_head('a', 2)
+        self.assertIsNone(cache.get('a', 5))
+        self.assertEqual(cache.get('b', 5), b'other')
+        self.assertEqual(cache.get_stats()['bytes'], len(b'other'))
+
+    def test_disabled_cache_stores_nothing(self):
+        cache = ChunkCache(max_bytes=0)
+        cache.put('a', 1, b'x')
+        self.assertIsNone(cache.get('a', 1))
+
+
+class CheckResourcesTest(SimpleTestCase):
+    """StreamGenerator._check_resources reads every stop condition in one scripted call"""
+
+    def setUp(self):
+        self.client_manager = mock.MagicMock(clients={'client-1'})
+        self.proxy_server = mock.MagicMock(
+            stream_buffers={'channel-1': mock.MagicMock()},
+            client_managers={'channel-1': self.client_manager},
+        )
+        patcher = mock.patch.object(stream_generator.ProxyServer, 'get_instance', return_value=self.proxy_server)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.generator = stream_generator.StreamGenerator.__new__(stream_generator.StreamGenerator)
+        self.generator.channel_id = 'channel-1'
+        self.generator.client_id = 'client-1'
+
+    def check(self, script_result):
+        with mock.patch.object(stream_generator, 'run_script', return_value=script_result) as run_script:
+            result = self.generator._check_resources()
+        return result, run_script
+
+    def test_active_client_keeps_streaming_after_one_round_trip(self):
+        result, run_script = self.check([0, b'active', 0])
+        self.assertTrue(result)
+        run_script.assert_called_once()
+        self.assertEqual(run_script.call_args.kwargs['keys'], [
+            RedisKeys.channel_stopping('channel-1'),
+            RedisKeys.channel_metadata('channel-1'),
+            RedisKeys.client_stop('channel-1', 'client-1'),
+        ])
+
+    def test_stop_conditions_end_the_stream(self):
+        self.assertFalse(self.check([1, b'active', 0])[0])
+        self.assertFalse(self.check([0, b'stopping', 0])[0])
+        self.assertFalse(self.check([0, b'error', 0])[0])
+        self.assertFalse(self.check([0, b'active', 1])[0])
+
+    def test_missing_state_is_not_a_stop(self):
+        self.assertTrue(self.check([0, b'', 0])[0])
+
+    def test_client_removed_from_manager_ends_the_stream(self):
+        self.client_manager.clients = set()
+        self.assertFalse(self.check([0, b'active', 0])[0])
+
+    def test_missing_buffer_ends_the_stream_without_redis(self):
+        self.proxy_server.stream_buffers = {}
+        result, run_script = self.check([0, b'active', 0])
+        self.assertFalse(result)
+        run_script.assert_not_called()
+
+
+class ClientRegistryTest(SimpleTestCase):
+    def setUp(self):
+        self.redis_client = mock.MagicMock()
+        self.key = RedisKeys.clients('channel-1')
+        self.ttl = ClientRegistry.client_ttl()
+
+    def test_touch_scores_the_client_by_its_activity_time(self):
+        ClientRegistry.touch(self.redis_client, 'channel-1', 'client-1', now=1000.0)
+        self.redis_client.zadd.assert_called_once_with(self.key, {'client-1': 1000.0})
+        self.redis_client.expire.assert_called_once_with(self.key, self.ttl)
+
+    def test_expiry_removes_only_clients_older_than_the_ttl(self):
+        ClientRegistry.expire_stale(self.redis_client, 'channel-1', now=1000.0)
+        # Exclusive bound: a client last seen exactly at the cutoff still counts as connected
+        self.redis_client.zremrangebyscore.assert_called_once_with(self.key, '-inf', f"({1000.0 - self.ttl}")
+
+    def test_count_and_members_include_clients_seen_since_the_cutoff(self):
+        self.redis_client.zcount.return_value = None
+        self.assertEqual(ClientRegistry.count(self.redis_client, 'channel-1', now=1000.0), 0)
+        self.redis_client.zcount.assert_called_once_with(self.key, 1000.0 - self.ttl, '+inf')
+
+        ClientRegistry.members(self.redis_client, 'channel-1', now=1000.0)
+        self.redis_client.zrangebyscore.assert_called_once_with(self.key, 1000.0 - self.ttl, '+inf')
+
+
+class LingerPolicyTest(SimpleTestCase):
+    def test_delay_covers_recent_reconnect_gaps(self):
+        redis_client = mock.MagicMock()
+        # -1 records a disconnect nobody came back from
+        redis_client.lrange.return_value = [b'2', b'4', b'-1', b'3', b'junk']
+        self.assertEqual(LingerPolicy.learned_delay(redis_client, 'channel-1'), 4 * 1.25 + 1.0)
+
+    def test_no_linger_when_clients_rarely_come_back(self):
+        redis_client = mock.MagicMock()
+        redis_client.lrange.return_value = [b'2', b'3', b'-1', b'-1', b'-1', b'-1', b'-1']
+        self.assertEqual(LingerPolicy.learned_delay(redis_client, 'channel-1'), 0)
+
+        redis_client.lrange.return_value = [b'2']
+        self.assertEqual(LingerPolicy.learned_delay(redis_client, 'channel-1'), 0)
+
+    def test_park_keeps_an_existing_offer(self):
+        redis_client = mock.MagicMock()
+        LingerPolicy.park(redis_client, 'channel-1', 7)
+        key, channel_id, value = redis_client.hsetnx.call_args.args
+        self.assertEqual((key, channel_id), (RedisKeys.lingering_channels(), 'channel-1'))
+        self.assertEqual(json.loads(value)['profile_id'], '7')
+
+        redis_client.reset_mock()
+        LingerPolicy.park(redis_client, 'channel-1', None)
+        redis_client.hsetnx.assert_not_called()
+
+    def test_release_frees_the_longest_lingering_channel_on_the_profile(self):
+        redis_client = mock.MagicMock()
+        redis_client.hgetall.return_value = {
+            b'newer': json.dumps({'profile_id': '7', 'since': 200}),
+            b'other-profile': json.dumps({'profile_id': '8', 'since': 50}),
+            b'taken': json.dumps({'profile_id': '7', 'since': 100}),
+            b'oldest': json.dumps({'profile_id': '7', 'since': 150}),
+        }
+        # Another worker already released 'taken'
+        redis_client.hdel.side_effect = lambda key, channel_id: channel_id != 'taken'
+
+        with mock.patch('apps.proxy.ts_proxy.linger.publish_owner_event') as publish:
+            self.assertEqual(LingerPolicy.release_slot(redis_client, {7}), 'oldest')
+
+        publish.assert_called_once()
+        self.assertEqual(publish.call_args.args[1], 'oldest')
+
+    def test_release_without_a_matching_channel(self):
+        redis_client = mock.MagicMock()
+        redis_client.hgetall.return_value = {b'other-profile': json.dumps({'profile_id': '8', 'since': 50})}
+        with mock.patch('apps.proxy.ts_proxy.linger.publish_owner_event') as publish:
+            self.assertIsNone(LingerPolicy.release_slot(redis_client, {7}))
+            self.assertIsNone(LingerPolicy.release_slot(redis_client, set()))
+        publish.assert_not_called()
+
+
+def playlist(media_sequence, count, discontinuity_at=None, ended=False):
+    """Stand-in for a parsed m3u8 media playlist"""
+    segments = [
+        SimpleNamespace(absolute_uri=f"http://example.com/{media_sequence + i}.ts",
+                        discontinuity=media_sequence + i == discontinuity_at)
+        for i in range(count)
+    ]
+    return SimpleNamespace(target_duration=6, is_endlist=ended, media_sequence=media_sequence, segments=segments)
+
+
+class MarkDiscontinuityTest(SimpleTestCase):
+    def test_first_adaptation_field_of_each_pid_is_flagged(self):
+        packets = bytearray(
+            ts_packet(0x100, b'')                            # No adaptation field
+            + ts_packet(0x100, b'', adaptation=b'\x10')
+            + ts_packet(0x100, b'', adaptation=b'\x10')
+            + ts_packet(0x101, b'', adaptation=b'\x00')
+            + ts_packet(0x1FFF, b'', adaptation=b'\x00')    # Null packet
+        )
+        mark_discontinuity(packets)
+
+        flags = [packets[offset + 5] for offset in range(0, len(packets), 188)]
+        self.assertEqual(flags, [0xFF, 0x90, 0x10, 0x80, 0x00])
+
+
+class HLSScheduleTest(SimpleTestCase):
+    def setUp(self):
+        self.reader = HLSReader('http://example.com/live.m3u8', 'test')
+        self.addCleanup(self.reader.close)
+        self.reader.executor.shutdown()
+        self.reader.executor = mock.MagicMock()
+        self.reader.live_edge_segments = 3
+
+    def scheduled(self):
+        """(media sequence, discontinuity) of segments queued since the last call"""
+        queued = [(sequence, discontinuity) for sequence, _, discontinuity in self.reader.pending]
+        self.reader.pending.clear()
+        return queued
+
+    def test_live_playlist_starts_near_the_edge_and_queues_new_segments(self):
+        self.reader._schedule(playlist(10, 10))
+        self.assertEqual(self.scheduled(), [(17, False), (18, False), (19, False)])
+
+        self.reader._schedule(playlist(12, 10, discontinuity_at=21))
+        self.assertEqual(self.scheduled(), [(20, False), (21, True)])
+
+    def test_ended_playlist_starts_at_the_beginning(self):
+        self.reader._schedule(playlist(0, 4, ended=True))
+        self.assertEqual([sequence for sequence, _ in self.scheduled()], [0, 1, 2, 3])
+        self.assertTrue(self.reader.ended)
+
+    def test_segments_that_left_the_playlist_mark_a_discontinuity(self):
+        self.reader._schedule(playlist(10, 10))
+        self.scheduled()
+
+        self.reader._schedule(playlist(25, 10))
+        self.assertEqual(self.scheduled()[:2], [(25, True), (26, False)])
+
+    def test_media_sequence_reset_restarts_at_the_live_edge(self):
+        self.reader._schedule(playlist(100, 10))
+        self.scheduled()
+
+        self.reader._schedule(playlist(0, 10))
+        self.assertEqual(self.scheduled(), [(7, True), (8, False), (9, False)])
+
+    def test_refresh_failures_are_tolerated_until_the_limit(self):
+        self.reader.max_refresh_failures = 3
+        with mock.patch.object(self.reader, '_load', side_effect=ConnectionError('down')):
+            self.reader._refresh()
+            self.reader._refresh()
+            with self.assertRaises(ConnectionError):
+                self.reader._refresh()
+
+        self.reader.refresh_failures = 2
+        with mock.patch.object(self.reader, '_load', return_value=playlist(10, 10)):
+            self.reader._refresh()
+        self.assertEqual(self.reader.refresh_failures, 0)
+        self.assertEqual(len(self.scheduled()), 3)
+
+
+class StreamProbeTest(SimpleTestCase):
+    def test_is_ts_accepts_aligned_packets_after_some_garbage(self):
+        self.assertTrue(_is_ts(ts_packets(8)))
+        self.assertTrue(_is_ts(b'\x00' * 50 + ts_packets(8)))
+        # A trailing partial packet is fine as long as it starts on a sync byte
+        self.assertTrue(_is_ts(ts_packets(8) + b'\x47\x00'))
+
+    def test_is_ts_rejects_other_data(self):
+        self.assertFalse(_is_ts(b'<html><body>Not found</body></html>' * 50))
+        self.assertFalse(_is_ts(ts_packets(2)))
+        self.assertFalse(_is_ts(ts_packets(4) + b'\x00' * 188 + ts_packets(4)))
+
+    def test_winner_closes_the_other_probes(self):
+        race = _ProbeRace()
+        winner = SimpleNamespace(session=mock.MagicMock())
+        loser_session, loser_response = mock.MagicMock(), mock.MagicMock()
+        race.track(winner.session)
+        race.track(loser_session, loser_response)
+
+        self.assertTrue(race.finish(winner))
+        loser_response.close.assert_called_once()
+        loser_session.close.assert_called_once()
+        winner.session.close.assert_not_called()
+
+        # Probes that connect after the race was decided give up
+        self.assertFalse(race.track(mock.MagicMock()))
+        self.assertFalse(race.finish(SimpleNamespace(session=loser_session)))
+        self.assertIs(race.end(), winner)
+
+    @mock.patch('apps.proxy.ts_proxy.stream_probe._profile_max_streams',
+                side_effect=lambda profile_id: {1: 3, 2: 1, 3: 0}[profile_id])
+    def test_probes_are_limited_to_each_profiles_free_slots(self, max_streams):
+        redis_client = mock.MagicMock()
+        redis_client.get.side_effect = lambda key: {'profile_connections:1': b'2', 'profile_connections:2': b'1'}.get(key)
+        candidates = [{'stream_id': stream_id, 'm3u_profile_id': profile_id}
+                      for stream_id, profile_id in ((10, 1), (11, 1), (12, 2), (13, 3), (14, 3))]
+
+        to_probe, deferred = limit_to_free_slots(redis_client, candidates)
+        self.assertEqual([candidate['stream_id'] for candidate in to_probe], [10, 13, 14])
+        self.assertEqual([candidate['stream_id'] for candidate in deferred], [11, 12])
+
+        # The channel's own slot is handed over on its current profile
+        to_probe, deferred = limit_to_free_slots(redis_client, candidates, current_profile_id='2')
+        self.assertEqual([candidate['stream_id'] for candidate in to_probe], [10, 12, 13, 14])
+
+
+@skipIf(fakeredis is None, "fakeredis isn't installed")
+class ChannelLeaseTest(SimpleTestCase):
+    def setUp(self):
+        self.redis_client = fakeredis.FakeRedis()
+
+    def test_tokens_increase_with_every_new_lease(self):
+        self.assertEqual(ChannelLease.acquire(self.redis_client, 'channel-1', 'worker-a'), 1)
+        # Re-acquiring its own lease keeps the worker's token
+        self.assertEqual(ChannelLease.acquire(self.redis_client, 'channel-1', 'worker-a'), 1)
+        self.assertEqual(ChannelLease.acquire(self.redis_client, 'channel-1', 'worker-b'), 0)
+
+        self.assertTrue(ChannelLease.release(self.redis_client, 'channel-1', 'worker-a'))
+        self.assertEqual(ChannelLease.acquire(self.redis_client, 'channel-1', 'worker-b'), 2)
+
+    def test_extend_keeps_the_fence_alive(self):
+        ChannelLease.acquire(self.redis_client, 'channel-1', 'worker-a')
+        fence_key = RedisKeys.channel_fence('channel-1')
+        self.redis_client.expire(fence_key, 5)
+
+        self.assertEqual(int(ChannelLease.extend(self.redis_client, 'channel-1', 'worker-a')), 1)
+        self.assertGreater(self.redis_client.ttl(fence_key), FENCE_TTL - 5)
+        self.assertEqual(int(ChannelLease.extend(self.redis_client, 'channel-1', 'worker-b')), 0)
+
+    def test_take_over_only_from_a_dead_owner_unless_handed_over(self):
+        ChannelLease.acquire(self.redis_client, 'channel-1', 'worker-a')
+
+        # Heartbeat still alive
+        self.assertEqual(ChannelLease.take_over(self.redis_client, 'channel-1', 'worker-b', 'worker-a'), 0)
+
+        self.redis_client.delete(RedisKeys.owner_heartbeat('channel-1'))
+        self.assertEqual(ChannelLease.take_over(self.redis_client, 'channel-1', 'worker-b', 'worker-a'), 2)
+        # The owner changed in the meantime
+        self.assertEqual(ChannelLease.take_over(self.redis_client, 'channel-1', 'worker-c', 'worker-a'), 0)
+        self.assertEqual(int(ChannelLease.extend(self.redis_client, 'channel-1', 'worker-a')), 0)
+
+        # A live owner handing the channel over
+        self.assertEqual(ChannelLease.take_over(self.redis_client, 'channel-1', 'worker-c', 'worker-b',
+                                                only_if_dead=False), 3)
+        self.assertEqual(self.redis_client.get(RedisKeys.channel_owner('channel-1')), b'worker-c')
+
+    def test_stale_owner_writes_are_rejected(self):
+        token = ChannelLease.acquire(self.redis_client, 'channel-1', 'worker-a')
+        stale = StreamBuffer(channel_id='channel-1', redis_client=self.redis_client)
+        stale.fencing_token = token
+        self.assertEqual(stale._write_to_redis(b'first'), 1)
+
+        self.redis_client.delete(RedisKeys.owner_heartbeat('channel-1'))
+        new_token = ChannelLease.take_over(self.redis_client, 'channel-1', 'worker-b', 'worker-a')
+        current = StreamBuffer(channel_id='channel-1', redis_client=self.redis_client)
+        current.take_over_writing(new_token)
+
+        self.assertIsNone(stale._write_to_redis(b'stale'))
+        self.assertEqual(current._write_to_redis(b'second'), 2)
+        self.assertEqual(self.redis_client.get(RedisKeys.buffer_chunk('channel-1', 2)), b'second')
+        self.assertEqual(self.redis_client.get(RedisKeys.buffer_index('channel-1')), b'2')
+
+
+class EgressRateTest(SimpleTestCase):
+    def test_reading_the_rate_doesnt_reset_it(self):
+        with mock.patch('apps.proxy.ts_proxy.client_stats.time.time', return_value=1000.0):
+            aggregator = ClientStatsAggregator()
+
+        aggregator.egress_bytes = 1000 * EGRESS_WINDOW
+        with mock.patch('apps.proxy.ts_proxy.client_stats.time.time', return_value=1000.0 + EGRESS_WINDOW):
+            self.assertEqual(aggregator.egress_rate(), 1000)
+
+        # Placement, drain and the registry all read it within the next window
+        aggregator.egress_bytes += 10
+        with mock.patch('apps.proxy.ts_proxy.client_stats.time.time', return_value=1001.0 + EGRESS_WINDOW):
+            self.assertEqual(aggregator.egress_rate(), 1000)
+            self.assertEqual(aggregator.egress_rate(), 1000)
+
+
+@skipIf(fakeredis is None, "fakeredis isn't installed")
+class ChannelInitFlightTest(SimpleTestCase):
+    def setUp(self):
+        self.redis_client = fakeredis.FakeRedis()
+        self.flight = ChannelInitFlight(self.redis_client)
+
+    def test_one_leader_per_channel(self):
+        self.assertTrue(self.flight.try_lead('channel-1', 'request-a'))
+        self.assertFalse(self.flight.try_lead('channel-1', 'request-b'))
+        self.assertTrue(self.flight.try_lead('channel-2', 'request-b'))
+
+        self.flight.finish('channel-1', 'request-a', True)
+        self.assertTrue(self.flight.try_lead('channel-1', 'request-b'))
+
+    def test_waiters_get_the_leaders_outcome(self):
+        self.flight.try_lead('channel-1', 'request-a')
+        waiters = [gevent.spawn(self.flight.wait, 'channel-1', 5) for _ in range(3)]
+        gevent.sleep(0)
+        self.assertEqual(self.flight.waiting_channels(), {'channel-1'})
+
+        self.flight.notify('channel-1', {'ready': True})
+        gevent.joinall(waiters, timeout=1)
+        self.assertEqual([waiter.value for waiter in waiters], [{'ready': True}] * 3)
+        self.assertEqual(self.flight.waiting_channels(), set())
+
+    def test_abandoned_outcome_reaches_waiters(self):
+        self.flight.try_lead('channel-1', 'request-a')
+        waiter = gevent.spawn(self.flight.wait, 'channel-1', 5)
+        gevent.sleep(0)
+
+        self.flight.finish('channel-1', 'request-a', False, abandoned=True)
+        self.assertFalse(self.redis_client.exists(RedisKeys.channel_init_lock('channel-1')))
+        # The event listener delivers what finish() published
+        self.flight.notify('channel-1', {'ready': False, 'abandoned': True})
+        self.assertEqual(waiter.get(timeout=1), {'ready': False, 'abandoned': True})
+
+    def test_waiters_retry_when_the_lock_goes_away_silently(self):
+        self.flight.LOCK_CHECK_INTERVAL = 0.01
+        self.flight.try_lead('channel-1', 'request-a')
+        waiter = gevent.spawn(self.flight.wait, 'channel-1', 5)
+        gevent.sleep(0.02)
+        self.assertFalse(waiter.ready())
+
+        self.redis_client.delete(RedisKeys.channel_init_lock('channel-1'))
+        self.assertIsNone(waiter.get(timeout=1))
+
+    def test_wait_times_out(self):
+        self.flight.try_lead('channel-1', 'request-a')
+        self.assertIsNone(self.flight.wait('channel-1', 0.05))
+
+    def test_a_later_flight_doesnt_see_an_earlier_outcome(self):
+        self.flight.try_lead('channel-1', 'request-a')
+        waiter = gevent.spawn(self.flight.wait, 'channel-1', 5)
+        gevent.sleep(0)
+        self.flight.notify('channel-1', {'ready': False})
+        waiter.join(timeout=1)
+
+        self.assertIsNone(self.flight.wait('channel-1', 0.05))
+
+
+@skipIf(fakeredis is None, "fakeredis isn't installed")
+class RedisStreamBufferTest(SimpleTestCase):
+    def make_buffer(self, maxlen=128, block_ms=10):
+        with mock.patch.object(TSConfig, 'BUFFER_STREAM_MAXLEN', maxlen), \
+                mock.patch.object(TSConfig, 'BUFFER_STREAM_BLOCK_MS', block_ms), \
+                mock.patch.object(TSConfig, 'SHM_BUFFER_ENABLED', False):
+            buffer = RedisStreamBuffer(channel_id='channel-1', redis_client=self.redis_client)
+        # Read everything from Redis
+        buffer.chunk_cache = ChunkCache(max_bytes=0)
+        return buffer
+
+    def setUp(self):
+        self.redis_client = fakeredis.FakeRedis()
+
+    def test_entry_ids_carry_the_chunk_index(self):
+        buffer = self.make_buffer()
+        for i in range(1, 4):
+            self.assertEqual(buffer._write_to_redis(f"chunk {i}".encode()), i)
+
+        entries = self.redis_client.xrange(buffer.stream_key)
+        self.assertEqual([entry_id for entry_id, _ in entries], [b'1-0', b'2-0', b'3-0'])
+        self.assertEqual(entries[1][1][CHUNK_FIELD], b'chunk 2')
+        self.assertEqual(RedisStreamBuffer._entry_index(b'42-0'), 42)
+        self.assertEqual(self.redis_client.get(buffer.buffer_index_key), b'3')
+
+        self.assertEqual(buffer._fetch_from_redis(1, [0, 2, 5]), [b'chunk 1', b'chunk 3', None])
+
+    def test_readers_get_chunks_after_their_index(self):
+        buffer = self.make_buffer()
+        for i in range(1, 6):
+            buffer._write_to_redis(f"chunk {i}".encode())
+
+        chunks, next_index = buffer.get_optimized_client_data(2)
+        self.assertEqual(chunks, [b'chunk 3', b'chunk 4', b'chunk 5'])
+        self.assertEqual(next_index, 5)
+
+    def test_writes_trim_the_stream(self):
+        buffer = self.make_buffer(maxlen=3)
+        pipeline = mock.MagicMock()
+        with mock.patch.object(self.redis_client, 'pipeline', return_value=pipeline):
+            buffer._write_to_redis(b'chunk 1')
+
+        pipeline.xadd.assert_called_once_with(buffer.stream_key, {CHUNK_FIELD: b'chunk 1'}, id='1-0',
+                                              maxlen=3, approximate=True)
+        pipeline.expire.assert_called_once_with(buffer.stream_key, buffer.chunk_ttl)
+
+    def test_late_readers_resume_at_the_oldest_retained_chunk(self):
+        buffer = self.make_buffer()
+        for i in range(1, 11):
+            buffer._write_to_redis(f"chunk {i}".encode())
+        self.redis_client.xtrim(buffer.stream_key, maxlen=3, approximate=False)
+
+        self.assertEqual(buffer.get_optimized_client_data(2), ([b'chunk 8', b'chunk 9', b'chunk 10'], 10))
+
+    def test_read_at_the_head_times_out_empty(self):
+        buffer = self.make_buffer(block_ms=20)
+        buffer._write_to_redis(b'chunk 1')
+
+        self.assertEqual(buffer.get_optimized_client_data(1), ([], 1))
+
+    def test_fenced_writes_use_the_stream(self):
+        buffer = self.make_buffer()
+        buffer.fencing_token = ChannelLease.acquire(self.redis_client, 'channel-1', 'worker-a')
+        self.assertEqual(buffer._write_to_redis(b'chunk 1'), 1)
+
+        self.redis_client.delete(RedisKeys.owner_heartbeat('channel-1'))
+        ChannelLease.take_over(self.redis_client, 'channel-1', 'worker-b', 'worker-a')
+        self.assertIsNone(buffer._write_to_redis(b'stale'))
+        self.assertEqual(self.redis_client.xlen(buffer.stream_key), 1)
+
+
+class FanoutTest(SimpleTestCase):
+    def setUp(self):
+        self.buffer = mock.MagicMock(channel_id='channel-1', index=10, blocking_reads=False)
+        self.buffer.get_optimized_client_data.return_value = ([], 10)
+        self.addCleanup(ChannelFanout.stop_channel, 'channel-1')
+
+    def test_push_skips_chunks_up_to_the_join_point(self):
+        subscription = Subscription(ChannelFanout(self.buffer), 'client-1', 5)
+
+        subscription.push([b'3', b'4'], 4)
+        subscription.push([b'4', b'5', b'6', b'7'], 7)
+        self.assertEqual(subscription.get(timeout=0), ([b'6', b'7'], 7))
+        self.assertIsNone(subscription.get(timeout=0))
+        self.assertEqual(subscription.pending_chunks, 0)
+
+    def test_slow_client_drops_to_live(self):
+        fanout = ChannelFanout(self.buffer)
+        fanout.max_pending = 3
+        fanout.slow_client_policy = SlowClientPolicy.DROP_TO_LIVE
+        subscription = Subscription(fanout, 'client-1', 10)
+
+        subscription.push([b'11', b'12'], 12)
+        subscription.push([b'13', b'14'], 14)
+
+        self.assertEqual(subscription.dropped_chunks, 2)
+        self.assertFalse(subscription.closed)
+        self.assertEqual(subscription.get(timeout=0), ([b'13', b'14'], 14))
+
+    def test_slow_client_is_disconnected(self):
+        fanout = ChannelFanout(self.buffer)
+        fanout.max_pending = 3
+        fanout.slow_client_policy = SlowClientPolicy.DISCONNECT
+        subscription = fanout._add_subscriber('client-1', 10)
+
+        subscription.push([b'11', b'12'], 12)
+        subscription.push([b'13', b'14'], 14)
+
+        self.assertTrue(subscription.closed)
+        self.assertEqual(subscription.close_reason, "slow client")
+        self.assertIsNone(subscription.get(timeout=0))
+        self.assertNotIn('client-1', fanout.subscribers)
+        fanout.stop()
+
+    def test_joining_ahead_only_moves_an_unshared_reader(self):
+        fanout = ChannelFanout(self.buffer)
+        # Pretend the reader already runs
+        fanout.greenlet = mock.MagicMock(dead=False)
+
+        fanout._add_subscriber('client-1', 12)
+        self.assertEqual(fanout.index, 12)
+        fanout._add_subscriber('client-2', 15)
+        self.assertEqual(fanout.index, 12)
+
+    def test_reader_feeds_subscribers_and_exits_when_they_leave(self):
+        self.buffer.get_optimized_client_data.side_effect = [([b'11', b'12'], 12)] + [([], 12)] * 1000
+
+        with mock.patch.object(ConfigHelper, 'keepalive_interval', return_value=0.001), \
+                mock.patch.object(ConfigHelper, 'fanout_poll_interval', return_value=0.001):
+            subscription = ChannelFanout.subscribe(self.buffer, 'client-1', 10)
+            fanout = subscription.fanout
+            self.assertEqual(subscription.get(timeout=1), ([b'11', b'12'], 12))
+
+            subscription.close()
+            fanout.greenlet.join(timeout=1)
+
+        self.assertTrue(fanout.greenlet.dead)
+        self.assertFalse(fanout.running)
+        self.assertIsNone(ChannelFanout.get_stats('channel-1'))
+
+
+@skipIf(fakeredis is None, "fakeredis isn't installed")
+class OwnerFailoverTest(SimpleTestCase):
+    """Taking channels over from dead owners and draining workers, against a fake Redis"""
+
+    def setUp(self):
+        self.redis_client = fakeredis.FakeRedis()
+        self.redis_client.hset(RedisKeys.channel_metadata('channel-1'), mapping={
+            ChannelMetadataField.URL: 'http://example.com/stream.ts',
+            ChannelMetadataField.OWNER: 'worker-a',
+        })
+        self.assertEqual(ChannelLease.acquire(self.redis_client, 'channel-1', 'worker-a'), 1)
+
+        self.server = ProxyServer.__new__(ProxyServer)
+        self.server.worker_id = 'worker-b'
+        self.server.redis_client = self.redis_client
+        self.server.stream_managers = {}
+        self.server.fencing_tokens = {}
+        self.server.pending_handoffs = set()
+        self.server.draining = False
+        with mock.patch.object(TSConfig, 'SHM_BUFFER_ENABLED', False):
+            self.buffer = StreamBuffer(channel_id='channel-1', redis_client=self.redis_client)
+        self.server.stream_buffers = {'channel-1': self.buffer}
+        self.server.client_managers = {'channel-1': mock.MagicMock()}
+
+        self.stream_manager = mock.MagicMock(connected=False, running=True)
+        patcher = mock.patch.object(self.server, '_start_stream_manager', return_value=self.stream_manager)
+        self.start_stream_manager = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def metadata(self):
+        return self.redis_client.hgetall(RedisKeys.channel_metadata('channel-1'))
+
+    def test_dead_owner_is_taken_over_with_a_higher_token(self):
+        # Owner still heartbeating
+        self.assertFalse(self.server._take_over_channel('channel-1', 'worker-a', self.metadata()))
+        self.start_stream_manager.assert_not_called()
+
+        self.redis_client.delete(RedisKeys.owner_heartbeat('channel-1'))
+        self.assertTrue(self.server._take_over_channel('channel-1', 'worker-a', self.metadata()))
+
+        self.assertEqual(self.redis_client.get(RedisKeys.channel_owner('channel-1')), b'worker-b')
+        self.assertEqual(self.server.fencing_tokens['channel-1'], 2)
+        self.assertEqual(self.buffer.fencing_token, 2)
+        self.assertIs(self.server.stream_managers['channel-1'], self.stream_manager)
+        self.assertEqual(self.metadata()[b'owner'], b'worker-b')
+
+    def test_handoff_moves_the_lease_only_once_the_standby_is_connected(self):
+        handoff = gevent.spawn(self.server._accept_handoff, 'channel-1', {'from_worker': 'worker-a'})
+        gevent.sleep(0.3)
+
+        # Connecting upstream while the draining owner keeps writing
+        self.assertFalse(handoff.ready())
+        self.assertTrue(self.buffer.standby)
+        self.assertIn('channel-1', self.server.pending_handoffs)
+        self.assertEqual(self.redis_client.get(RedisKeys.channel_owner('channel-1')), b'worker-a')
+
+        self.stream_manager.connected = True
+        self.assertTrue(handoff.get(timeout=1))
+
+        self.assertEqual(self.redis_client.get(RedisKeys.channel_owner('channel-1')), b'worker-b')
+        self.assertEqual(self.buffer.fencing_token, 2)
+        self.assertFalse(self.buffer.standby)
+        self.assertEqual(self.server.pending_handoffs, set())
+        self.assertIs(self.server.stream_managers['channel-1'], self.stream_manager)
+
+    def test_failed_handoff_leaves_the_owner_alone(self):
+        with mock.patch.object(ConfigHelper, 'handoff_connect_timeout', return_value=0.05):
+            self.assertFalse(self.server._accept_handoff('channel-1', {'from_worker': 'worker-a'}))
+
+        self.stream_manager.stop.assert_called_once()
+        self.assertFalse(self.buffer.standby)
+        self.assertNotIn('channel-1', self.server.stream_managers)
+        self.assertEqual(self.redis_client.get(RedisKeys.channel_owner('channel-1')), b'worker-a')
+
+    def test_lease_refresh_skips_pending_handoffs(self):
+        self.redis_client.delete(RedisKeys.owner_heartbeat('channel-1'))
+        ChannelLease.acquire(self.redis_client, 'channel-2', 'worker-b')
+        self.redis_client.delete(RedisKeys.owner_heartbeat('channel-2'))
+        self.server.fencing_tokens = {'channel-2': 1}
+        self.server.stream_managers = {'channel-1': mock.MagicMock()}
+        self.server.pending_handoffs = {'channel-1'}
+
+        self.server._refresh_leases()
+
+        self.assertTrue(self.redis_client.exists(RedisKeys.owner_heartbeat('channel-2')))
+        self.assertFalse(self.redis_client.exists(RedisKeys.owner_heartbeat('channel-1')))
+
+    def test_graceful_stop_signal_starts_the_drain(self):
+        uwsgi = SimpleNamespace(opt={'worker-reload-mercy': b'12'})
+        with mock.patch.dict('sys.modules', {'uwsgi': uwsgi}), \
+                mock.patch('apps.proxy.ts_proxy.server.gevent.signal_handler') as signal_handler, \
+                mock.patch.object(self.server, 'drain') as drain:
+            self.server._register_drain_hook()
+            signum, on_graceful_stop = signal_handler.call_args.args
+            self.assertEqual(signum, signal.SIGHUP)
+
+            on_graceful_stop()
+            gevent.sleep(0)
+
+        # Finishes before uWSGI's reload mercy runs out
+        drain.assert_called_once_with(7)
+
+
+@skipIf(fakeredis is None, "fakeredis isn't installed")
+class EventRoutingTest(SimpleTestCase):
+    def setUp(self):
+        self.redis_client = fakeredis.FakeRedis()
+        self.redis_client.set(RedisKeys.channel_owner('channel-1'), 'worker-a')
+
+        self.pubsub = self.redis_client.pubsub()
+        self.pubsub.subscribe(RedisKeys.worker_control('worker-a'), RedisKeys.events_channel('channel-1'))
+        self.addCleanup(self.pubsub.close)
+
+        proxy_server = SimpleNamespace(redis_client=self.redis_client, worker_id='worker-b')
+        patcher = mock.patch.object(ProxyServer, 'get_instance', return_value=proxy_server)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def received(self):
+        """(pub/sub channel, event type) of every message published so far"""
+        messages = []
+        while True:
+            message = self.pubsub.get_message(timeout=0.01)
+            if message is None:
+                return messages
+            if message['type'] == 'message':
+                messages.append((message['channel'].decode('utf-8'), json.loads(message['data'])['event']))
+
+    def test_owner_events_go_to_the_owners_control_channel(self):
+        control = RedisKeys.worker_control('worker-a')
+        ChannelService._publish_channel_stop_event('channel-1')
+
+        with mock.patch('apps.proxy.ts_proxy.client_manager.HeartbeatScheduler'):
+            client_manager = ClientManager('channel-1', redis_client=self.redis_client, worker_id='worker-b')
+            client_manager.add_client('client-1', '127.0.0.1')
+            client_manager.remove_client('client-1')
+
+        self.assertEqual(self.received(), [
+            (control, EventType.CHANNEL_STOP),
+            (control, EventType.CLIENT_CONNECTED),
+            (control, EventType.CLIENT_DISCONNECTED),
+        ])
+
+    def test_owner_events_fall_back_to_the_channel_without_an_owner(self):
+        self.redis_client.delete(RedisKeys.channel_owner('channel-1'))
+        ChannelService._publish_channel_stop_event('channel-1')
+        self.assertEqual(self.received(), [(RedisKeys.events_channel('channel-1'), EventType.CHANNEL_STOP)])
+
+    def test_client_stop_reaches_every_worker_of_the_channel(self):
+        ChannelService._publish_client_stop_event('channel-1', 'client-1')
+        self.assertEqual(self.received(), [(RedisKeys.events_channel('channel-1'), EventType.CLIENT_STOP)])
+
+    def test_non_owners_handle_client_stop_but_not_owner_events(self):
+        server = ProxyServer.__new__(ProxyServer)
+        server.worker_id = 'worker-b'
+        server.redis_client = self.redis_client
+
+        def event(event_type):
+            return json.dumps({"event": event_type, "channel_id": 'channel-1', "client_id": 'client-1'}).encode()
+
+        with mock.patch.object(server, '_handle_client_stop') as handle_client_stop, \
+                mock.patch.object(server, '_handle_channel_stop') as handle_channel_stop:
+            server._handle_event_message(event(EventType.CLIENT_STOP))
+            server._handle_event_message(event(EventType.CHANNEL_STOP))
+            handle_client_stop.assert_called_once()
+            handle_channel_stop.assert_not_called()
+
+            server.worker_id = 'worker-a'
+            server._handle_event_message(event(EventType.CHANNEL_STOP))
+            handle_channel_stop.assert_called_once_with('channel-1')
+
+
+@skipIf(fakeredis is None, "fakeredis isn't installed")
+class ClientStatsAggregatorTest(SimpleTestCase):
+    def setUp(self):
+        self.redis_client = fakeredis.FakeRedis()
+        self.aggregator = ClientStatsAggregator()
+        # Flush by hand instead of from the flush loop
+        self.aggregator.greenlet = mock.MagicMock(dead=False)
+
+    def test_only_the_latest_stats_per_client_are_written_in_one_flush(self):
+        for sent in (100, 200, 300):
+            self.aggregator.record('channel-1', 'client-1', {'bytes_sent': sent}, sent_bytes=100)
+        self.aggregator.record('channel-1', 'client-2', {'bytes_sent': 50}, sent_bytes=50)
+
+        self.assertEqual(self.aggregator.flush(self.redis_client), 2)
+        self.assertEqual(self.redis_client.hget(RedisKeys.client_metadata('channel-1', 'client-1'), 'bytes_sent'), b'300')
+        self.assertEqual(self.redis_client.hget(RedisKeys.client_metadata('channel-1', 'client-2'), 'bytes_sent'), b'50')
+        self.assertGreater(self.redis_client.ttl(RedisKeys.client_metadata('channel-1', 'client-1')), 0)
+        self.assertEqual((self.aggregator.flushes, self.aggregator.writes), (1, 2))
+        self.assertEqual(self.aggregator.egress_bytes, 350)
+
+        # Nothing new to write
+        self.assertEqual(self.aggregator.flush(self.redis_client), 0)
+
+    def test_departed_clients_are_not_written(self):
+        self.aggregator.record('channel-1', 'client-1', {'bytes_sent': 1})
+        self.aggregator.record('channel-1', 'client-2', {'bytes_sent': 1})
+        self.aggregator.record('channel-2', 'client-3', {'bytes_sent': 1})
+
+        self.aggregator.discard('channel-1', 'client-1')
+        self.aggregator.discard_channel('channel-2')
+
+        self.assertEqual(self.aggregator.flush(self.redis_client), 1)
+        self.assertFalse(self.redis_client.exists(RedisKeys.client_metadata('channel-1', 'client-1')))
+        self.assertFalse(self.redis_client.exists(RedisKeys.client_metadata('channel-2', 'client-3')))
+
+
+@skipIf(fakeredis is None, "fakeredis isn't installed")
+class HeartbeatSchedulerTest(SimpleTestCase):
+    def setUp(self):
+        self.redis_client = fakeredis.FakeRedis()
+        self.scheduler = HeartbeatScheduler()
+        patcher = mock.patch('apps.proxy.ts_proxy.client_manager.HeartbeatScheduler')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_manager(self, channel_id, *client_ids):
+        manager = ClientManager(channel_id, redis_client=self.redis_client, worker_id='worker-a')
+        for client_id in client_ids:
+            manager.add_client(client_id, '127.0.0.1')
+        self.scheduler.managers.add(manager)
+        return manager
+
+    def test_tick_refreshes_every_channels_clients_and_drops_ghosts(self):
+        first = self.make_manager('channel-1', 'client-1', 'client-2')
+        second = self.make_manager('channel-2', 'client-3')
+        # client-2's record hasn't been touched for longer than the ghost timeout
+        self.redis_client.hset(RedisKeys.client_metadata('channel-1', 'client-2'), 'last_active', time.time() - 60)
+
+        self.assertEqual(self.scheduler.tick(), 3)
+
+        self.assertEqual(first.clients, {'client-1'})
+        self.assertEqual(second.clients, {'client-3'})
+        self.assertEqual(ClientRegistry.members(self.redis_client, 'channel-1'), [b'client-1'])
+        self.assertIn('client-1', first.last_heartbeat_time)
+        self.assertNotIn('client-2', first.last_heartbeat_time)
+
+    def test_tick_without_clients_does_nothing(self):
+        self.make_manager('channel-1')
+        with mock.patch.object(self.redis_client, 'pipeline') as pipeline:
+            self.assertEqual(self.scheduler.tick(), 0)
+        pipeline.assert_not_called()
+
+
+@skipIf(fakeredis is None, "fakeredis isn't installed")
+class ReadChannelStatesTest(SimpleTestCase):
+    def setUp(self):
+        self.redis_client = fakeredis.FakeRedis()
+        self.server = ProxyServer.__new__(ProxyServer)
+        self.server.redis_client = self.redis_client
+
+    def test_each_channel_gets_its_own_fields(self):
+        now = time.time()
+        self.redis_client.set(RedisKeys.channel_owner('channel-1'), 'worker-a')
+        self.redis_client.hset(RedisKeys.channel_metadata('channel-1'), ChannelMetadataField.STATE, 'active')
+        ClientRegistry.touch(self.redis_client, 'channel-1', 'client-1', now)
+        ClientRegistry.touch(self.redis_client, 'channel-1', 'client-2', now)
+        self.redis_client.set(RedisKeys.owner_heartbeat('channel-1'), now)
+        self.redis_client.hset(RedisKeys.warm_channels(), 'channel-1', 1)
+
+        self.redis_client.set(RedisKeys.last_client_disconnect('channel-2'), '1234.5')
+        self.redis_client.set(RedisKeys.channel_stopping('channel-2'), 'true')
+        self.redis_client.hset(RedisKeys.linger_state('channel-2'), 'delay', '7.5')
+
+        states = self.server._read_channel_states(['channel-1', 'channel-2'])
+
+        self.assertEqual(states['channel-1'], {
+            'owner': 'worker-a',
+            'owner_alive': True,
+            'metadata': {b'state': b'active'},
+            'total_clients': 2,
+            'disconnect_time': None,
+            'linger_delay': ConfigHelper.channel_shutdown_delay(),
+            'warm': True,
+            'stopping': False,
+        })
+        self.assertEqual(states['channel-2'], {
+            'owner': None,
+            'owner_alive': False,
+            'metadata': {},
+            'total_clients': 0,
+            'disconnect_time': 1234.5,
+            'linger_delay': 7.5,
+            'warm': False,
+            'stopping': True,
+        })
+
+    def test_every_read_is_mapped_to_a_state_field(self):
+        states = self.server._read_channel_states(['channel-1'])
+        fields = [name for name, _ in CHANNEL_STATE_READS]
+        self.assertEqual(len(fields), len(set(fields)))
+        self.assertTrue(set(fields) <= set(states['channel-1']))
+
+
+@skipIf(fakeredis is None, "fakeredis isn't installed")
+class WarmPoolManagerTest(SimpleTestCase):
+    def setUp(self):
+        self.redis_client = fakeredis.FakeRedis()
+        proxy_server = SimpleNamespace(redis_client=self.redis_client, worker_id='worker-a', draining=False,
+                                       check_if_channel_exists=mock.MagicMock(return_value=True))
+        self.manager = WarmPoolManager(proxy_server)
+        for name, value in (('WARM_POOL_ENABLED', True), ('WARM_POOL_SIZE', 2),
+                            ('WARM_POOL_CHANNELS', ['pinned']), ('WARM_POOL_HISTORY_HALF_LIFE', 100)):
+            patcher = mock.patch.object(TSConfig, name, value, create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def views(self):
+        return {channel_id.decode(): score for channel_id, score in
+                self.redis_client.zrange(RedisKeys.channel_views(), 0, -1, withscores=True)}
+
+    def test_targets_put_configured_channels_first_then_most_watched(self):
+        self.redis_client.zadd(RedisKeys.channel_views(), {'a': 5, 'pinned': 9, 'b': 3, 'c': 1})
+        self.assertEqual(self.manager._targets(), ['pinned', 'a', 'b'])
+
+    def test_first_decay_only_records_the_time(self):
+        self.redis_client.zadd(RedisKeys.channel_views(), {'a': 4})
+        self.manager._decay_views()
+        self.assertEqual(self.views(), {'a': 4})
+        self.assertIsNotNone(self.redis_client.get(RedisKeys.warm_pool_last_decay()))
+
+    def test_scores_halve_every_half_life_and_faded_channels_are_dropped(self):
+        self.redis_client.zadd(RedisKeys.channel_views(), {'a': 4, 'b': 0.08})
+        self.redis_client.set(RedisKeys.warm_pool_last_decay(), time.time() - 100)
+        self.manager._decay_views()
+        views = self.views()
+        self.assertEqual(list(views), ['a'])
+        self.assertAlmostEqual(views['a'], 2, places=2)
+
+    def test_channels_that_left_the_targets_are_dropped_from_the_pool(self):
+        self.redis_client.zadd(RedisKeys.channel_views(), {'a': 5})
+        self.redis_client.hset(RedisKeys.warm_channels(), mapping={'pinned': 1, 'a': 1, 'old': 1})
+        ClientRegistry.touch(self.redis_client, 'a', 'client-1')
+        with mock.patch('apps.proxy.ts_proxy.warm_pool.WarmPool.park') as park:
+            self.manager.run_check()
+        self.assertEqual(set(self.redis_client.hkeys(RedisKeys.warm_channels())), {b'pinned', b'a'})
+        # Only the channel without viewers is offered up
+        park.assert_called_once_with(self.redis_client, 'pinned')
+
+
+class UpstreamReadTest(SimpleTestCase):
+    """Upstream data is read into one reused buffer and copied out by the stream buffer"""
+
+    def setUp(self):
+        with mock.patch.object(TSConfig, 'BUFFER_CHUNK_SIZE', 188 * 4):
+            self.buffer = StreamBuffer(channel_id=None, redis_client=mock.MagicMock())
+        self.stored = []
+        self.buffer._write_to_redis = lambda chunk_data: self.stored.append(bytes(chunk_data)) or len(self.stored)
+        self.added = []
+        add_chunk = self.buffer.add_chunk
+
+        def record_add_chunk(chunk):
+            self.added.append(chunk)
+            return add_chunk(chunk)
+
+        self.buffer.add_chunk = record_add_chunk
+
+        self.manager = StreamManager.__new__(StreamManager)
+        self.manager.buffer = self.buffer
+        self.manager.transcode = False
+        self.manager.hls_reader = None
+        self.manager.stop_requested = False
+        self.manager.url_switching = False
+        self.manager.connected = True
+        self.manager._read_buffer = bytearray(300)
+        self.manager._read_view = memoryview(self.manager._read_buffer)
+        self.manager._update_bytes_processed = mock.MagicMock()
+        self.manager._mark_data_received = mock.MagicMock()
+
+    def assert_read_through_the_reused_buffer(self, data):
+        self.assertTrue(self.added)
+        for chunk in self.added:
+            self.assertIsInstance(chunk, memoryview)
+            self.assertIs(chunk.obj, self.manager._read_buffer)
+        # Reusing the read buffer didn't corrupt what was already handed on
+        self.assertEqual(b''.join(self.stored), data[:len(b''.join(self.stored))])
+        self.assertEqual(len(self.stored), len(data) // (188 * 4))
+
+    def test_http_body_is_read_into_the_reused_buffer(self):
+        data = ts_packets(12)
+        raw = mock.MagicMock(headers={}, _fp=io.BytesIO(data))
+        self.manager.current_response = SimpleNamespace(raw=raw)
+
+        self.manager._process_stream_data()
+
+        self.assert_read_through_the_reused_buffer(data)
+        raw.read.assert_not_called()
+        raw.readinto.assert_not_called()
+        self.assertEqual(sum(call.args[0] for call in self.manager._update_bytes_processed.call_args_list), len(data))
+        self.assertFalse(self.manager.connected)
+
+    def test_encoded_http_body_is_read_through_urllib3(self):
+        raw = mock.MagicMock(headers={'Content-Encoding': 'gzip'}, _fp=io.BytesIO())
+        self.manager.current_response = SimpleNamespace(raw=raw)
+        self.assertIs(self.manager._upstream_reader(), raw)
+
+    def test_transcoder_output_is_read_into_the_reused_buffer(self):
+        data = ts_packets(8)
+        self.manager.socket = io.BytesIO(data)
+        while self.manager.fetch_chunk():
+            pass
+        self.assert_read_through_the_reused_buffer(data)
+
+
+@skipIf(fakeredis is None, "fakeredis isn't installed")
+class UpstreamRegistryTest(SimpleTestCase):
+    def setUp(self):
+        self.redis_client = fakeredis.FakeRedis()
+        self.redis_client.set(RedisKeys.worker_heartbeat('worker-a'), 1)
+        self.channel = mock.MagicMock()
+        self.channel.get_stream_profile.return_value = mock.MagicMock(
+            is_redirect=mock.MagicMock(return_value=False), is_proxy=mock.MagicMock(return_value=True))
+        patcher = mock.patch('apps.proxy.ts_proxy.upstream_registry.source_candidates', return_value=[
+            ('http://example.com/a.ts', 1, 'agent'),
+            ('http://example.com/b.ts', 1, 'agent'),
+        ])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start_channel(self, channel_id, url, state=ChannelState.ACTIVE):
+        self.redis_client.hset(RedisKeys.channel_metadata(channel_id), mapping={
+            ChannelMetadataField.URL: url,
+            ChannelMetadataField.M3U_PROFILE: 1,
+            ChannelMetadataField.TRANSCODE: 0,
+            ChannelMetadataField.STATE: state,
+            ChannelMetadataField.OWNER: 'worker-a',
+        })
+        UpstreamRegistry.register(self.redis_client, channel_id)
+
+    def sessions(self):
+        return self.redis_client.hgetall(RedisKeys.upstream_sessions())
+
+    def test_finds_a_live_channel_pulling_one_of_the_sources(self):
+        self.start_channel('source', 'http://example.com/b.ts')
+        self.assertEqual(UpstreamRegistry.find_source(self.redis_client, self.channel, 'alias'), 'source')
+        # A channel isn't its own source
+        self.assertIsNone(UpstreamRegistry.find_source(self.redis_client, self.channel, 'source'))
+
+    def test_entries_of_channels_that_went_away_or_switched_are_dropped(self):
+        self.start_channel('stopped', 'http://example.com/a.ts', state=ChannelState.STOPPED)
+        self.start_channel('switched', 'http://example.com/b.ts')
+        self.redis_client.hset(RedisKeys.channel_metadata('switched'), ChannelMetadataField.URL, 'http://example.com/c.ts')
+
+        self.assertIsNone(UpstreamRegistry.find_source(self.redis_client, self.channel, 'alias'))
+        self.assertEqual(self.sessions(), {})
+
+    def test_a_stale_entry_replaced_meanwhile_is_kept(self):
+        key = session_key('http://example.com/a.ts', 1)
+        self.start_channel('stopped', 'http://example.com/a.ts', state=ChannelState.STOPPED)
+
+        def replaced_meanwhile(*args):
+            self.redis_client.hset(RedisKeys.upstream_sessions(), key, 'new')
+            return False
+
+        with mock.patch.object(UpstreamRegistry, '_is_live_source', side_effect=replaced_meanwhile):
+            UpstreamRegistry.find_source(self.redis_client, self.channel, 'alias')
+        self.assertEqual(self.sessions(), {key.encode(): b'new'})
+
+    def test_forget_only_drops_the_channels_own_entry(self):
+        self.start_channel('source', 'http://example.com/a.ts')
+        self.start_channel('other', 'http://example.com/a.ts')
+        UpstreamRegistry.forget(self.redis_client, 'source')
+        self.assertEqual(list(self.sessions().values()), [b'other'])
+        UpstreamRegistry.forget(self.redis_client, 'other')
+        self.assertEqual(self.sessions(), {})
+
+
+@skipIf(fakeredis is None, "fakeredis isn't installed")
+class TranscodeSessionTest(SimpleTestCase):
+    command = ['ffmpeg', '-user_agent', 'agent', '-i', 'http://example.com/a.ts', '-c', 'copy', '-f', 'mpegts', 'pipe:1']
+
+    def setUp(self):
+        self.redis_client = fakeredis.FakeRedis()
+        self.redis_client.set(RedisKeys.worker_heartbeat('worker-a'), 1)
+
+    def test_key_depends_on_the_whole_command_and_the_m3u_profile(self):
+        key = transcode_session_key(self.command, 1)
+        self.assertEqual(key, transcode_session_key(list(self.command), '1'))
+        self.assertNotEqual(key, transcode_session_key(self.command, 2))
+        self.assertNotEqual(key, transcode_session_key(self.command[:-1] + ['-'], 1))
+        # Arguments can't run together into the same key
+        self.assertNotEqual(transcode_session_key(['a b', 'c'], 1), transcode_session_key(['a', 'b c'], 1))
+        self.assertNotEqual(key, session_key('http://example.com/a.ts', 1))
+
+    def test_channel_building_the_same_command_is_served_from_the_running_session(self):
+        self.redis_client.hset(RedisKeys.channel_metadata('source'), mapping={
+            ChannelMetadataField.M3U_PROFILE: 1,
+            ChannelMetadataField.TRANSCODE: 1,
+            ChannelMetadataField.STATE: ChannelState.ACTIVE,
+            ChannelMetadataField.OWNER: 'worker-a',
+        })
+        UpstreamRegistry.register_transcode(self.redis_client, 'source', self.command)
+
+        stream_profile = mock.MagicMock()
+        stream_profile.is_redirect.return_value = False
+        stream_profile.is_proxy.return_value = False
+        stream_profile.build_command.side_effect = lambda url, user_agent: \
+            ['ffmpeg', '-user_agent', user_agent, '-i', url, '-c', 'copy', '-f', 'mpegts', 'pipe:1']
+        channel = mock.MagicMock()
+        channel.get_stream_profile.return_value = stream_profile
+
+        candidates = 'apps.proxy.ts_proxy.upstream_registry.source_candidates'
+        with mock.patch(candidates, return_value=[('http://example.com/a.ts', 1, 'agent')]):
+            self.assertEqual(UpstreamRegistry.find_source(self.redis_client, channel, 'alias'), 'source')
+        with mock.patch(candidates, return_value=[('http://example.com/a.ts', 1, 'other agent')]):
+            self.assertIsNone(UpstreamRegistry.find_source(self.redis_client, channel, 'alias'))
+        with mock.patch.object(TSConfig, 'TRANSCODE_SESSION_SHARING', False, create=True), \
+                mock.patch(candidates, return_value=[('http://example.com/a.ts', 1, 'agent')]):
+            self.assertIsNone(UpstreamRegistry.find_source(self.redis_client, channel, 'alias'))
+
+
+class RunBlockingTest(SimpleTestCase):
+    def test_runs_on_a_pool_thread_while_sockets_are_unpatched(self):
+        with mock.patch('apps.proxy.ts_proxy.utils.monkey.is_module_patched', return_value=False):
+            first = run_blocking('test', 1, threading.get_ident)
+            second = run_blocking('test', 1, threading.get_ident)
+        self.assertNotEqual(first, threading.get_ident())
+        # The pool is created once and reused
+        self.assertEqual(first, second)
+
+    def test_runs_inline_with_patched_sockets(self):
+        with mock.patch('apps.proxy.ts_proxy.utils.monkey.is_module_patched', return_value=True):
+            self.assertEqual(run_blocking('test', 1, threading.get_ident), threading.get_ident())
@@ -0,0 +1,221 @@
+"""
+Random-access index for MPEG-TS buffer chunks.
+
+The channel owner runs every chunk it writes through a TSRandomAccessIndexer,
+which follows the PAT/PMT to find the video PID and records where in the
+chunk a decoder can start: a random access point (adaptation field RAI flag,
+or a PES start carrying a keyframe), ideally preceded by PAT and PMT. New
+clients start on such a join point instead of an arbitrary chunk boundary,
+so players don't have to discard data until the next keyframe.
+"""
+
+from .constants import TS_PACKET_SIZE
+from .utils import get_logger
+
+logger = get_logger()
+
+PAT_PID = 0x0000
+
+# PMT stream types that carry video, mapped to the codec used for keyframe detection
+VIDEO_STREAM_TYPES = {
+    0x01: 'mpeg2',  # MPEG-1 video
+    0x02: 'mpeg2',  # MPEG-2 video
+    0x10: 'mpeg4',  # MPEG-4 part 2
+    0x1B: 'h264',
+    0x24: 'hevc',
+}
+
+# NAL unit types that start (or immediately precede) a decodable picture
+H264_RAP_NAL_TYPES = {5, 7}              # IDR slice, SPS
+HEVC_RAP_NAL_TYPES = set(range(16, 22)) | {32, 33}  # IRAP slices, VPS, SPS
+MPEG2_SEQUENCE_HEADER = 0xB3
+MPEG4_VOS_START = 0xB0
+
+
+class JoinPoint:
+    """Where a client can start within a chunk"""
+
+    __slots__ = ('offset', 'has_psi')
+
+    def __init__(self, offset, has_psi):
+        self.offset = offset      # Byte offset of the join point in the chunk
+        self.has_psi = has_psi    # Whether PAT and PMT come first, so no PSI needs to be prepended
+
+
+class TSRandomAccessIndexer:
+    """Stateful scanner that finds join points in consecutive chunks of one TS stream"""
+
+    def __init__(self):
+        self.pmt_pid = None
+        self.video_pid = None
+        self.video_codec = None
+        self.pat_packet = None
+        self.pmt_packet = None
+        self.psi_changed = False
+
+    @property
+    def psi(self):
+        """PAT + PMT packets to prepend when a join point isn't preceded by them"""
+        if self.pat_packet and self.pmt_packet:
+            return self.pat_packet + self.pmt_packet
+        return None
+
+    def scan(self, data):
+        """
+        Scan a chunk of packet-aligned TS data and return the first JoinPoint in it,
+        or None. Also keeps track of the latest PAT/PMT packets.
+        """
+        join = None
+        pat_offset = None
+        pmt_offset = None
+        length = len(data) - len(data) % TS_PACKET_SIZE
+
+        for offset in range(0, length, TS_PACKET_SIZE):
+            if data[offset] != 0x47:
+                continue
+
+            flags = data[offset + 1]
+            pid = ((flags & 0x1F) << 8) | data[offset + 2]
+
+            if pid == PAT_PID:
+                if flags & 0x40:
+                    self._parse_pat(data, offset)
+                    pat_offset = offset
+                    pmt_offset = None
+            elif pid == self.pmt_pid:
+                if flags & 0x40:
+                    self._parse_pmt(data, offset)
+                    pmt_offset = offset
+            elif pid == self.video_pid and join is None:
+                if self._is_random_access(data, offset, flags):
+                    has_psi = pat_offset is not None and pmt_offset is not None
+                    join = JoinPoint(pat_offset if has_psi else offset, has_psi)
+                    if not self.psi_changed:
+                        # Nothing else to learn from this chunk
+                        break
+
+        return join
+
+    def _payload_offset(self, data, offset):
+        """Offset of the packet payload, or None if the packet has no payload"""
+        control = (data[offset + 3] >> 4) & 0x03
+        if not control & 0x01:
+            return None
+        start = offset + 4
+        if control & 0x02:
+            start += 1 + data[offset + 4]
+        return start if start < offset + TS_PACKET_SIZE else None
+
+    def _section_offset(self, data, offset):
+        """Offset of the PSI section starting in this packet, or None"""
+        payload = self._payload_offset(data, offset)
+        if payload is None:
+            return None
+        section = payload + 1 + data[payload]
+        # Only sections that fit in a single packet are parsed (PAT/PMT almost always do)
+        if section + 3 > offset + TS_PACKET_SIZE:
+            return None
+        section_length = ((data[section + 1] & 0x0F) << 8) | data[section + 2]
+        if section + 3 + section_length > offset + TS_PACKET_SIZE:
+            return None
+        return section
+
+    def _parse_pat(self, data, offset):
+        section = self._section_offset(data, offset)
+        if section is None or data[section] != 0x00:
+            return
+
+        section_length = ((data[section + 1] & 0x0F) << 8) | data[section + 2]
+        end = section + 3 + section_length - 4  # Exclude CRC
+        pmt_pid = None
+        for entry in range(section + 8, end, 4):
+            program_number = (data[entry] << 8) | data[entry + 1]
+            if program_number != 0:  # Program 0 points at the NIT
+                pmt_pid = ((data[entry + 2] & 0x1F) << 8) | data[entry + 3]
+                break
+
+        packet = bytes(data[offset:offset + TS_PACKET_SIZE])
+        if packet != self.pat_packet:
+            self.pat_packet = packet
+            self.psi_changed = True
+
+        if pmt_pid is not None and pmt_pid != self.pmt_pid:
+            logger.debug(f"TS index: PMT on PID {pmt_pid}")
+            self.pmt_pid = pmt_pid
+            self.pmt_packet = None
+            self.video_pid = None
+
+    def _parse_pmt(self, data, offset):
+        section = self._section_offset(data, offset)
+        if section is None or data[section] != 0x02:
+            return
+
+        section_length = ((data[section + 1] & 0x0F) << 8) | data[section + 2]
+        end = section + 3 + section_length - 4  # Exclude CRC
+        program_info_length = ((data[section + 10] & 0x0F) << 8) | data[section + 11]
+        entry = section + 12 + program_info_length
+
+        video_pid = None
+        video_codec = None
+        while entry + 5 <= end:
+            stream_type = data[entry]
+            es_pid = ((data[entry + 1] & 0x1F) << 8) | data[entry + 2]
+            es_info_length = ((data[entry + 3] & 0x0F) << 8) | data[entry + 4]
+            if stream_type in VIDEO_STREAM_TYPES:
+                video_pid = es_pid
+                video_codec = VIDEO_STREAM_TYPES[stream_type]
+                break
+            entry += 5 + es_info_length
+
+        packet = bytes(data[offset:offset + TS_PACKET_SIZE])
+        if packet != self.pmt_packet:
+            self.pmt_packet = packet
+            self.psi_changed = True
+
+        if video_pid != self.video_pid:
+            logger.debug(f"TS index: video on PID {video_pid} ({video_codec})")
+            self.video_pid = video_pid
+            self.video_codec = video_codec
+
+    def _is_random_access(self, data, offset, flags):
+        """Check if a video packet starts a picture a decoder can start from"""
+        if not flags & 0x40:  # Must start a PES packet
+            return False
+
+        control = (data[offset + 3] >> 4) & 0x03
+        if control & 0x02 and data[offset + 4] > 0:
+            # Adaptation field random_access_indicator
+            if data[offset + 5] & 0x40:
+                return True
+
+        payload = self._payload_offset(data, offset)
+        if payload is None:
+            return False
+
+        # Skip the PES header to get to the elementary stream
+        end = offset + TS_PACKET_SIZE
+        if payload + 9 > end or data[payload] != 0 or data[payload + 1] != 0 or data[payload + 2] != 1:
+            return False
+        es = payload + 9 + data[payload + 8]
+
+        return self._has_keyframe_start_code(data, es, end)
+
+    def _has_keyframe_start_code(self, data, start, end):
+        """Look for a keyframe start code in the elementary stream bytes of one packet"""
+        codec = self.video_codec
+        i = start
+        while i + 3 < end:
+            if data[i] == 0 and data[i + 1] == 0 and data[i + 2] == 1:
+                code = data[i + 3]
+                if codec == 'h264' and (code & 0x1F) in H264_RAP_NAL_TYPES:
+                    return True
+                if codec == 'hevc' and ((code >> 1) & 0x3F) in HEVC_RAP_NAL_TYPES:
+                    return True
+                if codec == 'mpeg2' and code == MPEG2_SEQUENCE_HEADER:
+                    return True
+                if codec == 'mpeg4' and code == MPEG4_VOS_START:
+                    return True
+                i += 3
+            else:
+                i += 1
+        return False
@@ -0,0 +1,176 @@
+"""
+Upstream session registry.
+
+Channels often share a source - an alias channel mapped to the same stream,
+or the same stream listed in several M3U groups. Every channel streamed
+through the proxy profile registers its upstream under its resolved URL and
+M3U profile. When a client asks for a channel that isn't up and one of the
+channel's sources is already being pulled by another channel, the client is
+served from that channel's buffer instead of opening a second connection
+and using up another of the provider's connection slots.
+
+Transcoded channels register their ffmpeg session under the full command
+line their stream profile built (source URL, user agent and parameters)
+plus the M3U profile. A channel that would build the identical command is
+served from the running session's buffer instead of starting another ffmpeg
+process.
+
+The attached clients are clients of the source channel, so its client
+count doubles as the session's reference count: the upstream connection or
+ffmpeg process stays up while any consumer watches and is torn down with
+the channel once the last one leaves. Registrations are checked against the source
+channel's metadata on lookup, so entries left behind by a stream switch or
+a channel that died are ignored and dropped.
+"""
+
+import hashlib
+import json
+from .config_helper import ConfigHelper
+from .constants import ChannelMetadataField, ChannelState
+from .redis_keys import RedisKeys
+from .redis_scripts import run_script, COMPARE_AND_HDEL
+from .utils import get_logger
+
+logger = get_logger()
+
+# States in which a channel's buffer is being (or about to be) filled
+LIVE_STATES = [ChannelState.INITIALIZING, ChannelState.CONNECTING, ChannelState.WAITING_FOR_CLIENTS, ChannelState.ACTIVE]
+
+
+def _decode(value):
+    return value.decode('utf-8') if value is not None else None
+
+
+def session_key(url, m3u_profile_id):
+    """Registry key of an upstream session"""
+    return hashlib.sha1(f"{url}|{m3u_profile_id}".encode('utf-8')).hexdigest()
+
+
+def transcode_session_key(command, m3u_profile_id):
+    """Registry key of a transcode session running command"""
+    return hashlib.sha1(f"transcode|{json.dumps(command)}|{m3u_profile_id}".encode('utf-8')).hexdigest()
+
+
+def source_candidates(channel):
+    """
+    (URL, M3U profile ID, user agent) of each source a channel (or stream) could be
+    served from, in preference order
+    """
+    from .url_utils import transform_url
+
+    if hasattr(channel, 'streams'):
+        streams = channel.streams.all().order_by('channelstream__order')
+    else:
+        streams = [channel]
+
+    candidates = []
+    for stream in streams:
+        if not stream.m3u_account:
+            continue
+        user_agent = stream.m3u_account.get_user_agent().user_agent
+        for profile in stream.m3u_account.profiles.all():
+            if profile.is_active:
+                url = transform_url(stream.url, profile.search_pattern, profile.replace_pattern)
+                candidates.append((url, profile.id, user_agent))
+    return candidates
+
+
+class UpstreamRegistry:
+    """Maps upstream sessions to the channels pulling them"""
+
+    @staticmethod
+    def _metadata_key(metadata):
+        """Session key of the upstream a channel's metadata describes, or None if it isn't shareable"""
+        transcode = _decode(metadata.get(ChannelMetadataField.TRANSCODE.encode('utf-8')))
+        if transcode == "1":
+            return _decode(metadata.get(ChannelMetadataField.TRANSCODE_SESSION.encode('utf-8')))
+
+        url = _decode(metadata.get(ChannelMetadataField.URL.encode('utf-8')))
+        m3u_profile_id = _decode(metadata.get(ChannelMetadataField.M3U_PROFILE.encode('utf-8')))
+        if not url or not m3u_profile_id or transcode != "0":
+            return None
+        return session_key(url, m3u_profile_id)
+
+    @staticmethod
+    def register(redis_client, channel_id):
+        """Register the upstream a channel currently pulls, as described by its metadata"""
+        if not ConfigHelper.upstream_dedup_enabled() or not redis_client:
+            return
+        try:
+            key = UpstreamRegistry._metadata_key(redis_client.hgetall(RedisKeys.channel_metadata(channel_id)))
+            if key:
+                redis_client.hset(RedisKeys.upstream_sessions(), key, channel_id)
+        except Exception as e:
+            logger.error(f"Error registering upstream of channel {channel_id}: {e}")
+
+    @staticmethod
+    def register_transcode(redis_client, channel_id, command):
+        """Register the transcode session a channel just started with command"""
+        if not ConfigHelper.upstream_dedup_enabled() or not ConfigHelper.transcode_session_sharing() or not redis_client:
+            return
+        try:
+            metadata_key = RedisKeys.channel_metadata(channel_id)
+            m3u_profile_id = _decode(redis_client.hget(metadata_key, ChannelMetadataField.M3U_PROFILE))
+            if not m3u_profile_id:
+                return
+
+            key = transcode_session_key(command, m3u_profile_id)
+            redis_client.hset(metadata_key, ChannelMetadataField.TRANSCODE_SESSION, key)
+            redis_client.hset(RedisKeys.upstream_sessions(), key, channel_id)
+        except Exception as e:
+            logger.error(f"Error registering transcode session of channel {channel_id}: {e}")
+
+    @staticmethod
+    def forget(redis_client, channel_id):
+        """Drop a channel's registration (before its metadata is deleted)"""
+        key = UpstreamRegistry._metadata_key(redis_client.hgetall(RedisKeys.channel_metadata(channel_id)))
+        if key:
+            run_script(redis_client, COMPARE_AND_HDEL, [RedisKeys.upstream_sessions()], [key, channel_id])
+
+    @staticmethod
+    def _is_live_source(redis_client, source_id, key):
+        """Whether a registered channel is up and still pulling the session registered under key"""
+        metadata = redis_client.hgetall(RedisKeys.channel_metadata(source_id))
+        if not metadata or UpstreamRegistry._metadata_key(metadata) != key:
+            return False
+        if _decode(metadata.get(ChannelMetadataField.STATE.encode('utf-8'))) not in LIVE_STATES:
+            return False
+        if redis_client.exists(RedisKeys.channel_stopping(source_id)):
+            return False
+
+        owner = _decode(metadata.get(ChannelMetadataField.OWNER.encode('utf-8')))
+        return bool(owner and redis_client.exists(RedisKeys.worker_heartbeat(owner)))
+
+    @staticmethod
+    def find_source(redis_client, channel, channel_id):
+        """
+        ID of a live channel already pulling one of this channel's sources (through
+        the same transcode command, if the channel transcodes), or None
+        """
+        if not ConfigHelper.upstream_dedup_enabled() or not redis_client:
+            return None
+
+        stream_profile = channel.get_stream_profile()
+        if stream_profile.is_redirect():
+            return None
+
+        keys = []
+        for url, m3u_profile_id, user_agent in source_candidates(channel):
+            if stream_profile.is_proxy():
+                keys.append(session_key(url, m3u_profile_id))
+            elif ConfigHelper.transcode_session_sharing():
+                keys.append(transcode_session_key(stream_profile.build_command(url, user_agent), m3u_profile_id))
+        if not keys:
+            return None
+
+        for key, source_id in zip(keys, redis_client.hmget(RedisKeys.upstream_sessions(), keys)):
+            source_id = _decode(source_id)
+            if not source_id or source_id == channel_id:
+                continue
+            if UpstreamRegistry._is_live_source(redis_client, source_id, key):
+                return source_id
+
+            # Left behind by a stream switch or a channel that went away
+            run_script(redis_client, COMPARE_AND_HDEL, [RedisKeys.upstream_sessions()], [key, source_id])
+
+        return None
@@ -1,10 +1,17 @@
 import logging
 import re
+import threading
 from urllib.parse import urlparse
 import inspect
+from gevent import monkey
+from gevent.threadpool import ThreadPool
 
 logger = logging.getLogger("ts_proxy")
 
+# Thread pools for blocking socket calls, by name
+_blocking_pools = {}
+_blocking_pools_lock = threading.Lock()
+
 def detect_stream_type(url):
     """
     Detect if stream URL is HLS or TS format.
@@ -105,4 +112,32 @@ def get_logger(component_name=None):
             # Default if detection fails
             logger_name = "ts_proxy"
 
-    return logging.getLogger(logger_name)
\ No newline at end of file
+    return logging.getLogger(logger_name)
+def run_blocking(pool_name, threads, fn, *args):
+    """
+    Run a blocking socket call without stalling the gevent hub.
+
+    uWSGI runs gevent without monkey patching, so sockets block the whole
+    worker: a read waiting on Redis or another node would freeze every other
+    greenlet. Unless sockets are patched, the call runs on the named pool of
+    `threads` threads instead (created on first use).
+
+    Args:
+        pool_name (str): Name of the pool to run the call on
+        threads (int): Size of the pool if it has to be created
+        fn (callable): The blocking call
+        *args: Arguments for fn
+
+    Returns:
+        Whatever fn returns
+    """
+    if monkey.is_module_patched('socket'):
+        return fn(*args)
+
+    pool = _blocking_pools.get(pool_name)
+    if pool is None:
+        with _blocking_pools_lock:
+            pool = _blocking_pools.get(pool_name)
+            if pool is None:
+                pool = _blocking_pools[pool_name] = ThreadPool(threads)
+    return pool.apply(fn, args)
@@ -23,6 +23,10 @@ from .config_helper import ConfigHelper
 from .services.channel_service import ChannelService
 from .url_utils import generate_stream_url, transform_url, get_stream_info_for_switch, get_stream_object, get_alternate_streams
 from .utils import get_logger
+from .linger import LingerPolicy, channel_profile_ids
+from .warm_pool import WarmPool
+from .upstream_registry import UpstreamRegistry
+from .cluster import ClientRouting, NodeRegistry, FORWARDED_HEADER, forward_stream, local_node_id, worker_node
 from uuid import UUID
 import gevent
 
@@ -50,216 +54,26 @@ def stream_ts(request, channel_id):
                 logger.debug(f"[{client_id}] Client connected with user agent: {client_user_agent}")
                 break
 
-        # Check if we need to reinitialize the channel
-        needs_initialization = True
-        channel_state = None
+        # A channel whose source another channel is already pulling is served from that channel
+        source_channel_id = _shared_upstream_source(proxy_server, channel, channel_id, client_id)
+        if source_channel_id:
+            channel_id = source_channel_id
+            channel = get_stream_object(channel_id)
 
-        # Get current channel state from Redis if available
-        if proxy_server.redis_client:
-            metadata_key = RedisKeys.channel_metadata(channel_id)
-            if proxy_server.redis_client.exists(metadata_key):
-                metadata = proxy_server.redis_client.hgetall(metadata_key)
-                state_field = ChannelMetadataField.STATE.encode('utf-8')
-                if state_field in metadata:
-                    channel_state = metadata[state_field].decode('utf-8')
-
-                    # Only skip initialization if channel is in a healthy state
-                    valid_states = [ChannelState.ACTIVE, ChannelState.WAITING_FOR_CLIENTS]
-                    if channel_state in valid_states:
-                        # Verify the owner is still active
-                        owner_field = ChannelMetadataField.OWNER.encode('utf-8')
-                        if owner_field in metadata:
-                            owner = metadata[owner_field].decode('utf-8')
-                            owner_heartbeat_key = f"ts_proxy:worker:{owner}:heartbeat"
-                            if proxy_server.redis_client.exists(owner_heartbeat_key):
-                                # Owner is active and channel is in good state
-                                needs_initialization = False
-                                logger.info(f"[{client_id}] Channel {channel_id} in state {channel_state} with active owner {owner}")
+        # In cluster mode, clients of channels owned by another node may be sent there
+        routed_response = _route_to_owner_node(request, proxy_server, channel_id, client_id, client_user_agent)
+        if routed_response is not None:
+            return routed_response
+
+        # Check if we need to reinitialize the channel
+        needs_initialization, channel_state = _channel_needs_initialization(proxy_server, channel_id, client_id)
 
         # Start initialization if needed
         channel_initializing = False
         if needs_initialization or not proxy_server.check_if_channel_exists(channel_id):
-            # Force cleanup of any previous instance
-            if channel_state in [ChannelState.ERROR, ChannelState.STOPPING, ChannelState.STOPPED]:
-                logger.warning(f"[{client_id}] Channel {channel_id} in state {channel_state}, forcing cleanup")
-                proxy_server.stop_channel(channel_id)
-
-            # Initialize the channel (but don't wait for completion)
-            logger.info(f"[{client_id}] Starting channel {channel_id} initialization")
-
-            # Use max retry attempts and connection timeout from config
-            max_retries = ConfigHelper.max_retries()
-            retry_timeout = ConfigHelper.connection_timeout()
-            wait_start_time = time.time()
-
-            stream_url = None
-            stream_user_agent = None
-            transcode = False
-            profile_value = None
-            error_reason = None
-
-            # Try to get a stream with configured retries
-            for attempt in range(max_retries):
-                stream_url, stream_user_agent, transcode, profile_value = generate_stream_url(channel_id)
-
-                if stream_url is not None:
-                    logger.info(f"[{client_id}] Successfully obtained stream for channel {channel_id}")
-                    break
-
-                # If we failed because there are no streams assigned, don't retry
-                _, _, error_reason = channel.get_stream()
-                if error_reason and 'maximum connection limits' not in error_reason:
-                    logger.warning(f"[{client_id}] Can't retry - error not related to connection limits: {error_reason}")
-                    break
-
-                # Don't exceed the overall connection timeout
-                if time.time() - wait_start_time > retry_timeout:
-                    logger.warning(f"[{client_id}] Connection wait timeout exceeded ({retry_timeout}s)")
-                    break
-
-                # Wait before retrying (using exponential backoff with a cap)
-                wait_time = min(0.5 * (2 ** attempt), 2.0)  # Caps at 2 seconds
-                logger.info(f"[{client_id}] Waiting {wait_time:.1f}s for a connection to become available (attempt {attempt+1}/{max_retries})")
-                gevent.sleep(wait_time)  # FIXED: Using gevent.sleep instead of time.sleep
-
-            if stream_url is None:
-                # Make sure to release any stream locks that might have been acquired
-                if hasattr(channel, 'streams') and channel.streams.exists():
-                    for stream in channel.streams.all():
-                        try:
-                            stream.release_stream()
-                            logger.info(f"[{client_id}] Released stream {stream.id} for channel {channel_id}")
-                        except Exception as e:
-                            logger.error(f"[{client_id}] Error releasing stream: {e}")
-
-                # Get the specific error message if available
-                wait_duration = f"{int(time.time() - wait_start_time)}s"
-                error_msg = error_reason if error_reason else 'No available streams for this channel'
-                return JsonResponse({
-                    'error': error_msg,
-                    'waited': wait_duration
-                }, status=503)  # 503 Service Unavailable is appropriate here
-
-            # Get the stream ID from the channel
-            stream_id, m3u_profile_id, _ = channel.get_stream()
-            logger.info(f"Channel {channel_id} using stream ID {stream_id}, m3u account profile ID {m3u_profile_id}")
-
-            # Generate transcode command if needed
-            stream_profile = channel.get_stream_profile()
-            if stream_profile.is_redirect():
-                # Validate the stream URL before redirecting
-                from .url_utils import validate_stream_url, get_alternate_streams, get_stream_info_for_switch
-
-                # Try initial URL
-                logger.info(f"[{client_id}] Validating redirect URL: {stream_url}")
-                is_valid, final_url, status_code, message = validate_stream_url(
-                    stream_url,
-                    user_agent=stream_user_agent,
-                    timeout=(5, 5)
-                )
-
-                # If first URL doesn't validate, try alternates
-                if not is_valid:
-                    logger.warning(f"[{client_id}] Primary stream URL failed validation: {message}")
-
-                    # Track tried streams to avoid loops
-                    tried_streams = {stream_id}
-
-                    # Get alternate streams
-                    alternates = get_alternate_streams(channel_id, stream_id)
-
-                    # Try each alternate until one works
-                    for alt in alternates:
-                        if alt['stream_id'] in tried_streams:
-                            continue
-
-                        tried_streams.add(alt['stream_id'])
-
-                        # Get stream info
-                        alt_info = get_stream_info_for_switch(channel_id, alt['stream_id'])
-                        if 'error' in alt_info:
-                            logger.warning(f"[{client_id}] Error getting alternate stream info: {alt_info['error']}")
-                            continue
-
-                        # Validate the alternate URL
-                        logger.info(f"[{client_id}] Trying alternate stream #{alt['stream_id']}: {alt_info['url']}")
-                        is_valid, final_url, status_code, message = validate_stream_url(
-                            alt_info['url'],
-                            user_agent=alt_info['user_agent'],
-                            timeout=(5, 5)
-                        )
-
-                        if is_valid:
-                            logger.info(f"[{client_id}] Alternate stream #{alt['stream_id']} validated successfully")
-                            break
-                        else:
-                            logger.warning(f"[{client_id}] Alternate stream #{alt['stream_id']} failed validation: {message}")
-                # Release stream lock before redirecting
-                channel.release_stream()
-                # Final decision based on validation results
-                if is_valid:
-                    logger.info(f"[{client_id}] Redirecting to validated URL: {final_url} ({message})")
-                    return HttpResponseRedirect(final_url)
-                else:
-                    logger.error(f"[{client_id}] All available redirect URLs failed validation")
-                    return JsonResponse({
-                        'error': 'All available streams failed validation'
-                    }, status=502)  # 502 Bad Gateway
-
-            # Initialize channel with the stream's user agent (not the client's)
-            success = ChannelService.initialize_channel(
-                channel_id, stream_url, stream_user_agent, transcode, profile_value, stream_id, m3u_profile_id
-            )
-
-            if not success:
-                return JsonResponse({'error': 'Failed to initialize channel'}, status=500)
-
-            # If we're the owner, wait for connection to establish
-            if proxy_server.am_i_owner(channel_id):
-                manager = proxy_server.stream_managers.get(channel_id)
-                if manager:
-                    wait_start = time.time()
-                    timeout = ConfigHelper.connection_timeout()
-                    while not manager.connected:
-                        if time.time() - wait_start > timeout:
-                            proxy_server.stop_channel(channel_id)
-                            return JsonResponse({'error': 'Connection timeout'}, status=504)
-
-                        # Check if this manager should keep retrying or stop
-                        if not manager.should_retry():
-                            # Check channel state in Redis to make a better decision
-                            metadata_key = RedisKeys.channel_metadata(channel_id)
-                            current_state = None
-
-                            if proxy_server.redis_client:
-                                try:
-                                    state_bytes = proxy_server.redis_client.hget(metadata_key, ChannelMetadataField.STATE)
-                                    if state_bytes:
-                                        current_state = state_bytes.decode('utf-8')
-                                        logger.debug(f"[{client_id}] Current state of channel {channel_id}: {current_state}")
-                                except Exception as e:
-                                    logger.warning(f"[{client_id}] Error getting channel state: {e}")
-
-                            # Allow normal transitional states to continue
-                            if current_state in [ChannelState.INITIALIZING, ChannelState.CONNECTING]:
-                                logger.info(f"[{client_id}] Channel {channel_id} is in {current_state} state, continuing to wait")
-                                # Reset wait timer to allow the transition to complete
-                                wait_start = time.time()
-                                continue
-
-                            # Check if we're switching URLs
-                            if hasattr(manager, 'url_switching') and manager.url_switching:
-                                logger.info(f"[{client_id}] Stream manager is currently switching URLs for channel {channel_id}")
-                                # Reset wait timer to give the switch a chance
-                                wait_start = time.time()
-                                continue
-
-                            # If we reach here, we've exhausted retries and the channel isn't in a valid transitional state
-                            logger.warning(f"[{client_id}] Channel {channel_id} failed to connect and is not in transitional state")
-                            proxy_server.stop_channel(channel_id)
-                            return JsonResponse({'error': 'Failed to connect'}, status=502)
-
-                        gevent.sleep(0.1)  # FIXED: Using gevent.sleep instead of time.sleep
+            init_response = _initialize_channel_single_flight(proxy_server, channel, channel_id, client_id, channel_state)
+            if init_response is not None:
+                return init_response
 
             logger.info(f"[{client_id}] Successfully initialized channel {channel_id}")
             channel_initializing = True
@@ -303,6 +117,9 @@ def stream_ts(request, channel_id):
             logger.info(f"[{client_id}] Successfully initialized channel {channel_id} locally")
 
         # Register client
+        if proxy_server.redis_client:
+            LingerPolicy.record_join(proxy_server.redis_client, channel_id)
+            WarmPool.record_view(proxy_server.redis_client, channel_id)
         buffer = proxy_server.stream_buffers[channel_id]
         client_manager = proxy_server.client_managers[channel_id]
         client_manager.add_client(client_id, client_ip, client_user_agent)
@@ -325,6 +142,358 @@ def stream_ts(request, channel_id):
         logger.error(f"Error in stream_ts: {e}", exc_info=True)
         return JsonResponse({'error': str(e)}, status=500)
 
+def _channel_needs_initialization(proxy_server, channel_id, client_id, include_starting=False):
+    """
+    Check whether a channel has to be (re)initialized before a client can join it.
+    With include_starting, a channel still coming up under a live owner doesn't.
+    Returns (needs_initialization, channel state or None).
+    """
+    needs_initialization = True
+    channel_state = None
+
+    # Get current channel state from Redis if available
+    if proxy_server.redis_client:
+        metadata_key = RedisKeys.channel_metadata(channel_id)
+        if proxy_server.redis_client.exists(metadata_key):
+            metadata = proxy_server.redis_client.hgetall(metadata_key)
+            state_field = ChannelMetadataField.STATE.encode('utf-8')
+            if state_field in metadata:
+                channel_state = metadata[state_field].decode('utf-8')
+
+                # Only skip initialization if channel is in a healthy state
+                valid_states = [ChannelState.ACTIVE, ChannelState.WAITING_FOR_CLIENTS]
+                if include_starting:
+                    valid_states += [ChannelState.INITIALIZING, ChannelState.CONNECTING]
+                if channel_state in valid_states:
+                    # Verify the owner is still active
+                    owner_field = ChannelMetadataField.OWNER.encode('utf-8')
+                    if owner_field in metadata:
+                        owner = metadata[owner_field].decode('utf-8')
+                        owner_heartbeat_key = f"ts_proxy:worker:{owner}:heartbeat"
+                        if proxy_server.redis_client.exists(owner_heartbeat_key):
+                            # Owner is active and channel is in good state
+                            needs_initialization = False
+                            logger.info(f"[{client_id}] Channel {channel_id} in state {channel_state} with active owner {owner}")
+
+    return needs_initialization, channel_state
+
+
+def _shared_upstream_source(proxy_server, channel, channel_id, client_id):
+    """ID of a live channel already pulling this (not yet running) channel's source, or None"""
+    if not proxy_server.redis_client:
+        return None
+
+    needs_initialization, _ = _channel_needs_initialization(proxy_server, channel_id, client_id, include_starting=True)
+    if not needs_initialization:
+        return None
+
+    try:
+        source_channel_id = UpstreamRegistry.find_source(proxy_server.redis_client, channel, channel_id)
+    except Exception as e:
+        logger.error(f"[{client_id}] Error looking up shared upstream for channel {channel_id}: {e}")
+        return None
+
+    if source_channel_id:
+        logger.info(f"[{client_id}] Channel {channel_id} shares its upstream with channel {source_channel_id}, "
+                    f"serving from that channel's buffer")
+    return source_channel_id
+
+
+def _initialize_channel_single_flight(proxy_server, channel, channel_id, client_id, channel_state):
+    """
+    Initialize a channel, or wait while another request in the cluster does.
+    Returns an error or redirect response, or None once the channel is ready to join.
+    """
+    # Redirect profiles don't share an upstream connection between clients
+    if channel.get_stream_profile().is_redirect() or not proxy_server.redis_client:
+        return _initialize_channel(proxy_server, channel, channel_id, client_id, channel_state)
+
+    init_flight = proxy_server.init_flight
+    holder_id = f"{proxy_server.worker_id}:{client_id}"
+    lock_ttl = ConfigHelper.channel_init_lock_ttl()
+    deadline = time.time() + lock_ttl * 2
+
+    while True:
+        if init_flight.try_lead(channel_id, holder_id):
+            # Another initializer may have finished between our state check and taking the lock
+            needs_initialization, channel_state = _channel_needs_initialization(
+                proxy_server, channel_id, client_id, include_starting=True)
+            if not needs_initialization:
+                init_flight.finish(channel_id, holder_id, True)
+                return None
+
+            # Always release the lock - also when the request greenlet is killed (client
+            # disconnect, worker shutdown), which isn't an Exception
+            response = None
+            finished = False
+            try:
+                response = _initialize_channel(proxy_server, channel, channel_id, client_id, channel_state)
+                finished = True
+            finally:
+                if not finished:
+                    init_flight.finish(channel_id, holder_id, False, 'Failed to initialize channel', 500,
+                                       abandoned=True)
+                elif response is None:
+                    init_flight.finish(channel_id, holder_id, True)
+                else:
+                    error = None
+                    try:
+                        error = json.loads(response.content).get('error')
+                    except (ValueError, AttributeError):
+                        pass
+                    init_flight.finish(channel_id, holder_id, False, error, response.status_code)
+            return response
+
+        logger.info(f"[{client_id}] Channel {channel_id} is being initialized by another request, waiting for it")
+        outcome = init_flight.wait(channel_id, max(deadline - time.time(), 0))
+
+        if outcome is not None and not outcome.get('abandoned'):
+            if outcome.get('ready'):
+                logger.info(f"[{client_id}] Channel {channel_id} initialized by another request")
+                return None
+            return JsonResponse({'error': outcome.get('error') or 'Failed to initialize channel'},
+                                status=outcome.get('status') or 500)
+
+        # The initializer gave up or went away without telling us - the channel may still have come up
+        needs_initialization, channel_state = _channel_needs_initialization(
+            proxy_server, channel_id, client_id, include_starting=True)
+        if not needs_initialization:
+            return None
+
+        if time.time() >= deadline:
+            logger.warning(f"[{client_id}] Timed out waiting for channel {channel_id} initialization")
+            return JsonResponse({'error': 'Timed out waiting for channel initialization'}, status=504)
+
+
+def _initialize_channel(proxy_server, channel, channel_id, client_id, channel_state):
+    """Initialize a channel for a client. Returns an error or redirect response, or None on success."""
+    # Force cleanup of any previous instance
+    if channel_state in [ChannelState.ERROR, ChannelState.STOPPING, ChannelState.STOPPED]:
+        logger.warning(f"[{client_id}] Channel {channel_id} in state {channel_state}, forcing cleanup")
+        proxy_server.stop_channel(channel_id)
+
+    # Initialize the channel (but don't wait for completion)
+    logger.info(f"[{client_id}] Starting channel {channel_id} initialization")
+
+    # Use max retry attempts and connection timeout from config
+    max_retries = ConfigHelper.max_retries()
+    retry_timeout = ConfigHelper.connection_timeout()
+    wait_start_time = time.time()
+
+    stream_url = None
+    stream_user_agent = None
+    transcode = False
+    profile_value = None
+    error_reason = None
+    released_channel = None
+
+    # Try to get a stream with configured retries
+    for attempt in range(max_retries):
+        stream_url, stream_user_agent, transcode, profile_value = generate_stream_url(channel_id)
+
+        if stream_url is not None:
+            logger.info(f"[{client_id}] Successfully obtained stream for channel {channel_id}")
+            break
+
+        # If we failed because there are no streams assigned, don't retry
+        _, _, error_reason = channel.get_stream()
+        if error_reason and 'maximum connection limits' not in error_reason:
+            logger.warning(f"[{client_id}] Can't retry - error not related to connection limits: {error_reason}")
+            break
+
+        # A channel lingering without clients may be holding the slot we need
+        if error_reason and proxy_server.redis_client and not released_channel:
+            released_channel = LingerPolicy.release_slot(proxy_server.redis_client, channel_profile_ids(channel))
+            if released_channel:
+                logger.info(f"[{client_id}] Lingering channel {released_channel} is freeing a slot for channel {channel_id}")
+
+        # Don't exceed the overall connection timeout
+        if time.time() - wait_start_time > retry_timeout:
+            logger.warning(f"[{client_id}] Connection wait timeout exceeded ({retry_timeout}s)")
+            break
+
+        # Wait before retrying (using exponential backoff with a cap)
+        wait_time = min(0.5 * (2 ** attempt), 2.0)  # Caps at 2 seconds
+        logger.info(f"[{client_id}] Waiting {wait_time:.1f}s for a connection to become available (attempt {attempt+1}/{max_retries})")
+        gevent.sleep(wait_time)  # FIXED: Using gevent.sleep instead of time.sleep
+
+    if stream_url is None:
+        # Make sure to release any stream locks that might have been acquired
+        if hasattr(channel, 'streams') and channel.streams.exists():
+            for stream in channel.streams.all():
+                try:
+                    stream.release_stream()
+                    logger.info(f"[{client_id}] Released stream {stream.id} for channel {channel_id}")
+                except Exception as e:
+                    logger.error(f"[{client_id}] Error releasing stream: {e}")
+
+        # Get the specific error message if available
+        wait_duration = f"{int(time.time() - wait_start_time)}s"
+        error_msg = error_reason if error_reason else 'No available streams for this channel'
+        return JsonResponse({
+            'error': error_msg,
+            'waited': wait_duration
+        }, status=503)  # 503 Service Unavailable is appropriate here
+
+    # Get the stream ID from the channel
+    stream_id, m3u_profile_id, _ = channel.get_stream()
+    logger.info(f"Channel {channel_id} using stream ID {stream_id}, m3u account profile ID {m3u_profile_id}")
+
+    # Generate transcode command if needed
+    stream_profile = channel.get_stream_profile()
+    if stream_profile.is_redirect():
+        # Validate the stream URL before redirecting
+        from .url_utils import validate_stream_url, get_alternate_streams, get_stream_info_for_switch
+
+        # Try initial URL
+        logger.info(f"[{client_id}] Validating redirect URL: {stream_url}")
+        is_valid, final_url, status_code, message = validate_stream_url(
+            stream_url,
+            user_agent=stream_user_agent,
+            timeout=(5, 5)
+        )
+
+        # If first URL doesn't validate, try alternates
+        if not is_valid:
+            logger.warning(f"[{client_id}] Primary stream URL failed validation: {message}")
+
+            # Track tried streams to avoid loops
+            tried_streams = {stream_id}
+
+            # Get alternate streams
+            alternates = get_alternate_streams(channel_id, stream_id)
+
+            # Try each alternate until one works
+            for alt in alternates:
+                if alt['stream_id'] in tried_streams:
+                    continue
+
+                tried_streams.add(alt['stream_id'])
+
+                # Get stream info
+                alt_info = get_stream_info_for_switch(channel_id, alt['stream_id'])
+                if 'error' in alt_info:
+                    logger.warning(f"[{client_id}] Error getting alternate stream info: {alt_info['error']}")
+                    continue
+
+                # Validate the alternate URL
+                logger.info(f"[{client_id}] Trying alternate stream #{alt['stream_id']}: {alt_info['url']}")
+                is_valid, final_url, status_code, message = validate_stream_url(
+                    alt_info['url'],
+                    user_agent=alt_info['user_agent'],
+                    timeout=(5, 5)
+                )
+
+                if is_valid:
+                    logger.info(f"[{client_id}] Alternate stream #{alt['stream_id']} validated successfully")
+                    break
+                else:
+                    logger.warning(f"[{client_id}] Alternate stream #{alt['stream_id']} failed validation: {message}")
+        # Release stream lock before redirecting
+        channel.release_stream()
+        # Final decision based on validation results
+        if is_valid:
+            logger.info(f"[{client_id}] Redirecting to validated URL: {final_url} ({message})")
+            return HttpResponseRedirect(final_url)
+        else:
+            logger.error(f"[{client_id}] All available redirect URLs failed validation")
+            return JsonResponse({
+                'error': 'All available streams failed validation'
+            }, status=502)  # 502 Bad Gateway
+
+    # Initialize channel with the stream's user agent (not the client's)
+    success = ChannelService.initialize_channel(
+        channel_id, stream_url, stream_user_agent, transcode, profile_value, stream_id, m3u_profile_id
+    )
+
+    if not success:
+        return JsonResponse({'error': 'Failed to initialize channel'}, status=500)
+
+    # If we're the owner, wait for connection to establish
+    if proxy_server.am_i_owner(channel_id):
+        manager = proxy_server.stream_managers.get(channel_id)
+        if manager:
+            wait_start = time.time()
+            timeout = ConfigHelper.connection_timeout()
+            while not manager.connected:
+                if time.time() - wait_start > timeout:
+                    proxy_server.stop_channel(channel_id)
+                    return JsonResponse({'error': 'Connection timeout'}, status=504)
+
+                # Check if this manager should keep retrying or stop
+                if not manager.should_retry():
+                    # Check channel state in Redis to make a better decision
+                    metadata_key = RedisKeys.channel_metadata(channel_id)
+                    current_state = None
+
+                    if proxy_server.redis_client:
+                        try:
+                            state_bytes = proxy_server.redis_client.hget(metadata_key, ChannelMetadataField.STATE)
+                            if state_bytes:
+                                current_state = state_bytes.decode('utf-8')
+                                logger.debug(f"[{client_id}] Current state of channel {channel_id}: {current_state}")
+                        except Exception as e:
+                            logger.warning(f"[{client_id}] Error getting channel state: {e}")
+
+                    # Allow normal transitional states to continue
+                    if current_state in [ChannelState.INITIALIZING, ChannelState.CONNECTING]:
+                        logger.info(f"[{client_id}] Channel {channel_id} is in {current_state} state, continuing to wait")
+                        # Reset wait timer to allow the transition to complete
+                        wait_start = time.time()
+                        continue
+
+                    # Check if we're switching URLs
+                    if hasattr(manager, 'url_switching') and manager.url_switching:
+                        logger.info(f"[{client_id}] Stream manager is currently switching URLs for channel {channel_id}")
+                        # Reset wait timer to give the switch a chance
+                        wait_start = time.time()
+                        continue
+
+                    # If we reach here, we've exhausted retries and the channel isn't in a valid transitional state
+                    logger.warning(f"[{client_id}] Channel {channel_id} failed to connect and is not in transitional state")
+                    proxy_server.stop_channel(channel_id)
+                    return JsonResponse({'error': 'Failed to connect'}, status=502)
+
+                gevent.sleep(0.1)  # FIXED: Using gevent.sleep instead of time.sleep
+
+    return None
+
+
+def _route_to_owner_node(request, proxy_server, channel_id, client_id, client_user_agent):
+    """
+    Redirect or forward a client to the node that owns its channel, depending
+    on CLUSTER_CLIENT_ROUTING. Returns None if the client should be served here.
+    """
+    routing = ConfigHelper.cluster_client_routing()
+    if routing == ClientRouting.BUFFER or not proxy_server.redis_client:
+        return None
+
+    # Requests forwarded by another node are always served here
+    if request.META.get('HTTP_' + FORWARDED_HEADER.upper().replace('-', '_')):
+        return None
+
+    owner_node = worker_node(proxy_server.get_channel_owner(channel_id))
+    if not owner_node or owner_node == local_node_id():
+        return None
+
+    node_url = NodeRegistry.get_url(proxy_server.redis_client, owner_node)
+    if not node_url:
+        logger.debug(f"[{client_id}] No URL known for node {owner_node}, serving channel {channel_id} from buffer")
+        return None
+
+    target_url = f"{node_url}{request.get_full_path()}"
+    if routing == ClientRouting.REDIRECT:
+        logger.info(f"[{client_id}] Redirecting to node {owner_node}, which owns channel {channel_id}")
+        return HttpResponseRedirect(target_url)
+
+    logger.info(f"[{client_id}] Forwarding stream of channel {channel_id} from owner node {owner_node}")
+    response = StreamingHttpResponse(
+        streaming_content=forward_stream(target_url, client_user_agent),
+        content_type='video/mp2t'
+    )
+    response['Cache-Control'] = 'no-cache'
+    return response
+
 @csrf_exempt
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -0,0 +1,201 @@
+"""
+Warm channel pool.
+
+Channels in the pool stay connected upstream with a rolling buffer even
+without viewers, so a client tuning to one is served from an already filled
+buffer. The pool holds the channels listed in WARM_POOL_CHANNELS plus the
+WARM_POOL_SIZE most watched channels by recent (decaying) viewing history.
+
+One worker at a time manages the pool, under a leader lock it refreshes on
+every check. A warm channel is only started if its M3U profile has a free
+slot. While it has no viewers it is offered up like a lingering channel, so
+a client that needs the slot for another channel gets it right away and the
+pool shrinks.
+"""
+
+import threading
+import time
+import gevent
+from .client_registry import ClientRegistry
+from .config_helper import ConfigHelper
+from .constants import ChannelMetadataField
+from .linger import LingerPolicy
+from .redis_keys import RedisKeys
+from .redis_scripts import run_script, HOLD_LOCK
+from .utils import get_logger
+
+logger = get_logger()
+
+# Viewing scores that decayed below this are dropped
+MIN_VIEW_SCORE = 0.05
+
+
+class WarmPool:
+    """Warm pool state shared by all workers"""
+
+    @staticmethod
+    def record_view(redis_client, channel_id):
+        """Count a client tuning to a channel towards its viewing history"""
+        if ConfigHelper.warm_pool_enabled() and ConfigHelper.warm_pool_size() > 0:
+            redis_client.zincrby(RedisKeys.channel_views(), 1, channel_id)
+
+    @staticmethod
+    def is_warm(redis_client, channel_id):
+        """Whether a channel is kept up without viewers"""
+        return bool(redis_client.hexists(RedisKeys.warm_channels(), channel_id))
+
+    @staticmethod
+    def forget(redis_client, channel_id):
+        """Drop a channel from the pool"""
+        redis_client.hdel(RedisKeys.warm_channels(), channel_id)
+
+    @staticmethod
+    def park(redis_client, channel_id):
+        """Offer a warm channel without viewers up for release when its profile's slots are needed"""
+        profile_id = redis_client.hget(RedisKeys.channel_metadata(channel_id), ChannelMetadataField.M3U_PROFILE)
+        LingerPolicy.park(redis_client, channel_id, profile_id.decode('utf-8') if profile_id else None)
+
+
+class WarmPoolManager:
+    """Keeps the pool's channels up while this worker holds the pool's leader lock"""
+
+    def __init__(self, proxy_server):
+        self.proxy_server = proxy_server
+        self.redis_client = proxy_server.redis_client
+        self.holder_id = f"{proxy_server.worker_id}:warm_pool"
+
+    def start(self):
+        """Start the pool management thread if the pool is enabled"""
+        if not ConfigHelper.warm_pool_enabled() or not self.redis_client:
+            return
+
+        def warm_pool_task():
+            while True:
+                try:
+                    self.run_check()
+                except Exception as e:
+                    logger.error(f"Error in warm pool check: {e}", exc_info=True)
+
+                gevent.sleep(ConfigHelper.warm_pool_check_interval())
+
+        thread = threading.Thread(target=warm_pool_task, daemon=True)
+        thread.name = "ts-proxy-warm-pool"
+        thread.start()
+        logger.info(f"Started warm channel pool thread (interval: {ConfigHelper.warm_pool_check_interval()}s)")
+
+    def _hold_leadership(self):
+        """Acquire or refresh the pool's leader lock. Returns True if this worker manages the pool."""
+        if self.proxy_server.draining:
+            return False
+        ttl_ms = int(ConfigHelper.warm_pool_check_interval() * 3 * 1000)
+        return bool(run_script(self.redis_client, HOLD_LOCK, [RedisKeys.warm_pool_leader()], [self.holder_id, ttl_ms]))
+
+    def _decay_views(self):
+        """Halve viewing scores every half-life so the pool follows recent viewing"""
+        # The last decay time lives in Redis so a new leader carries on from the previous one
+        now = time.time()
+        last_decay = self.redis_client.getset(RedisKeys.warm_pool_last_decay(), now)
+        if last_decay is None:
+            return
+        elapsed = max(now - float(last_decay), 0)
+        weight = 0.5 ** (elapsed / ConfigHelper.warm_pool_history_half_life())
+
+        views_key = RedisKeys.channel_views()
+        pipe = self.redis_client.pipeline()
+        pipe.zunionstore(views_key, {views_key: weight})
+        pipe.zremrangebyscore(views_key, '-inf', MIN_VIEW_SCORE)
+        pipe.execute()
+
+    def _targets(self):
+        """Channel IDs that should be warm, configured channels first"""
+        configured = [str(channel_id) for channel_id in ConfigHelper.warm_pool_channels()]
+
+        size = ConfigHelper.warm_pool_size()
+        if size <= 0:
+            return configured
+
+        most_watched = [channel_id.decode('utf-8') for channel_id in
+                        self.redis_client.zrevrange(RedisKeys.channel_views(), 0, size + len(configured) - 1)]
+        return configured + [channel_id for channel_id in most_watched if channel_id not in configured][:size]
+
+    def run_check(self):
+        """Bring the pool in line with its targets (no-op unless this worker is the leader)"""
+        if not self._hold_leadership():
+            return
+
+        self._decay_views()
+        targets = self._targets()
+        warm = {channel_id.decode('utf-8') for channel_id in self.redis_client.hkeys(RedisKeys.warm_channels())}
+
+        # Channels that dropped out of the pool shut down normally once they have no viewers
+        dropped = warm - set(targets)
+        if dropped:
+            self.redis_client.hdel(RedisKeys.warm_channels(), *dropped)
+            logger.info(f"Removed {len(dropped)} channels from the warm pool")
+
+        for channel_id in targets:
+            if channel_id in warm:
+                if not self.proxy_server.check_if_channel_exists(channel_id):
+                    # Gave its slot up or failed - try again below once a slot is free
+                    WarmPool.forget(self.redis_client, channel_id)
+                elif ClientRegistry.count(self.redis_client, channel_id) == 0:
+                    WarmPool.park(self.redis_client, channel_id)
+                    continue
+                else:
+                    continue
+
+            if self.proxy_server.check_if_channel_exists(channel_id):
+                # Already up for its viewers - keep it up once they're gone
+                self.redis_client.hset(RedisKeys.warm_channels(), channel_id, time.time())
+                continue
+
+            self._warm_channel(channel_id)
+
+    def _warm_channel(self, channel_id):
+        """Start a channel without viewers. Returns True if it was started."""
+        from .services.channel_service import ChannelService
+        from .url_utils import generate_stream_url, get_stream_object
+
+        try:
+            channel = get_stream_object(channel_id)
+        except Exception as e:
+            logger.warning(f"Can't warm channel {channel_id}: {e}")
+            return False
+
+        # Redirect profiles have no upstream connection of their own
+        if not hasattr(channel, 'streams') or channel.get_stream_profile().is_redirect():
+            return False
+
+        # Don't race a client starting the channel
+        init_flight = self.proxy_server.init_flight
+        if not init_flight.try_lead(channel_id, self.holder_id):
+            return False
+
+        started = False
+        try:
+            stream_url, stream_user_agent, transcode, profile_value = generate_stream_url(channel_id)
+            if stream_url is None:
+                logger.debug(f"No free slot to warm channel {channel_id}")
+                return False
+
+            stream_id, m3u_profile_id, _ = channel.get_stream()
+
+            # Mark it warm first so it isn't shut down for having no clients
+            self.redis_client.hset(RedisKeys.warm_channels(), channel_id, time.time())
+            started = ChannelService.initialize_channel(
+                channel_id, stream_url, stream_user_agent, transcode, profile_value, stream_id, m3u_profile_id
+            )
+
+            if started:
+                WarmPool.park(self.redis_client, channel_id)
+                logger.info(f"Warmed channel {channel_id} (stream {stream_id}, M3U profile {m3u_profile_id})")
+            else:
+                WarmPool.forget(self.redis_client, channel_id)
+                channel.release_stream()
+                logger.warning(f"Failed to warm channel {channel_id}")
+            return started
+        finally:
+            if started:
+                init_flight.finish(channel_id, self.holder_id, True)
+            else:
+                init_flight.finish(channel_id, self.holder_id, False, abandoned=True)
@@ -0,0 +1,79 @@
+"""
+Registry of live proxy workers and their load.
+
+Every worker publishes its capacity figures (owned channels, ffmpeg
+processes, host CPU, egress) into a single Redis hash on each cleanup check.
+New channels are placed on the least-loaded worker instead of whichever
+worker happened to receive the first request, and draining workers pick
+peers from it. Workers on any host sharing the Redis instance are eligible.
+"""
+
+import json
+import time
+from .config_helper import ConfigHelper
+from .redis_keys import RedisKeys
+from .utils import get_logger
+
+logger = get_logger()
+
+
+class WorkerRegistry:
+    """Publishing and querying worker load (hash of worker ID -> JSON stats)"""
+
+    @staticmethod
+    def publish(redis_client, worker_id, stats):
+        """Publish a worker's current load (works on clients and pipelines)"""
+        stats = dict(stats, updated_at=time.time())
+        redis_client.hset(RedisKeys.workers(), worker_id, json.dumps(stats))
+
+    @staticmethod
+    def remove(redis_client, worker_id):
+        """Remove a worker from the registry"""
+        redis_client.hdel(RedisKeys.workers(), worker_id)
+
+    @staticmethod
+    def live_workers(redis_client):
+        """
+        Get {worker_id: stats} for workers that published recently and aren't draining.
+        Entries of workers that stopped publishing are removed.
+        """
+        max_age = ConfigHelper.worker_registry_max_age()
+        now = time.time()
+        workers = {}
+        stale = []
+
+        for worker_id, value in redis_client.hgetall(RedisKeys.workers()).items():
+            worker_id = worker_id.decode('utf-8')
+            try:
+                stats = json.loads(value)
+            except (ValueError, TypeError):
+                stale.append(worker_id)
+                continue
+
+            if now - stats.get('updated_at', 0) > max_age:
+                stale.append(worker_id)
+            elif not stats.get('draining'):
+                workers[worker_id] = stats
+
+        if stale:
+            redis_client.hdel(RedisKeys.workers(), *stale)
+            logger.debug(f"Removed {len(stale)} stale workers from the registry")
+
+        return workers
+
+    @staticmethod
+    def load_score(stats):
+        """Weighted load of a worker - lower is less loaded"""
+        weights = ConfigHelper.placement_weights()
+        return (stats.get('channels', 0) * weights.get('channels', 1.0) +
+                stats.get('ffmpeg', 0) * weights.get('ffmpeg', 2.0) +
+                stats.get('cpu', 0) / 100.0 * weights.get('cpu', 4.0) +
+                stats.get('egress_mbps', 0) * weights.get('egress_mbps', 0.05))
+
+    @staticmethod
+    def least_loaded(workers, exclude=()):
+        """Worker ID with the lowest load score among workers ({worker_id: stats}), or None"""
+        candidates = [worker_id for worker_id in workers if worker_id not in exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda worker_id: WorkerRegistry.load_score(workers[worker_id]))